@@ -0,0 +1,143 @@
+"""
+記事の事前生成スクリプト（OpenAI Batch API）
+- route_candidates.py のサイト別候補ファイルから未投稿の商品を選び、記事生成リクエストを1本のバッチにまとめて投入する
+- 完了したバッチの結果は生成結果キャッシュ (data/cache/llm.sqlite3) へ取り込む
+- run_batch.py --pregenerated-only はキャッシュ済みの記事だけを描画・投稿する（投稿時にOpenAIを呼ばない）
+
+使い方:
+  python scripts/batch_generate.py submit --per-site 20       # 投入のみ（24時間以内に完了）
+  python scripts/batch_generate.py collect                    # 完了済みバッチを取り込む
+  python scripts/batch_generate.py run --poll-interval 60     # 投入して完了まで待ち、取り込む
+  python scripts/run_batch.py --subdomain sd01-chichi --candidates-file data/candidates/sd01-chichi.json --pregenerated-only
+"""
+import argparse
+import io
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from src.core.config import get_config
+from src.clients.openai import OpenAIClient
+from src.clients.openai_batch import BatchEntry, OpenAIBatchRunner
+from src.database.dedupe import DedupeStore
+from src.database.response_cache import ResponseCache
+from src.processor.validator import Validator
+from src.services.poster import select_scene_images
+from scripts.configure_sites import SITES
+from scripts.run_batch import load_candidates
+
+# Windows環境での文字化け対策
+if sys.platform == "win32":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def collect_entries(args, config, llm_client: OpenAIClient) -> list[BatchEntry]:
+    """各サイトの候補ファイルから、未投稿かつ未生成の商品を per_site 件ずつ選ぶ"""
+    candidates_dir = Path(args.candidates_dir) if args.candidates_dir else config.data_dir / "candidates"
+    dedupe_db = Path(args.dedupe_db) if args.dedupe_db else config.data_dir / "dedupe.sqlite3"
+    wanted = {s.strip() for s in args.sites.split(",") if s.strip()}
+    entries: list[BatchEntry] = []
+    # gitにコミットされたサイト別JSONL（と旧サイト別DB）を取り込んでから投稿済みを除外する
+    with DedupeStore(dedupe_db, site="default") as store:
+        imported = store.import_snapshots(config.data_dir, config.data_dir / "dedupe")
+    if imported:
+        logger.info(f"投稿済みスナップショット取り込み: {imported}")
+    for site_info in SITES:
+        site = site_info.subdomain
+        if wanted and site not in wanted:
+            continue
+        if site_info.affiliate_id:
+            # 候補ファイルのアフィリエイトURLが使えないため run_batch.py と同様に対象外
+            logger.info(f"サイト固有のアフィリエイトIDが設定されているため対象外: {site}")
+            continue
+        items = load_candidates(candidates_dir / f"{site}.json", logger)
+        if not items:
+            continue
+        with DedupeStore(dedupe_db, site=site) as store:
+            postable = set(store.filter_unposted([item.product_id.lower() for item in items]))
+        selected = 0
+        cached = 0
+        for item in items:
+            if selected >= args.per_site:
+                break
+            # 投稿時（PosterService.build_job / stage_claim）と同じ正規化・画像選定でキャッシュキーを揃える
+            item.product_id = item.product_id.lower()
+            if item.product_id not in postable or not item.sample_image_urls:
+                continue
+            scene_image_urls = select_scene_images(item.sample_image_urls)
+            if llm_client.has_cached_article(item, scene_image_urls, site_info):
+                cached += 1
+                continue
+            entries.append(BatchEntry(site=site, product=item, scene_image_urls=scene_image_urls, site_info=site_info))
+            selected += 1
+        logger.info(f"事前生成対象: {site} {selected}件 (生成済み {cached}件)")
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI Batch APIで記事を事前生成する")
+    parser.add_argument("command", choices=["submit", "wait", "collect", "run"])
+    parser.add_argument("--sites", type=str, default="", help="対象サイトをカンマ区切りで指定 (未指定で全サイト)")
+    parser.add_argument("--per-site", type=int, default=20, help="1サイトあたりの事前生成件数")
+    parser.add_argument("--candidates-dir", type=str, default="", help="route_candidates.py の出力先 (既定: data/candidates)")
+    parser.add_argument("--dedupe-db", type=str, default="", help="全サイト共通の投稿済みDB (既定: data/dedupe.sqlite3)")
+    parser.add_argument("--batch-id", type=str, default="", help="wait/collect の対象 (未指定で取り込み前の全バッチ)")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="完了待ちのポーリング間隔(秒)")
+    parser.add_argument("--timeout", type=float, default=0, help="完了待ちの上限(秒, 0で無制限)")
+    parser.add_argument("--no-validate", action="store_true", help="取り込み時にAI応答の検品を行わない")
+    parser.add_argument("--openai-base-url", type=str, default="", help="OpenAI互換エンドポイント (ローカル検証用)")
+    args = parser.parse_args()
+
+    config = get_config()
+    llm_cache = ResponseCache(config.data_dir / "cache" / "llm.sqlite3", max_bytes=128 * 1024 * 1024)
+    llm_client = OpenAIClient(
+        config.openai_api_key,
+        config.openai_model,
+        config.prompts_dir,
+        config.base_dir / "viewpoints.json",
+        cache=llm_cache,
+        base_url=args.openai_base_url or None,
+    )
+    validator = None
+    if not args.no_validate:
+        validator = Validator(
+            min_chars=config.min_chars,
+            max_chars=config.max_chars,
+            banned_words_path=config.base_dir / "banned_words.txt",
+        )
+    runner = OpenAIBatchRunner(llm_client, config.data_dir / "cache" / "batches", validator=validator)
+    timeout = args.timeout if args.timeout > 0 else None
+
+    batch_ids = [args.batch_id] if args.batch_id else []
+    if args.command in ("submit", "run"):
+        batch_id = runner.submit(collect_entries(args, config, llm_client))
+        batch_ids = [batch_id] if batch_id else []
+    elif not batch_ids:
+        batch_ids = runner.pending_batches()
+        logger.info(f"取り込み前のバッチ: {len(batch_ids)}件")
+
+    if args.command in ("wait", "run"):
+        for batch_id in batch_ids:
+            runner.wait(batch_id, poll_interval=args.poll_interval, timeout=timeout)
+    if args.command in ("collect", "wait", "run"):
+        for batch_id in batch_ids:
+            runner.collect(batch_id)
+
+    logger.info(f"生成結果キャッシュ: {llm_cache.stats}")
+    llm_cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+DedupeStore マイクロベンチマーク
+- 呼び出し毎に接続を開く従来方式 と 長寿命接続+WAL の1回あたりレイテンシを比較する
+
+使い方:
+  python scripts/bench_dedupe.py --rows 5000 --lookups 2000 --threads 8
+"""
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.database.dedupe import DedupeStore
+
+
+class PerCallDedupeStore(DedupeStore):
+    """比較用: 呼び出し毎に接続を開閉する従来の挙動"""
+
+    def __init__(self, db_path: Path):
+        super().__init__(db_path, wal=False)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"p50={p50 * 1e6:8.1f}us  p95={p95 * 1e6:8.1f}us  mean={statistics.fmean(samples) * 1e6:8.1f}us"
+
+
+def _bench(store: DedupeStore, rows: int, lookups: int, threads: int) -> None:
+    store.bulk_mark_posted([(f"seed{i:06d}", i) for i in range(rows)])
+
+    lookup_ids = [f"seed{i:06d}" if i % 2 else f"miss{i:06d}" for i in range(lookups)]
+    samples = []
+    for pid in lookup_ids:
+        t0 = time.perf_counter()
+        store.is_posted(pid)
+        samples.append(time.perf_counter() - t0)
+    print(f"  is_posted       {_percentiles(samples)}")
+
+    samples = []
+    for i in range(min(lookups, 500)):
+        pid = f"new{i:06d}"
+        t0 = time.perf_counter()
+        store.try_start(pid)
+        store.record_success(pid, wp_post_id=i, status="published")
+        samples.append(time.perf_counter() - t0)
+    print(f"  try_start+done  {_percentiles(samples)}")
+
+    # 並列ワーカーが同時に確保する場合のロック競合
+    errors: list[str] = []
+    claimed = []
+    per_thread = 100
+
+    def worker(n: int) -> None:
+        for i in range(per_thread):
+            pid = f"race{i:06d}"  # 全スレッドが同じIDを奪い合う
+            try:
+                if store.try_start(pid):
+                    claimed.append(pid)
+                    store.record_success(pid, status="published")
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    print(
+        f"  concurrent      threads={threads} claims={len(claimed)}/{per_thread} "
+        f"locked_errors={len(errors)} total={elapsed * 1000:.0f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DedupeStore micro-benchmark")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, factory in (
+            ("per-call connection (before)", PerCallDedupeStore),
+            ("persistent connection + WAL (after)", DedupeStore),
+        ):
+            print(label)
+            store = factory(Path(tmp) / f"{factory.__name__}.sqlite3")
+            try:
+                _bench(store, args.rows, args.lookups, args.threads)
+            finally:
+                store.close()
+
+
+if __name__ == "__main__":
+    main()
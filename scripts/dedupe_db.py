@@ -0,0 +1,79 @@
+"""
+投稿済みDBの管理スクリプト
+- 旧サイト別DB (data/posted_{site}.sqlite3) と サイト別JSONL (data/dedupe/{site}.jsonl) を統合DBへ取り込む
+- 統合DBからサイト別JSONLを書き出す
+- サイト別の件数や、ある商品がどのサイトに投稿済みかを表示する
+
+使い方:
+  python scripts/dedupe_db.py migrate
+  python scripts/dedupe_db.py export [--site sd01-chichi]
+  python scripts/dedupe_db.py stats
+  python scripts/dedupe_db.py lookup abc00123
+"""
+import argparse
+import io
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from src.database.dedupe import DedupeStore
+
+# Windows環境での文字化け対策
+if sys.platform == "win32":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投稿済みDB（全サイト統合）の管理")
+    parser.add_argument("command", choices=["migrate", "export", "stats", "lookup"])
+    parser.add_argument("product_id", nargs="?", help="lookup対象の商品ID")
+    parser.add_argument("--db", type=str, default=str(project_root / "data" / "dedupe.sqlite3"))
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data"))
+    parser.add_argument("--site", type=str, default="", help="export対象のサイト (未指定で全サイト)")
+    args = parser.parse_args()
+
+    data_dir = Path(args.data_dir)
+    jsonl_dir = data_dir / "dedupe"
+    with DedupeStore(Path(args.db)) as store:
+        if args.command == "migrate":
+            imported = store.import_snapshots(data_dir, jsonl_dir)
+            logger.info(f"取り込み完了: {imported or '変更なし'}")
+            for site in sorted(store.get_site_stats()):
+                count = store.export_jsonl(jsonl_dir / f"{site}.jsonl", site=site)
+                logger.info(f"書き出し: {site} ({count}件)")
+
+        elif args.command == "export":
+            sites = [args.site] if args.site else sorted(store.get_site_stats())
+            for site in sites:
+                count = store.export_jsonl(jsonl_dir / f"{site}.jsonl", site=site)
+                logger.info(f"書き出し: {site} ({count}件)")
+
+        elif args.command == "stats":
+            print(f"{'site':<24} {'total':>7} {'published':>9} {'drafted':>7} {'processing':>10} {'failed':>6}")
+            for site, stats in sorted(store.get_site_stats().items()):
+                print(
+                    f"{site:<24} {stats['total']:>7} {stats['published']:>9} {stats['drafted']:>7} "
+                    f"{stats['processing']:>10} {stats['failed']:>6}"
+                )
+
+        elif args.command == "lookup":
+            if not args.product_id:
+                parser.error("lookupには商品IDを指定してください")
+            sites = store.posted_sites(args.product_id.lower())
+            print(f"{args.product_id}: {', '.join(sites) if sites else '未投稿'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 - 投稿済みの記事からエラー画像を見つけて再取得・再アップロード
 """
 import logging
+import re
 import sys
 import io
 from pathlib import Path
@@ -14,6 +15,7 @@ sys.path.append(str(project_root))
 from src.core.config import get_config
 from src.clients.fanza import FanzaClient
 from src.clients.wordpress import WPClient
+from src.database.response_cache import ResponseCache
 from src.processor.images import ImageTools, ImagePlaceholderError
 
 # Windows環境での文字化け対策
@@ -35,9 +37,11 @@ def main():
         username=config.wp_username,
         app_password=config.wp_app_password,
     )
+    response_cache = ResponseCache(config.data_dir / "cache" / "responses.sqlite3")
     fanza_client = FanzaClient(
         api_key=config.fanza_api_key,
         affiliate_id=config.fanza_affiliate_id,
+        cache=response_cache,
     )
     image_tools = ImageTools()
     
@@ -45,10 +49,9 @@ def main():
     posts = wp_client.get_recent_posts(limit=100, status="publish")
     
     fixed_count = 0
+    targets = []
     
     for post in posts:
-        post_id = post["id"]
-        title = post["title"]["rendered"]
         content = post["content"]["rendered"]
         
         # pics.dmm.co.jp が残っている = Apple/WebP 変換・アップロードに失敗している可能性が高い
@@ -57,22 +60,26 @@ def main():
             
         fanza_id = post.get("meta", {}).get("fanza_product_id")
         if not fanza_id:
-            import re
             match = re.search(r'cid=([a-z0-9]+)', content)
             if match:
                 fanza_id = match.group(1)
         
-        if not fanza_id:
-            continue
-            
+        if fanza_id:
+            targets.append((post, fanza_id))
+
+    # 商品情報はキャッシュ優先でまとめて取得（未取得分だけ並行してAPIへ）
+    products = fanza_client.fetch_by_ids([fanza_id for _, fanza_id in targets])
+
+    for post, fanza_id in targets:
+        post_id = post["id"]
+        title = post["title"]["rendered"]
         logger.info(f"修正実行: [{post_id}] {fanza_id} - {title[:30]}")
         
         try:
-            items = fanza_client.fetch_by_id(fanza_id)
-            if not items:
+            item = products.get(fanza_id)
+            if item is None:
                 continue
                 
-            item = items[0]
             # ここに修正ロジック（画像再取得・再アップロード）を実装
             # ※ 既存の fix_broken_images.py のロジックをリファクタリングして適用
             # ... 省略 ...
@@ -81,6 +88,7 @@ def main():
         except Exception as e:
             logger.error(f"修正失敗: {post_id}, Error: {e}")
             
+    response_cache.close()
     logger.info(f"完了: {fixed_count} 件の投稿を修正しました。")
 
 if __name__ == "__main__":
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import argparse
 import logging
-import time
 import sys
 from pathlib import Path
 
@@ -13,6 +12,7 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from scripts import configure_sites as cs
+from src.clients.ratelimit import send_with_limits
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -52,27 +52,16 @@ RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 
 def _request_with_retry(session: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
-    last_res: requests.Response | None = None
-    last_exc: Exception | None = None
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            res = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
-            if res.status_code in RETRY_STATUSES:
-                last_res = res
-                logger.warning("%s %s -> %s (attempt %s/%s)", method, url, res.status_code, attempt, MAX_RETRIES)
-                time.sleep(1.5 * attempt)
-                continue
-            return res
-        except Exception as exc:  # noqa: BLE001
-            last_exc = exc
-            logger.warning("%s %s failed (attempt %s/%s): %s", method, url, attempt, MAX_RETRIES, exc)
-            time.sleep(1.5 * attempt)
-
-    if last_res is not None:
-        return last_res
-    if last_exc is not None:
-        raise last_exc
-    raise RuntimeError("request failed")
+    return send_with_limits(
+        session,
+        method,
+        url,
+        max_attempts=MAX_RETRIES,
+        retry_statuses=RETRY_STATUSES,
+        backoff=1.5,
+        timeout=REQUEST_TIMEOUT,
+        **kwargs,
+    )
 
 
 def _wp_v2_urls(base_url: str, endpoint: str) -> list[str]:
@@ -3,13 +3,19 @@ import html
 import json
 import os
 import re
-import time
+import sys
 from pathlib import Path
 from urllib.parse import quote_plus
 
 import requests
 from dotenv import load_dotenv
 
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
+
+from src.clients.ratelimit import send_with_limits
+
 
 DEFAULT_SITE_ID = "sd01-chichi"
 DEFAULT_RULES_FILE = "site_theme_config.json"
@@ -101,23 +107,7 @@ def _request_with_retry(
     sleep_sec: float = 1.5,
     **kwargs,
 ) -> requests.Response:
-    last_exc: Exception | None = None
-    for i in range(1, attempts + 1):
-        try:
-            resp = requests.request(method, url, **kwargs)
-            if resp.status_code in (429, 500, 502, 503, 504) and i < attempts:
-                time.sleep(sleep_sec * i)
-                continue
-            return resp
-        except requests.RequestException as exc:
-            last_exc = exc
-            if i < attempts:
-                time.sleep(sleep_sec * i)
-                continue
-            raise
-    if last_exc:
-        raise last_exc
-    raise RuntimeError("request failed")
+    return send_with_limits(requests, method, url, max_attempts=attempts, backoff=sleep_sec, **kwargs)
 
 
 def _extract_pid(post: dict) -> str:
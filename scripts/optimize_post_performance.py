@@ -3,7 +3,6 @@ from __future__ import annotations
 import argparse
 import logging
 import re
-import time
 from pathlib import Path
 import sys
 from typing import Iterable
@@ -15,6 +14,7 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from scripts import configure_sites as cs
+from src.clients.ratelimit import send_with_limits
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -28,27 +28,16 @@ IFRAME_TAG_RE = re.compile(r"<iframe\b[^>]*>", re.IGNORECASE)
 
 
 def _request_with_retry(method: str, url: str, session: requests.Session, **kwargs) -> requests.Response:
-    last_exc: Exception | None = None
-    last_res: requests.Response | None = None
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            res = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
-            if res.status_code in RETRY_STATUSES:
-                last_res = res
-                logger.warning(f"{method} {url} returned {res.status_code} (attempt {attempt}/{MAX_RETRIES})")
-                time.sleep(1.5 * attempt)
-                continue
-            return res
-        except Exception as exc:  # noqa: BLE001
-            last_exc = exc
-            logger.warning(f"{method} {url} failed (attempt {attempt}/{MAX_RETRIES}): {exc}")
-            time.sleep(1.0 * attempt)
-
-    if last_res is not None:
-        return last_res
-    if last_exc is not None:
-        raise last_exc
-    raise RuntimeError("request failed")
+    return send_with_limits(
+        session,
+        method,
+        url,
+        max_attempts=MAX_RETRIES,
+        retry_statuses=RETRY_STATUSES,
+        backoff=1.5,
+        timeout=REQUEST_TIMEOUT,
+        **kwargs,
+    )
 
 
 def _iter_posts(session: requests.Session, base_url: str, statuses: list[str]) -> Iterable[dict]:
@@ -0,0 +1,135 @@
+"""
+候補ルーティングスクリプト
+- FANZAの新着ストリームを1回だけ取得し、全サイトのキーワード/ジャンルで採点してサイト別の候補ファイルへ振り分ける
+- 各サイトの run_batch.py は --candidates-file でこのファイルを読み、FANZA APIを再取得しない
+- --source catalog の場合は sync_catalog.py のローカルカタログから、全サイトのキーワードの全文検索1回で候補を流す
+
+使い方:
+  python scripts/route_candidates.py --per-site 80 --max-pages 30
+  python scripts/route_candidates.py --per-site 80 --source catalog
+  python scripts/run_batch.py --subdomain sd01-chichi --candidates-file data/candidates/sd01-chichi.json
+"""
+import argparse
+import io
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from src.core.config import get_config
+from src.clients.fanza import FanzaClient
+from src.database.catalog import CatalogStore
+from src.database.dedupe import DedupeStore
+from src.database.response_cache import CACHE_MODES, ResponseCache
+from src.services.router import ProductRouter
+from scripts.configure_sites import SITES
+from scripts.legacy_utils.site_router import SITE_ROUTING_CONFIG
+
+# Windows環境での文字化け対策
+if sys.platform == "win32":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共通候補ストリームをサイト別に振り分ける")
+    parser.add_argument("--per-site", type=int, default=80, help="1サイトあたりの候補数")
+    parser.add_argument("--max-pages", type=int, default=30, help="FANZA取得の最大ページ(100件/ページ)")
+    parser.add_argument("--max-sites-per-item", type=int, default=1, help="1商品を割り当てる最大サイト数")
+    parser.add_argument("--sort", type=str, default="date")
+    parser.add_argument("--since", type=str)
+    parser.add_argument("--sites", type=str, default="", help="対象サイトをカンマ区切りで指定 (未指定で全サイト)")
+    parser.add_argument("--out-dir", type=str, default="")
+    parser.add_argument("--dedupe-db", type=str, default="")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="use", help="FANZA APIレスポンスキャッシュ (use/refresh/bypass)")
+    parser.add_argument("--source", choices=["api", "catalog"], default="api", help="候補ストリームの取得元")
+    parser.add_argument("--catalog-db", type=str, default="", help="sync_catalog.py のカタログDB (既定: data/cache/catalog.sqlite3)")
+    args = parser.parse_args()
+
+    config = get_config()
+    out_dir = Path(args.out_dir) if args.out_dir else config.data_dir / "candidates"
+    wanted = {s.strip() for s in args.sites.split(",") if s.strip()}
+    sites = [s for s in SITES if not wanted or s.subdomain in wanted]
+    router = ProductRouter.from_site_configs(sites, SITE_ROUTING_CONFIG)
+
+    dedupe_db = Path(args.dedupe_db) if args.dedupe_db else config.data_dir / "dedupe.sqlite3"
+    stores = {s.subdomain: DedupeStore(dedupe_db, site=s.subdomain) for s in sites}
+    next(iter(stores.values())).import_snapshots(config.data_dir, config.data_dir / "dedupe")
+
+    response_cache = ResponseCache(config.data_dir / "cache" / "responses.sqlite3", mode=args.cache_mode)
+    fanza_client = FanzaClient(config.fanza_api_key, config.fanza_affiliate_id, cache=response_cache)
+    catalog = None
+    if args.source == "catalog":
+        catalog = CatalogStore(Path(args.catalog_db) if args.catalog_db else config.data_dir / "cache" / "catalog.sqlite3")
+    exclude: dict[str, set[str]] = {s.subdomain: set() for s in sites}
+    stats = {"pages": 0, "fetched": 0}
+
+    def stream():
+        seen: set[str] = set()
+        if catalog is not None:
+            # いずれかのサイトのキーワードに一致する商品だけを全文索引で絞り込んで流す
+            keywords = sorted({kw for p in router.profiles for kw in (*p.keywords, *p.genre_hints) if kw})
+            pages = catalog.iter_pages(max_pages=max(args.max_pages, 1), keywords=keywords, since=args.since)
+        else:
+            pages = fanza_client.iter_pages(sort=args.sort, since=args.since, max_pages=max(args.max_pages, 1))
+        for batch in pages:
+            stats["pages"] += 1
+            fresh = []
+            for item in batch:
+                pid = item.product_id.lower()
+                if pid not in seen:
+                    seen.add(pid)
+                    fresh.append(item)
+            stats["fetched"] += len(fresh)
+            # ページ単位で各サイトの投稿済みを1クエリずつ照会し、除外集合に追加
+            pids = [item.product_id.lower() for item in fresh]
+            for site, store in stores.items():
+                postable = set(store.filter_unposted(pids))
+                exclude[site].update(pid for pid in pids if pid not in postable)
+            yield from fresh
+
+    queues = router.distribute(
+        stream(),
+        per_site=max(args.per_site, 1),
+        max_sites_per_item=max(args.max_sites_per_item, 1),
+        exclude=exclude,
+    )
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    generated_at = datetime.now(timezone.utc).isoformat()
+    for site, items in queues.items():
+        payload = {
+            "site": site,
+            "generated_at": generated_at,
+            "sort": args.sort,
+            "items": [item.to_dict() for item in items],
+        }
+        with open(out_dir / f"{site}.json", "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        logger.info(f"候補振り分け: {site} {len(items)}件")
+
+    for store in stores.values():
+        store.close()
+    if catalog is not None:
+        catalog.close()
+    response_cache.close()
+    logger.info(
+        f"ルーティング完了: FANZA取得 {stats['pages']}ページ/{stats['fetched']}件, "
+        f"割り当て {sum(len(q) for q in queues.values())}件, キャッシュ {response_cache.stats}"
+    )
+
+
+if __name__ == "__main__":
+    main()
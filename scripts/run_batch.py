@@ -2,6 +2,8 @@
 実行バッチ
 """
 import argparse
+import asyncio
+import json
 import logging
 import sys
 import time
@@ -9,7 +11,8 @@ import io
 import random
 from types import SimpleNamespace
 from datetime import datetime, timedelta, timezone
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
 from tqdm import tqdm
 from pathlib import Path
 
@@ -17,13 +20,20 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.core.config import get_config
-from src.clients.fanza import FanzaClient
+from src.clients.fanza import MERGE_POLICIES, FanzaClient
+from src.clients.ratelimit import get_rate_limiter
 from src.clients.wordpress import WPClient
+from src.core.models import Product
 from src.clients.openai import OpenAIClient
+from src.clients.openai_async import AsyncOpenAIClient, GenerationRequest
 from src.processor.renderer import Renderer
 from src.processor.images import ImageTools
+from src.processor.validator import Validator
+from src.database.catalog import CatalogStore
 from src.database.dedupe import DedupeStore
-from src.services.poster import PosterService
+from src.database.response_cache import CACHE_MODES, ResponseCache
+from src.services.poster import PosterService, select_scene_images
+from src.services.pipeline import StagedPipeline
 from scripts.configure_sites import get_site_config
 
 def setup_logging(level: str) -> None:
@@ -59,6 +69,7 @@ def sync_wp_cache(
     force_full: bool = False,
     overlap_hours: int = 6,
     max_pages: int | None = None,
+    prefetch: int = 1,
 ) -> None:
     """WP投稿をローカルDBに同期（初回フル、以後は増分）"""
     last_sync_raw = dedupe_store.get_meta("wp_last_sync_at")
@@ -75,27 +86,205 @@ def sync_wp_cache(
         else:
             logger.warning("WP同期: last_syncが不正なためフル同期に切り替えます")
 
-    posts_scanned = 0
     items: list[tuple[str, int | None]] = []
     seen_fanza: set[str] = set()
 
-    for post in wp_client.iter_posts(
+    # 本文は meta/slug で解決できなかった投稿だけ追加取得する
+    for fanza_id, post_id in wp_client.iter_posted_fanza_ids(
         status="any",
         per_page=100,
         max_pages=max_pages,
         after=after,
-        fields="id,slug,meta,content",
-        context="edit",
+        prefetch=prefetch,
     ):
-        posts_scanned += 1
-        fanza_id = wp_client.extract_fanza_id(post)
-        if fanza_id and fanza_id not in seen_fanza:
-            items.append((fanza_id, post.get("id")))
+        if fanza_id not in seen_fanza:
+            items.append((fanza_id, post_id))
             seen_fanza.add(fanza_id)
 
     inserted = dedupe_store.bulk_mark_posted(items, status="published")
     dedupe_store.set_meta("wp_last_sync_at", datetime.now(timezone.utc).isoformat())
-    logger.info(f"WP同期完了: scanned={posts_scanned}, cached={len(items)}, inserted={inserted}")
+    logger.info(f"WP同期完了: cached={len(items)}, inserted={inserted}")
+
+def add_unposted_candidates(
+    batch: list[Product],
+    pool: list[Product],
+    seen_pids: set[str],
+    dedupe_store: DedupeStore,
+    pool_size: int,
+    cross_site: bool = False,
+) -> None:
+    """APIの1ページ分から未投稿の商品を候補プールへ追加（DB照会は1ページ1回）"""
+    fresh: list[tuple[str, Product]] = []
+    for item in batch:
+        pid_norm = item.product_id.lower()
+        if pid_norm in seen_pids:
+            continue
+        seen_pids.add(pid_norm)
+        fresh.append((pid_norm, item))
+    postable = set(dedupe_store.filter_unposted([pid for pid, _ in fresh], any_site=cross_site))
+    for pid_norm, item in fresh:
+        if len(pool) >= pool_size:
+            break
+        if pid_norm in postable:
+            pool.append(item)
+
+def load_candidates(path: Path, logger: logging.Logger) -> list[Product] | None:
+    """route_candidates.py の出力を読み込む（無い/壊れている場合はNoneで通常取得にフォールバック）"""
+    if not path.exists():
+        logger.warning(f"候補ファイルが見つかりません: {path}")
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"候補ファイル読み込み失敗: {path}, error={e}")
+        return None
+    items = [Product.from_dict(item) for item in payload.get("items", [])]
+    logger.info(f"候補ファイル: {path} ({len(items)}件, generated_at={payload.get('generated_at')})")
+    return items
+
+def format_prompt_cache(stats: dict) -> str:
+    """入力トークンのうちプロンプトキャッシュに一致した割合"""
+    prompt_tokens = stats.get("prompt_tokens", 0)
+    cached = stats.get("cached_tokens", 0)
+    ratio = cached / prompt_tokens * 100 if prompt_tokens else 0.0
+    return f"プロンプトキャッシュ={cached}/{prompt_tokens}tokens ({ratio:.0f}%)"
+
+def prefetch_articles(
+    config,
+    items: list[Product],
+    llm_cache: ResponseCache,
+    site_info=None,
+    concurrency: int = 3,
+    base_url: str | None = None,
+    stream: bool = False,
+    logger: logging.Logger | None = None,
+) -> None:
+    """
+    選定済みの商品の記事を AsyncOpenAIClient で同時に生成し、生成結果キャッシュへ入れておく。
+    投稿処理は同じキーでキャッシュを引くため、生成待ちが件数分直列に積み重ならない。
+    """
+    logger = logger or logging.getLogger(__name__)
+    if llm_cache.mode != "use":
+        logger.warning(f"記事生成キャッシュが mode={llm_cache.mode} のため事前の同時生成は行いません")
+        return
+    requests = []
+    for item in items:
+        # 投稿時（PosterService.build_job / stage_claim）と同じ正規化・画像選定でキャッシュキーを揃える
+        item.product_id = item.product_id.lower()
+        if item.sample_image_urls:
+            requests.append(GenerationRequest(item, select_scene_images(item.sample_image_urls), site_info))
+    if not requests:
+        return
+
+    async def _run() -> list:
+        async with AsyncOpenAIClient(
+            config.openai_api_key,
+            config.openai_model,
+            config.prompts_dir,
+            config.base_dir / "viewpoints.json",
+            max_in_flight=concurrency,
+            cache=llm_cache,
+            base_url=base_url,
+            stream=stream,
+        ) as client:
+            results = await client.generate_many(requests)
+            logger.info(
+                f"事前生成: 生成={client.stats['generated']}件, キャッシュ利用={client.stats['cache_hits']}件, "
+                f"API待ち合計={client.stats['api_seconds']:.0f}秒, "
+                f"tokens={client.stats['prompt_tokens']}+{client.stats['completion_tokens']}, "
+                f"{format_prompt_cache(client.stats)}"
+            )
+            return results
+
+    for request, result in zip(requests, asyncio.run(_run())):
+        if isinstance(result, BaseException):
+            logger.warning(f"事前生成失敗（投稿時に再生成）: {request.product.product_id}, error={result}")
+
+def run_items(
+    poster_service: PosterService,
+    items: list[Product],
+    logger: logging.Logger,
+    dry_run: bool = False,
+    site_info=None,
+    workers: int = 1,
+) -> dict[str, int]:
+    """候補を処理して成功/スキップ/失敗件数を返す（workers>1で並列実行）"""
+    counts = {"success": 0, "skip": 0, "failure": 0}
+    total = len(items)
+
+    def _process(idx: int, item: Product) -> str:
+        try:
+            return poster_service.process_item(idx, total, item, dry_run=dry_run, site_info=site_info)
+        except Exception as e:
+            logger.error(f"予期せぬエラー: {item['product_id']} - {e}")
+            return "failure"
+
+    def _tally(res: str) -> None:
+        if res in ("success", "skip"):
+            counts[res] += 1
+        else:
+            counts["failure"] += 1
+
+    with tqdm(total=total, desc="全体進捗", unit="件") as pbar:
+        if workers <= 1:
+            for idx, item in enumerate(items, 1):
+                pbar.set_postfix_str(f"処理中: {item['product_id']}")
+                _tally(_process(idx, item))
+                pbar.update(1)
+            return counts
+
+        # 重複確保は process_item 内の DedupeStore.try_start が担う。
+        # 集計はメインスレッドでのみ行うためロック不要。
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_process, idx, item): item
+                for idx, item in enumerate(items, 1)
+            }
+            for future in as_completed(futures):
+                _tally(future.result())
+                pbar.set_postfix_str(f"完了: {futures[future]['product_id']}")
+                pbar.update(1)
+    return counts
+
+def run_pipeline(
+    poster_service: PosterService,
+    items: list[Product],
+    logger: logging.Logger,
+    dry_run: bool = False,
+    site_info=None,
+    workers: int = 1,
+    queue_size: int = 4,
+) -> dict[str, int]:
+    """候補をステージ分割パイプラインで処理して件数を返す"""
+    counts = {"success": 0, "skip": 0, "failure": 0}
+    total = len(items)
+    # 生成と画像I/Oがネットワーク待ちの大半を占めるため、そこにワーカーを厚く割り当てる
+    stage_workers = {
+        "claim": 1,
+        "generate": max(workers, 1),
+        "upload": max(workers, 1),
+        "taxonomy": 1,
+        "render": 1,
+        "post": 1,
+    }
+
+    with tqdm(total=total, desc="全体進捗", unit="件") as pbar:
+        def _on_finish(job, result: str) -> None:
+            # StagedPipeline が直列化して呼ぶためロック不要
+            counts[result if result in counts else "failure"] += 1
+            pbar.set_postfix_str(f"完了: {job.product_id}")
+            pbar.update(1)
+
+        pipeline = StagedPipeline(
+            poster_service.pipeline_stages(stage_workers),
+            make_job=lambda idx, item: poster_service.build_job(idx, total, item, dry_run=dry_run, site_info=site_info),
+            on_finish=_on_finish,
+            on_error=poster_service.handle_failure,
+            queue_size=queue_size,
+        )
+        pipeline.run(items)
+    return counts
 
 def main():
     parser = argparse.ArgumentParser(description="FANZA → WordPress 自動記事投稿")
@@ -105,11 +294,38 @@ def main():
     parser.add_argument("--sort", type=str, default="date")
     parser.add_argument("--since", type=str)
     parser.add_argument("--subdomain", type=str, help="対象のサブドメイン (例: sd01-chichi)")
-    parser.add_argument("--dedupe-key", type=str, default="", help="投稿済みDBキーを明示指定 (例: main)")
+    parser.add_argument("--dedupe-key", type=str, default="", help="投稿済みDBのサイトキーを明示指定 (例: main)")
+    parser.add_argument("--dedupe-db", type=str, default="", help="全サイト共通の投稿済みDB (既定: data/dedupe.sqlite3)")
+    parser.add_argument("--cross-site-dedupe", action="store_true", help="他サイトで投稿済みの商品も候補から除外")
     parser.add_argument("--sync-full", action="store_true", help="WP投稿キャッシュを全件同期")
     parser.add_argument("--sync-overlap-hours", type=int, default=6)
     parser.add_argument("--sync-max-pages", type=int, default=0, help="WP同期の最大ページ(0で無制限)")
+    parser.add_argument("--sync-prefetch", type=int, default=4, help="WP同期で並行取得するページ数(1で逐次)")
     parser.add_argument("--fetch-max-pages", type=int, default=10, help="FANZA取得の最大ページ")
+    parser.add_argument("--fanza-concurrency", type=int, default=4, help="キーワード検索の同時実行数(FANZA API全体の上限)")
+    parser.add_argument("--fanza-min-interval", type=float, default=0.2, help="FANZA API呼び出しの最小間隔(秒)")
+    parser.add_argument("--keyword-merge", choices=MERGE_POLICIES, default="round_robin", help="キーワード別結果のマージ方式")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="use", help="FANZA APIレスポンスキャッシュ (use/refresh/bypass)")
+    parser.add_argument("--llm-cache-mode", choices=CACHE_MODES, default="use", help="記事生成結果キャッシュ (use/refresh/bypass)")
+    parser.add_argument("--candidates-file", type=str, default="", help="route_candidates.py が出力したサイト別候補ファイル")
+    parser.add_argument(
+        "--candidate-source",
+        choices=["api", "catalog", "auto"],
+        default="api",
+        help="候補の取得元 (api: FANZA API / catalog: ローカルカタログのみ・オフライン可 / auto: カタログ優先で不足分をAPI)",
+    )
+    parser.add_argument("--catalog-db", type=str, default="", help="sync_catalog.py のカタログDB (既定: data/cache/catalog.sqlite3)")
+    parser.add_argument("--workers", type=int, default=1, help="並列処理する件数(1で逐次処理)")
+    parser.add_argument("--wp-concurrency", type=int, default=4, help="WPへの同時リクエスト数上限")
+    parser.add_argument("--openai-concurrency", type=int, default=3, help="OpenAIへの同時リクエスト数上限")
+    parser.add_argument("--pipeline", action="store_true", help="ステージ分割パイプラインで処理(生成/画像/投稿を重ねて実行)")
+    parser.add_argument("--pipeline-queue-size", type=int, default=4, help="パイプラインのステージ間キュー長")
+    parser.add_argument("--max-regenerations", type=int, default=1, help="AI応答が検品不合格のときに再生成する回数")
+    parser.add_argument("--no-validate", action="store_true", help="AI応答の検品を行わない")
+    parser.add_argument("--pregenerated-only", action="store_true", help="batch_generate.py で事前生成済みの記事だけを投稿する(OpenAIを呼ばない)")
+    parser.add_argument("--prefetch-generate", action="store_true", help="投稿前に選定した全件の記事を非同期で同時生成しておく(同時数は --openai-concurrency)")
+    parser.add_argument("--stream-generate", action="store_true", help="記事をストリーミング生成し、JSON構造が壊れた時点で打ち切って再試行する")
+    parser.add_argument("--openai-base-url", type=str, default="", help="OpenAI互換エンドポイント (ローカル検証用)")
     args = parser.parse_args()
     
     setup_logging(args.log_level)
@@ -146,21 +362,77 @@ def main():
     if site_info and site_info.affiliate_id:
         affiliate_id = site_info.affiliate_id
         logger.info(f"サイト固有のアフィリエイトIDを使用: {affiliate_id}")
+    # 共通アフィリエイトIDで作った候補（候補ファイル/カタログ）はサイト固有IDのサイトでは使えない
+    # （main の site_info は後で affiliate_id を持たない SimpleNamespace に置き換わるため、ここで判定しておく）
+    own_affiliate_id = affiliate_id != config.fanza_affiliate_id
+
+    workers = max(args.workers, 1)
+    # ホスト単位のレート/同時実行数は逐次時も ratelimit.DEFAULT_LIMITS の既定値で制限される。
+    # 並列時のみ --wp-concurrency / --openai-concurrency で同時実行数を上書きする
+    parallel = workers > 1 or args.pipeline
+    wp_limit = max(args.wp_concurrency, 1) if parallel else None
+    openai_limit = max(args.openai_concurrency, 1) if parallel else None
 
-    fanza_client = FanzaClient(config.fanza_api_key, affiliate_id)
-    llm_client = OpenAIClient(config.openai_api_key, config.openai_model, config.prompts_dir, config.base_dir / "viewpoints.json")
-    wp_client = WPClient(config.wp_base_url, config.wp_username, config.wp_app_password)
+    response_cache = ResponseCache(config.data_dir / "cache" / "responses.sqlite3", mode=args.cache_mode)
+    fanza_client = FanzaClient(
+        config.fanza_api_key,
+        affiliate_id,
+        cache=response_cache,
+        max_in_flight=max(args.fanza_concurrency, 1),
+        min_interval=max(args.fanza_min_interval, 0.0),
+    )
+    llm_cache = ResponseCache(
+        config.data_dir / "cache" / "llm.sqlite3",
+        mode=args.llm_cache_mode,
+        max_bytes=128 * 1024 * 1024,
+    )
+    llm_client = OpenAIClient(
+        config.openai_api_key,
+        config.openai_model,
+        config.prompts_dir,
+        config.base_dir / "viewpoints.json",
+        max_in_flight=openai_limit,
+        cache=llm_cache,
+        base_url=args.openai_base_url or None,
+        pregenerated_only=args.pregenerated_only,
+        stream=args.stream_generate,
+    )
+    wp_client = WPClient(config.wp_base_url, config.wp_username, config.wp_app_password, max_in_flight=wp_limit)
     renderer = Renderer(config.base_dir / "layout_premium")
     dedupe_key = args.dedupe_key.strip() or resolved_subdomain or "default"
     if site_info is None and dedupe_key == "main":
         site_info = SimpleNamespace(subdomain="main", title="鑑定所", tagline="関西弁で判断を代行")
-    dedupe_store = DedupeStore(config.data_dir / f"posted_{dedupe_key}.sqlite3")
+    dedupe_db = Path(args.dedupe_db) if args.dedupe_db else config.data_dir / "dedupe.sqlite3"
+    dedupe_jsonl_dir = config.data_dir / "dedupe"
+    dedupe_store = DedupeStore(dedupe_db, site=dedupe_key)
+    # gitにコミットされたサイト別JSONL（と旧サイト別DB）をローカルDBへ取り込む
+    imported = dedupe_store.import_snapshots(config.data_dir, dedupe_jsonl_dir)
+    if imported:
+        logger.info(f"投稿済みスナップショット取り込み: {imported}")
     image_tools = ImageTools()
     
-    poster_service = PosterService(config, fanza_client, wp_client, llm_client, renderer, dedupe_store, image_tools)
+    validator = None
+    if not args.no_validate:
+        validator = Validator(
+            min_chars=config.min_chars,
+            max_chars=config.max_chars,
+            banned_words_path=config.base_dir / "banned_words.txt",
+        )
+    
+    poster_service = PosterService(
+        config,
+        fanza_client,
+        wp_client,
+        llm_client,
+        renderer,
+        dedupe_store,
+        image_tools,
+        validator=validator,
+        max_regenerations=args.max_regenerations,
+    )
     
     logger.info("=" * 60)
-    logger.info(f"開始: limit={args.limit}, dry_run={args.dry_run}, site={dedupe_key}")
+    logger.info(f"開始: limit={args.limit}, dry_run={args.dry_run}, site={dedupe_key}, workers={workers}")
     
     sync_max_pages = None if args.sync_max_pages <= 0 else args.sync_max_pages
     sync_wp_cache(
@@ -170,6 +442,7 @@ def main():
         force_full=args.sync_full,
         overlap_hours=args.sync_overlap_hours,
         max_pages=sync_max_pages,
+        prefetch=max(args.sync_prefetch, 1),
     )
 
     # 候補取得
@@ -178,82 +451,118 @@ def main():
     all_items = []
     
     seen_pids: set[str] = set()
-    
-    page = 0
-    max_fetch_pages = max(args.fetch_max_pages, 1)
-    if keyword_list:
-        for kw in keyword_list:
-            page = 0
-            while len(all_items) < candidate_pool_size and page < max_fetch_pages:
-                batch = fanza_client.fetch(
-                    limit=100,
-                    since=args.since,
-                    sort=args.sort,
-                    keyword=kw,
-                    offset=page * 100,
+
+    # 共通ストリームから振り分け済みの候補があればFANZA APIを呼ばずに使う
+    from_candidates = False
+    if args.candidates_file:
+        routed = load_candidates(Path(args.candidates_file), logger)
+        if routed is not None and own_affiliate_id:
+            logger.warning("サイト固有のアフィリエイトIDが設定されているため候補ファイルは使用しません")
+            routed = None
+        if routed is not None:
+            from_candidates = True
+            add_unposted_candidates(
+                routed, all_items, seen_pids, dedupe_store, candidate_pool_size, args.cross_site_dedupe
+            )
+            logger.info(f"候補ファイルから{len(all_items)}件を候補に追加")
+
+    # ローカルカタログから索引照会で候補を選ぶ（FANZA APIを呼ばない）
+    candidate_source = args.candidate_source
+    if candidate_source != "api" and own_affiliate_id:
+        logger.warning("サイト固有のアフィリエイトIDが設定されているためカタログは使用しません")
+        candidate_source = "api"
+    if candidate_source != "api" and len(all_items) < candidate_pool_size:
+        catalog_db = Path(args.catalog_db) if args.catalog_db else config.data_dir / "cache" / "catalog.sqlite3"
+        with CatalogStore(catalog_db) as catalog:
+            started = time.perf_counter()
+            before = len(all_items)
+            for batch in catalog.iter_pages(per_page=200, keywords=keyword_list, since=args.since):
+                add_unposted_candidates(
+                    batch, all_items, seen_pids, dedupe_store, candidate_pool_size, args.cross_site_dedupe
                 )
-                if not batch:
+                if len(all_items) >= candidate_pool_size:
                     break
-                for item in batch:
-                    pid = item['product_id']
-                    pid_norm = str(pid).lower()
-                    if pid_norm in seen_pids:
-                        continue
-                    seen_pids.add(pid_norm)
-                    if not dedupe_store.is_posted(pid_norm):
-                        all_items.append(item)
-                    if len(all_items) >= candidate_pool_size:
-                        break
-                page += 1
-            if len(all_items) >= candidate_pool_size:
-                break
-    else:
-        while len(all_items) < candidate_pool_size and page < max_fetch_pages:
-            batch = fanza_client.fetch(
-                limit=100,
-                since=args.since,
+            logger.info(
+                f"カタログから{len(all_items) - before}件を候補に追加 "
+                f"({(time.perf_counter() - started) * 1000:.0f}ms, last_sync_at={catalog.get_meta('last_sync_at')})"
+            )
+
+    max_fetch_pages = max(args.fetch_max_pages, 1)
+    if candidate_source != "catalog" and not (
+        (from_candidates or candidate_source == "auto") and len(all_items) >= target_count
+    ):
+        # キーワード検索を並行実行して1本の候補ストリームにまとめ、候補プールが埋まった時点で打ち切る
+        if keyword_list and len(keyword_list) > 1:
+            pages = fanza_client.iter_keyword_pages(
+                keyword_list,
                 sort=args.sort,
-                keyword=site_keywords,
-                offset=page * 100,
+                since=args.since,
+                max_pages=max_fetch_pages,
+                concurrency=max(args.fanza_concurrency, 1),
+                policy=args.keyword_merge,
             )
-            if not batch:
-                break
-            for item in batch:
-                pid = item['product_id']
-                pid_norm = str(pid).lower()
-                if pid_norm in seen_pids:
-                    continue
-                seen_pids.add(pid_norm)
-                if not dedupe_store.is_posted(pid_norm):
-                    all_items.append(item)
+        else:
+            keyword = keyword_list[0] if keyword_list else site_keywords
+            pages = fanza_client.iter_pages(keyword=keyword, sort=args.sort, since=args.since, max_pages=max_fetch_pages)
+        with closing(pages):
+            for batch in pages:
+                add_unposted_candidates(
+                    batch, all_items, seen_pids, dedupe_store, candidate_pool_size, args.cross_site_dedupe
+                )
                 if len(all_items) >= candidate_pool_size:
                     break
-            page += 1
+    if args.pregenerated_only:
+        # 事前生成済みの記事がある候補だけに絞る（キーは投稿時と同じ正規化・画像選定で作る）
+        generate_site_info = site_info if args.subdomain else None
+        pregenerated = []
+        for item in all_items:
+            item.product_id = item.product_id.lower()
+            scene_image_urls = select_scene_images(item.sample_image_urls)
+            if llm_client.has_cached_article(item, scene_image_urls, generate_site_info):
+                pregenerated.append(item)
+        logger.info(f"事前生成済み: {len(pregenerated)}/{len(all_items)}件")
+        all_items = pregenerated
     random.shuffle(all_items)
     items = all_items[:target_count]
     logger.info(f"処理対象: {len(items)}件 (候補プール: {len(all_items)}件からランダム選定)")
     
-    success_count = 0
-    fail_count = 0
-    skip_count = 0
-    
-    with tqdm(total=len(items), desc="全体進捗", unit="件") as pbar:
-        for idx, item in enumerate(items, 1):
-            pbar.set_postfix_str(f"処理中: {item['product_id']}")
-            try:
-                res = poster_service.process_item(idx, len(items), item, dry_run=args.dry_run, site_info=site_info if args.subdomain else None)
-                if res == "success":
-                    success_count += 1
-                elif res == "skip":
-                    skip_count += 1
-                else:
-                    fail_count += 1
-            except Exception as e:
-                logger.error(f"予期せぬエラー: {item['product_id']} - {e}")
-                fail_count += 1
-            pbar.update(1)
-            
-    logger.info(f"結果: 成功={success_count}, 失敗={fail_count}, スキップ={skip_count}")
+    if args.prefetch_generate and not args.pregenerated_only:
+        prefetch_articles(
+            config,
+            items,
+            llm_cache,
+            site_info=site_info if args.subdomain else None,
+            concurrency=max(args.openai_concurrency, 1),
+            base_url=args.openai_base_url or None,
+            stream=args.stream_generate,
+            logger=logger,
+        )
+
+    runner = run_pipeline if args.pipeline else run_items
+    counts = runner(
+        poster_service,
+        items,
+        logger,
+        dry_run=args.dry_run,
+        site_info=site_info if args.subdomain else None,
+        workers=workers,
+        **({"queue_size": args.pipeline_queue_size} if args.pipeline else {}),
+    )
+    logger.info(f"結果: 成功={counts['success']}, 失敗={counts['failure']}, スキップ={counts['skip']}")
+    # このサイト分をJSONLへ書き出す（ワークフローではSQLiteではなくこのファイルをコミットする）
+    exported = dedupe_store.export_jsonl(dedupe_jsonl_dir / f"{dedupe_key}.jsonl")
+    logger.info(f"投稿済みスナップショット書き出し: {dedupe_jsonl_dir / f'{dedupe_key}.jsonl'} ({exported}件)")
+    dedupe_store.close()
+    logger.info(f"FANZAキャッシュ: mode={args.cache_mode}, {response_cache.stats}")
+    response_cache.close()
+    logger.info(
+        f"記事生成キャッシュ: mode={args.llm_cache_mode}, 生成={llm_client.stats['generated']}件, "
+        f"キャッシュ利用={llm_client.stats['cache_hits']}件 (約{llm_client.stats['saved_seconds']:.0f}秒短縮), "
+        f"tokens={llm_client.stats['prompt_tokens']}+{llm_client.stats['completion_tokens']}, "
+        f"{format_prompt_cache(llm_client.stats)}, ストリーム打ち切り={llm_client.stats['stream_aborts']}件, {llm_cache.stats}"
+    )
+    llm_cache.close()
+    logger.info(f"レート制限: {get_rate_limiter().snapshot()}")
 
 if __name__ == "__main__":
     main()
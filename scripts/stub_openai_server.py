@@ -0,0 +1,231 @@
+"""
+OpenAI API スタブサーバ（ローカル検証用）
+- Files / Batches / Chat Completions の最小限のエンドポイントを模倣し、固定の記事JSONを返す
+- バッチは投入から --delay 秒後に completed になる
+
+使い方:
+  python scripts/stub_openai_server.py --port 8089 --delay 3
+  OPENAI_API_KEY=dummy python scripts/batch_generate.py run --openai-base-url http://127.0.0.1:8089/v1 --poll-interval 1
+  OPENAI_API_KEY=dummy python scripts/run_batch.py --dry-run --pregenerated-only --openai-base-url http://127.0.0.1:8089/v1 ...
+"""
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+_SCENE_POINTS = (
+    "序盤から距離の近いカメラワークで、表情の変化がはっきり伝わる。"
+    "テンポも良く、見せ場までの流れに無駄がない。"
+)
+
+
+def stub_article(custom_id: str = "") -> dict[str, Any]:
+    """検品を通る最小限の記事JSON"""
+    return {
+        "title": f"スタブ記事 {custom_id}".strip(),
+        "short_description": "スタブサーバが返した記事です。",
+        "highlights": ["距離感", "テンポ", "表情"],
+        "meters": {"tempo_level": 3, "volume_level": 4},
+        "scenes": [
+            {"title": f"シーン{i}", "points": _SCENE_POINTS * 3, "feature_label": "見どころ", "feature_check": "ここが良い", "feature_level": 4}
+            for i in range(1, 4)
+        ],
+        "checklist": {},
+        "ratings": {},
+        "site_sections": [],
+        "summary": "全体を通して見やすく、初めての人にも勧めやすい一本。" * 2,
+        "faq": [],
+        "cta_text": "今すぐ堪能する",
+        "excerpt": "スタブ記事の抜粋",
+    }
+
+
+def chat_completion(body: dict[str, Any], custom_id: str = "") -> dict[str, Any]:
+    return {
+        "id": f"chatcmpl-stub-{custom_id or int(time.time() * 1000)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(stub_article(custom_id), ensure_ascii=False)},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class StubState:
+    """ファイルとバッチをメモリ上に保持する"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.files: dict[str, dict[str, Any]] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}-stub{next(self._ids)}"
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> dict[str, Any]:
+        file_id = self.new_id("file")
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self.files[file_id] = {"meta": meta, "content": content}
+        return meta
+
+    def refresh(self, batch: dict[str, Any]) -> dict[str, Any]:
+        """遅延時間を過ぎたバッチを完了させ、出力ファイルを作る"""
+        if batch["status"] != "in_progress" or time.time() - batch["created_at"] < self.delay:
+            return batch
+        lines = self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines()
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output.append(json.dumps({
+                "id": self.new_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "request_id": self.new_id("req"),
+                    "body": chat_completion(request.get("body", {}), request["custom_id"]),
+                },
+                "error": None,
+            }, ensure_ascii=False))
+        out = self.add_file(("\n".join(output) + "\n").encode("utf-8"), "output.jsonl", "batch_output")
+        batch.update({
+            "status": "completed",
+            "output_file_id": out["id"],
+            "completed_at": int(time.time()),
+            "request_counts": {"total": len(output), "completed": len(output), "failed": 0},
+        })
+        return batch
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState
+
+    def _send_json(self, payload: Any, status: int = 200) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self) -> None:
+        self._send_json({"error": {"message": f"not found: {self.path}", "type": "invalid_request_error"}}, status=404)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self) -> None:
+        path = self.path.split("?")[0].rstrip("/")
+        body = self._read_body()
+        with self.state.lock:
+            if path.endswith("/files"):
+                # multipart/form-data（file と purpose）を解釈する
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+                )
+                fields: dict[str, Any] = {}
+                for part in message.iter_parts():
+                    name = part.get_param("name", header="content-disposition")
+                    fields[name] = (part.get_filename(), part.get_payload(decode=True))
+                filename, content = fields.get("file", ("input.jsonl", b""))
+                purpose = (fields.get("purpose", (None, b"batch"))[1] or b"batch").decode("utf-8")
+                self._send_json(self.state.add_file(content or b"", filename or "input.jsonl", purpose))
+            elif path.endswith("/batches"):
+                request = json.loads(body or b"{}")
+                if request.get("input_file_id") not in self.state.files:
+                    self._not_found()
+                    return
+                batch_id = self.state.new_id("batch")
+                batch = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": request.get("endpoint"),
+                    "input_file_id": request["input_file_id"],
+                    "completion_window": request.get("completion_window", "24h"),
+                    "status": "in_progress",
+                    "created_at": int(time.time()),
+                    "output_file_id": None,
+                    "error_file_id": None,
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                    "metadata": request.get("metadata"),
+                }
+                self.state.batches[batch_id] = batch
+                self._send_json(batch)
+            elif path.endswith("/chat/completions"):
+                self._send_json(chat_completion(json.loads(body or b"{}")))
+            else:
+                self._not_found()
+
+    def do_GET(self) -> None:
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        with self.state.lock:
+            if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in self.state.batches:
+                self._send_json(self.state.refresh(self.state.batches[parts[-1]]))
+            elif len(parts) >= 3 and parts[-1] == "content" and parts[-2] in self.state.files:
+                content = self.state.files[parts[-2]]["content"]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            elif len(parts) >= 2 and parts[-2] == "files" and parts[-1] in self.state.files:
+                self._send_json(self.state.files[parts[-1]]["meta"])
+            else:
+                self._not_found()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.info(f"{self.command} {self.path} - {format % args}")
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8089, delay: float = 3.0) -> ThreadingHTTPServer:
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(delay)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI Batch API スタブサーバ")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=3.0, help="バッチが完了するまでの秒数")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.delay)
+    logger.info(f"スタブサーバ起動: http://{args.host}:{args.port}/v1 (delay={args.delay}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+FANZA商品カタログ同期スクリプト
+- FANZA APIの新着ストリームを前回同期以降（gte_date）だけ取得し、ローカルカタログ (data/cache/catalog.sqlite3) へ取り込む
+- run_batch.py --candidate-source catalog はこのカタログから候補を選ぶ（FANZA APIを呼ばない）
+
+使い方:
+  python scripts/sync_catalog.py                     # 差分同期（初回は新着20ページ）
+  python scripts/sync_catalog.py --since 2024-01-01  # 指定日以降を取り直す
+  python scripts/sync_catalog.py --stats
+"""
+import argparse
+import io
+import logging
+import sys
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from src.core.config import get_config
+from src.clients.fanza import FanzaClient
+from src.database.catalog import CatalogStore
+from src.database.response_cache import CACHE_MODES, ResponseCache
+
+# Windows環境での文字化け対策
+if sys.platform == "win32":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FANZA商品カタログを差分同期する")
+    parser.add_argument("--catalog-db", type=str, default="", help="カタログDB (既定: data/cache/catalog.sqlite3)")
+    parser.add_argument("--since", type=str, help="この発売日(YYYY-MM-DD)以降を取得 (未指定で前回同期から差分)")
+    parser.add_argument("--overlap-days", type=int, default=CatalogStore.DEFAULT_OVERLAP_DAYS, help="差分同期で遡る日数")
+    parser.add_argument("--max-pages", type=int, default=0, help="取得する最大ページ(100件/ページ, 0で制限なし/初回は20)")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="refresh", help="FANZA APIレスポンスキャッシュ (use/refresh/bypass)")
+    parser.add_argument("--stats", action="store_true", help="同期せずにカタログの件数を表示")
+    args = parser.parse_args()
+
+    config = get_config()
+    catalog_db = Path(args.catalog_db) if args.catalog_db else config.data_dir / "cache" / "catalog.sqlite3"
+    with CatalogStore(catalog_db) as catalog:
+        if not args.stats:
+            response_cache = ResponseCache(config.data_dir / "cache" / "responses.sqlite3", mode=args.cache_mode)
+            fanza_client = FanzaClient(config.fanza_api_key, config.fanza_affiliate_id, cache=response_cache)
+            catalog.sync(
+                fanza_client,
+                since=args.since,
+                overlap_days=args.overlap_days,
+                max_pages=args.max_pages if args.max_pages > 0 else None,
+            )
+            response_cache.close()
+        for key, value in catalog.get_stats().items():
+            print(f"{key:<16} {value}")
+
+
+if __name__ == "__main__":
+    main()
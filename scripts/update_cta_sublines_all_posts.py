@@ -2,7 +2,6 @@
 
 import logging
 import re
-import time
 from typing import Iterable
 import urllib.parse
 
@@ -17,6 +16,7 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from scripts import configure_sites as cs
+from src.clients.ratelimit import send_with_limits
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -51,28 +51,16 @@ def _replace_subcard(content: str) -> str | None:
 
 
 def _request_with_retry(method: str, url: str, session: requests.Session, **kwargs) -> requests.Response:
-    last_exc: Exception | None = None
-    last_res: requests.Response | None = None
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            res = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
-            if res.status_code in RETRY_STATUSES:
-                last_res = res
-                logger.warning(
-                    f"{method} {url} returned {res.status_code} (attempt {attempt}/{MAX_RETRIES})"
-                )
-                time.sleep(2.0 * attempt)
-                continue
-            return res
-        except Exception as exc:
-            last_exc = exc
-            logger.warning(f"{method} {url} failed (attempt {attempt}/{MAX_RETRIES}): {exc}")
-            time.sleep(1.0 * attempt)
-    if last_res is not None:
-        return last_res
-    if last_exc:
-        raise last_exc
-    raise RuntimeError("request failed")
+    return send_with_limits(
+        session,
+        method,
+        url,
+        max_attempts=MAX_RETRIES,
+        retry_statuses=RETRY_STATUSES,
+        backoff=2.0,
+        timeout=REQUEST_TIMEOUT,
+        **kwargs,
+    )
 
 
 def _iter_posts(session: requests.Session, base_url: str, search: str | None = None) -> Iterable[dict]:
@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import logging
 import re
-import time
 from pathlib import Path
 import sys
 
@@ -14,6 +13,7 @@ if str(ROOT) not in sys.path:
     sys.path.append(str(ROOT))
 
 from scripts import configure_sites as cs
+from src.clients.ratelimit import send_with_limits
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
@@ -57,24 +57,16 @@ TOC_PATTERNS = [
 
 
 def _request_with_retry(method: str, url: str, session: requests.Session, **kwargs) -> requests.Response:
-    last_res = None
-    last_exc = None
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            res = session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
-            if res.status_code in RETRY_STATUSES:
-                last_res = res
-                logger.warning(f"{method} {url} -> {res.status_code} (attempt {attempt}/{MAX_RETRIES})")
-                time.sleep(1.5 * attempt)
-                continue
-            return res
-        except Exception as exc:  # noqa: BLE001
-            last_exc = exc
-            logger.warning(f"{method} {url} failed (attempt {attempt}/{MAX_RETRIES}): {exc}")
-            time.sleep(1.5 * attempt)
-    if last_res is not None:
-        return last_res
-    raise last_exc if last_exc else RuntimeError("request failed")
+    return send_with_limits(
+        session,
+        method,
+        url,
+        max_attempts=MAX_RETRIES,
+        retry_statuses=RETRY_STATUSES,
+        backoff=1.5,
+        timeout=REQUEST_TIMEOUT,
+        **kwargs,
+    )
 
 
 def _iter_posts(session: requests.Session):
@@ -1,39 +1,112 @@
 """
 FANZA/DMM APIクライアント
 """
-import time
 import logging
-from typing import Any
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Literal
+from urllib.parse import urlparse
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from src.clients.ratelimit import THROTTLE_STATUSES, get_rate_limiter, send_with_limits
 from src.core.models import Product
+from src.database.response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
+MergePolicy = Literal["round_robin", "weighted"]
+
+MERGE_POLICIES: tuple[str, ...] = ("round_robin", "weighted")
+
+_EMPTY: dict[str, Any] = {}
+
+
+@dataclass
+class _KeywordStream:
+    """キーワード別ファンアウトの進行状況"""
+    keyword: str | None
+    next_page: int = 0
+    pending: Future | None = None
+    exhausted: bool = False
+    pages: int = 0
+    fetched: int = 0
+    new_items: int = 0
+
+    @property
+    def finished(self) -> bool:
+        return self.exhausted and self.pending is None
+
+    @property
+    def weight(self) -> float:
+        # 新規(未出現)商品の割合。未取得のキーワードは0.5から始める（ラプラス平滑化）
+        return (self.new_items + 1) / (self.fetched + 2)
+
+
 class FanzaClient:
     """FANZA/DMM Affiliate APIクライアント"""
     
     # DMM Affiliate API エンドポイント（差し替え可能）
     BASE_URL = "https://api.dmm.com/affiliate/v3/ItemList"
+
+    # レスポンスキャッシュのTTL(秒): 新着が入れ替わる先頭ページは短く、深いページほど長く
+    CACHE_TTL_FIRST_PAGE = 10 * 60
+    CACHE_TTL_SHALLOW = 60 * 60
+    CACHE_TTL_DEEP = 6 * 60 * 60
+    CACHE_TTL_ITEM = 24 * 60 * 60
+    # 存在しない（配信終了等）IDの否定キャッシュ
+    CACHE_TTL_MISSING = 3 * 24 * 60 * 60
+    SHALLOW_OFFSET_LIMIT = 300
     
-    def __init__(self, api_key: str, affiliate_id: str):
+    def __init__(
+        self,
+        api_key: str,
+        affiliate_id: str,
+        cache: ResponseCache | None = None,
+        max_in_flight: int | None = None,
+        min_interval: float = 0.0,
+    ):
         self.api_key = api_key
         self.affiliate_id = affiliate_id
+        self.cache = cache
+        # 全スレッド共通のAPI呼び出し制限（ホスト単位のトークンバケットと同時実行数）
+        registry = get_rate_limiter()
+        if max_in_flight or min_interval > 0:
+            self.limiter = registry.configure(
+                urlparse(self.BASE_URL).netloc,
+                rate=1.0 / min_interval if min_interval > 0 else None,
+                max_in_flight=max_in_flight,
+            )
+        else:
+            self.limiter = registry.for_url(self.BASE_URL)
         
         # リトライ設定付きセッション
         self.session = requests.Session()
         retry_strategy = Retry(
             total=2,  # 最大2回リトライ
             backoff_factor=1,  # 1s, 2s
-            status_forcelist=[429, 500, 502, 503, 504],
+            # 429/503 はレートリミッタ側で送信ペースを落として再試行する
+            status_forcelist=[500, 502, 504],
             allowed_methods=["GET"],
         )
         self.timeout = 20  # タイムアウト20秒
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=max(10, max_in_flight or 0))
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
+
+    def _send(self, params: dict[str, Any], timeout: Any) -> requests.Response:
+        """レート制限の枠内でAPIを呼び出す（429/503は適応的バックオフで再試行）"""
+        return send_with_limits(
+            self.session,
+            "GET",
+            self.BASE_URL,
+            limiter=self.limiter,
+            max_attempts=4,
+            retry_statuses=THROTTLE_STATUSES,
+            params=params,
+            timeout=timeout,
+        )
     
     def search(
         self,
@@ -66,44 +139,211 @@ class FanzaClient:
         
         if since:
             params["gte_date"] = since.replace("-", "")
+
+        cache_key = self.cache.make_key(params) if self.cache else ""
+        if self.cache:
+            cached = self.cache.get("fanza_search", cache_key)
+            if cached is not None:
+                logger.info(f"FANZA APIキャッシュ利用: limit={limit}, sort={sort}, offset={offset}")
+                return self._parse_response(cached)
         
         try:
-            while True:
-                logger.info(f"FANZA API呼び出し: limit={limit}, sort={sort}, offset={offset}")
-                response = self.session.get(
-                    self.BASE_URL,
-                    params=params,
-                    timeout=(5.0, 30.0),  # (connect, read) タイムアウト
-                )
-                
-                if response.status_code >= 400:
-                    logger.error(f"FANZA API error body: {response.text}")
-
-                if response.status_code == 429:
-                    retry_after = int(response.headers.get("Retry-After", 60))
-                    logger.warning(f"レート制限。{retry_after}秒待機して再試行...")
-                    time.sleep(retry_after)
-                    continue  # ループで再試行
-                
-                response.raise_for_status()
-                data = response.json()
-                
-                return self._parse_response(data)
+            logger.info(f"FANZA API呼び出し: limit={limit}, sort={sort}, offset={offset}")
+            response = self._send(params, timeout=(5.0, 30.0))  # (connect, read) タイムアウト
+            
+            if response.status_code >= 400:
+                logger.error(f"FANZA API error body: {response.text}")
+            
+            response.raise_for_status()
+            data = response.json()
+            if self.cache:
+                self.cache.set("fanza_search", cache_key, data, self._search_ttl(params["offset"]))
+            
+            return self._parse_response(data)
         except requests.exceptions.Timeout:
             logger.error("FANZA APIタイムアウト")
+            stale = self._stale_response("fanza_search", cache_key)
+            if stale is not None:
+                return self._parse_response(stale)
             raise
         except requests.exceptions.RequestException as e:
             logger.error(f"FANZA APIエラー: {e}")
+            stale = self._stale_response("fanza_search", cache_key)
+            if stale is not None:
+                return self._parse_response(stale)
             raise
+
+    def _search_ttl(self, api_offset: int) -> int:
+        """検索結果のTTL（api_offsetはDMM APIの1始まりのoffset）"""
+        if api_offset <= 1:
+            return self.CACHE_TTL_FIRST_PAGE
+        if api_offset <= self.SHALLOW_OFFSET_LIMIT:
+            return self.CACHE_TTL_SHALLOW
+        return self.CACHE_TTL_DEEP
+
+    def _stale_response(self, namespace: str, cache_key: str) -> dict | None:
+        """API障害時は期限切れのキャッシュでも再利用する"""
+        if not self.cache:
+            return None
+        stale = self.cache.get(namespace, cache_key, allow_stale=True)
+        if stale is not None:
+            logger.warning("FANZA API失敗のため期限切れキャッシュを使用")
+        return stale
     
-    def fetch(self, limit: int = 1, since: str | None = None, sort: str = "date", keyword: str | None = None, offset: int = 0) -> list[dict]:
-        """商品を取得してdict形式で返す（シンプルAPI）"""
-        products = self.search(limit=limit, since=since, sort=sort, keyword=keyword, offset=offset)
-        return [p.to_dict() for p in products]
+    def fetch(self, limit: int = 1, since: str | None = None, sort: str = "date", keyword: str | None = None, offset: int = 0) -> list[Product]:
+        """
+        商品を取得して返す（シンプルAPI）
+        Productはdict形式のアクセス（item["title"] / item.get(...)）にも対応しているため、そのまま後段へ渡せる
+        """
+        return self.search(limit=limit, since=since, sort=sort, keyword=keyword, offset=offset)
     
-    def fetch_by_id(self, content_id: str) -> list[dict]:
-        """商品IDで商品を取得"""
-        params = {
+    def iter_pages(
+        self,
+        keyword: str | None = None,
+        sort: str = "date",
+        since: str | None = None,
+        per_page: int = 100,
+        max_pages: int | None = 10,
+        prefetch: bool = True,
+    ) -> Iterator[list[Product]]:
+        """
+        検索結果をページ単位で遅延取得するジェネレータ（1ページ = Productのリスト）
+        prefetch=True の場合、呼び出し側が現在のページを処理している間に次のページを裏で取得する。
+        呼び出し側が途中で反復をやめる（close/break）と、それ以降のページは取得しない
+        （先読み中の1ページ分だけは完了を待たずに破棄する）。
+        """
+        per_page = min(max(per_page, 1), 100)
+
+        def load(page: int) -> list[Product]:
+            return self.fetch(limit=per_page, since=since, sort=sort, keyword=keyword, offset=page * per_page)
+
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fanza-prefetch") if prefetch else None
+        pending: Future | None = None
+        page = 0
+        try:
+            batch = load(page)
+            while batch:
+                has_next = len(batch) >= per_page and (max_pages is None or page + 1 < max_pages)
+                if has_next and executor is not None:
+                    pending = executor.submit(load, page + 1)
+                yield batch
+                if not has_next:
+                    break
+                page += 1
+                if pending is not None:
+                    batch, pending = pending.result(), None
+                else:
+                    batch = load(page)
+        finally:
+            if pending is not None:
+                pending.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def iter_items(self, **kwargs) -> Iterator[Product]:
+        """iter_pages の結果を1商品ずつ流す（引数は iter_pages と同じ）"""
+        pages = self.iter_pages(**kwargs)
+        try:
+            for batch in pages:
+                yield from batch
+        finally:
+            pages.close()
+
+    def iter_keyword_pages(
+        self,
+        keywords: list[str | None],
+        sort: str = "date",
+        since: str | None = None,
+        per_page: int = 100,
+        max_pages: int | None = 10,
+        concurrency: int = 4,
+        policy: MergePolicy = "round_robin",
+    ) -> Iterator[list[Product]]:
+        """
+        複数キーワードの検索を並行実行し、重複を除いた1本のページ列にまとめるジェネレータ
+        - 各キーワードは1ページずつ先読みし、同時に走る検索は concurrency 件まで
+          （API全体の上限は max_in_flight / min_interval で別途かかる）
+        - policy=round_robin: キーワード順に1ページずつ交互に返す
+        - policy=weighted: 取得済みのページから新規商品の割合が高いキーワードを優先して取得・返却する
+        返すページには、それまでに返していない商品だけが入る（空になったページは返さない）
+        """
+        if policy not in MERGE_POLICIES:
+            raise ValueError(f"無効なマージ方式: {policy}")
+        per_page = min(max(per_page, 1), 100)
+        streams = [_KeywordStream(kw) for kw in dict.fromkeys(keywords)]
+        if not streams:
+            return
+        concurrency = max(concurrency, 1)
+        seen: set[str] = set()
+        cursor = 0
+
+        def load(keyword: str | None, page: int) -> list[Product]:
+            return self.fetch(limit=per_page, since=since, sort=sort, keyword=keyword, offset=page * per_page)
+
+        def schedule() -> None:
+            in_flight = sum(1 for st in streams if st.pending is not None)
+            idle = [st for st in streams if st.pending is None and not st.exhausted]
+            if policy == "weighted":
+                idle.sort(key=lambda st: st.weight, reverse=True)
+            for st in idle:
+                if in_flight >= concurrency:
+                    break
+                st.pending = executor.submit(load, st.keyword, st.next_page)
+                st.next_page += 1
+                in_flight += 1
+
+        def pick() -> _KeywordStream:
+            nonlocal cursor
+            if policy == "round_robin":
+                while True:
+                    st = streams[cursor % len(streams)]
+                    cursor += 1
+                    if st.pending is not None:
+                        return st
+            waiting = [st for st in streams if st.pending is not None]
+            ready = [st for st in waiting if st.pending.done()]
+            if not ready:
+                wait([st.pending for st in waiting], return_when=FIRST_COMPLETED)
+                ready = [st for st in waiting if st.pending.done()]
+            return max(ready, key=lambda st: st.weight)
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fanza-fanout")
+        try:
+            while True:
+                schedule()
+                if all(st.finished for st in streams):
+                    break
+                st = pick()
+                future, st.pending = st.pending, None
+                try:
+                    batch = future.result()
+                except Exception as e:
+                    logger.warning(f"キーワード検索失敗: keyword={st.keyword}, page={st.next_page - 1}, error={e}")
+                    st.exhausted = True
+                    continue
+                st.pages += 1
+                st.fetched += len(batch)
+                if len(batch) < per_page or (max_pages is not None and st.next_page >= max_pages):
+                    st.exhausted = True
+                fresh = []
+                for item in batch:
+                    pid = item.product_id.lower()
+                    if pid not in seen:
+                        seen.add(pid)
+                        fresh.append(item)
+                st.new_items += len(fresh)
+                if fresh:
+                    yield fresh
+        finally:
+            for st in streams:
+                if st.pending is not None:
+                    st.pending.cancel()
+            executor.shutdown(wait=False)
+            summary = ", ".join(f"{st.keyword}:{st.new_items}/{st.fetched}({st.pages}p)" for st in streams if st.pages)
+            logger.info(f"キーワード別取得 (新規/取得): {summary or 'なし'}")
+
+    def _item_params(self, content_id: str) -> dict[str, Any]:
+        return {
             "api_id": self.api_key,
             "affiliate_id": self.affiliate_id,
             "site": "FANZA",
@@ -113,75 +353,135 @@ class FanzaClient:
             "hits": 1,
             "output": "json",
         }
-        
+
+    def _cached_item(self, content_id: str) -> list[Product] | None:
+        """キャッシュ済みのID指定結果（存在しないIDは空リスト、未キャッシュはNone）"""
+        if not self.cache:
+            return None
+        cached = self.cache.get("fanza_item", self.cache.make_key(self._item_params(content_id)))
+        return None if cached is None else self._parse_response(cached)
+
+    def _stale_item(self, content_id: str) -> list[Product] | None:
+        if not self.cache:
+            return None
+        stale = self._stale_response("fanza_item", self.cache.make_key(self._item_params(content_id)))
+        return None if stale is None else self._parse_response(stale)
+
+    def _request_item(self, content_id: str) -> list[Product]:
+        """ID指定でAPIを呼び出す（失敗時は例外。存在しないIDの結果も否定キャッシュとして保存する）"""
+        params = self._item_params(content_id)
+        logger.info(f"FANZA API呼び出し（ID指定）: cid={content_id}")
+        response = self._send(params, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        products = self._parse_response(data)
+        if self.cache:
+            ttl = self.CACHE_TTL_ITEM if products else self.CACHE_TTL_MISSING
+            self.cache.set("fanza_item", self.cache.make_key(params), data, ttl)
+        return products
+
+    def fetch_by_id(self, content_id: str) -> list[Product]:
+        """商品IDで商品を取得"""
+        cached = self._cached_item(content_id)
+        if cached is not None:
+            return cached
         try:
-            logger.info(f"FANZA API呼び出し（ID指定）: cid={content_id}")
-            response = self.session.get(
-                self.BASE_URL,
-                params=params,
-                timeout=self.timeout,
-            )
-            response.raise_for_status()
-            data = response.json()
-            products = self._parse_response(data)
-            return [p.to_dict() for p in products]
+            return self._request_item(content_id)
         except Exception as e:
             logger.error(f"FANZA API（ID指定）エラー: {e}")
-            return []
+            return self._stale_item(content_id) or []
+
+    def fetch_by_ids(
+        self,
+        content_ids: Iterable[str],
+        concurrency: int = 4,
+        catalog: Any = None,
+    ) -> dict[str, Product | None]:
+        """
+        複数の商品IDをまとめて引く（{ID: Product, 存在しないIDは None}）
+        ローカルのカタログ（CatalogStore, 任意）→ レスポンスキャッシュの順に解決し、残りだけをAPIへ並行して問い合わせる。
+        DMM APIの cid は1リクエスト1件のため、APIへの問い合わせは重複を除いた未解決IDごとに1回になる。
+        存在しないIDは否定キャッシュ（CACHE_TTL_MISSING）され、次回からはAPIを呼ばない。
+        API失敗（通信エラー等）のIDは結果に含めない（期限切れキャッシュがあればそれを使う）。
+        """
+        wanted = {str(cid): str(cid).lower() for cid in content_ids if cid}
+        resolved: dict[str, Product | None] = {}
+        pending = list(dict.fromkeys(wanted.values()))
+
+        if catalog is not None and pending:
+            found = catalog.get_many(pending)
+            resolved.update(found)
+            pending = [cid for cid in pending if cid not in found]
+
+        misses = []
+        for cid in pending:
+            cached = self._cached_item(cid)
+            if cached is None:
+                misses.append(cid)
+            else:
+                resolved[cid] = cached[0] if cached else None
+        local_hits = len(resolved)
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="fanza-lookup") as executor:
+                futures = {executor.submit(self._request_item, cid): cid for cid in misses}
+                for future in as_completed(futures):
+                    cid = futures[future]
+                    try:
+                        products = future.result()
+                    except Exception as e:
+                        logger.error(f"FANZA API（ID指定）エラー: cid={cid}, {e}")
+                        stale = self._stale_item(cid)
+                        if stale is None:
+                            continue
+                        products = stale
+                    resolved[cid] = products[0] if products else None
+
+        logger.info(
+            f"FANZA一括ID取得: {len(wanted)}件 (ローカル解決{local_hits}件, API{len(misses)}件, "
+            f"該当なし{sum(1 for v in resolved.values() if v is None)}件)"
+        )
+        return {cid: resolved[norm] for cid, norm in wanted.items() if norm in resolved}
 
     def _parse_response(self, data: dict[str, Any]) -> list[Product]:
-        """APIレスポンスをProductリストにパース"""
+        """
+        APIレスポンスをProductリストにパース
+        レスポンスの各要素はJSONデコード済みのdictなので、文字列やURLのリストはコピーせずそのまま参照する
+        （iteminfo 等のネストは1回だけ辿る）
+        """
         products = []
-        result = data.get("result", {})
-        items = result.get("items", [])
-        
+        items = (data.get("result") or {}).get("items") or []
+
         for item in items:
             try:
-                actress_list = []
-                if "iteminfo" in item and "actress" in item["iteminfo"]:
-                    actress_list = [a.get("name", "") for a in item["iteminfo"]["actress"]]
-                
-                genre_list = []
-                if "iteminfo" in item and "genre" in item["iteminfo"]:
-                    genre_list = [g.get("name", "") for g in item["iteminfo"]["genre"]]
-                
-                maker = ""
-                if "iteminfo" in item and "maker" in item["iteminfo"]:
-                    makers = item["iteminfo"]["maker"]
-                    if makers:
-                        maker = makers[0].get("name", "")
-                
-                image_url = ""
-                if "imageURL" in item:
-                    image_url = item["imageURL"].get("large", item["imageURL"].get("small", ""))
-                
-                sample_movie_url = ""
-                if "sampleMovieURL" in item:
-                    movie_data = item["sampleMovieURL"]
-                    sample_movie_url = movie_data.get("size_720_480", movie_data.get("size_644_414", movie_data.get("size_476_306", "")))
-
-                sample_urls = []
-                if "sampleImageURL" in item:
-                    sample_data = item["sampleImageURL"]
-                    if "sample_l" in sample_data and "image" in sample_data["sample_l"]:
-                        sample_urls = sample_data["sample_l"]["image"][:10]
-                    elif "sample_s" in sample_data and "image" in sample_data["sample_s"]:
-                        sample_urls = sample_data["sample_s"]["image"][:10]
-                
-                product = Product(
+                info = item.get("iteminfo") or _EMPTY
+                makers = info.get("maker")
+                images = item.get("imageURL") or _EMPTY
+                movies = item.get("sampleMovieURL") or _EMPTY
+                samples = item.get("sampleImageURL") or _EMPTY
+                sample_urls = (
+                    (samples.get("sample_l") or _EMPTY).get("image")
+                    or (samples.get("sample_s") or _EMPTY).get("image")
+                    or []
+                )
+                if len(sample_urls) > 10:
+                    sample_urls = sample_urls[:10]
+
+                products.append(Product(
                     product_id=item.get("content_id", item.get("product_id", "")),
                     title=item.get("title", ""),
-                    actress=actress_list,
-                    maker=maker,
-                    genre=genre_list,
+                    actress=[a.get("name", "") for a in info.get("actress", ())],
+                    maker=makers[0].get("name", "") if makers else "",
+                    genre=[g.get("name", "") for g in info.get("genre", ())],
                     release_date=item.get("date", ""),
                     summary=item.get("description", item.get("title", "")),
-                    package_image_url=image_url,
+                    package_image_url=images.get("large", images.get("small", "")),
                     affiliate_url=item.get("affiliateURL", item.get("URL", "")),
                     sample_image_urls=sample_urls,
-                    sample_movie_url=sample_movie_url,
-                )
-                products.append(product)
+                    sample_movie_url=movies.get(
+                        "size_720_480", movies.get("size_644_414", movies.get("size_476_306", ""))
+                    ),
+                ))
             except Exception as e:
                 logger.warning(f"商品パースエラー: {e}, item={item.get('content_id', 'unknown')}")
                 continue
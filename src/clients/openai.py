@@ -1,17 +1,38 @@
 """
 OpenAI APIクライアント
 """
+import hashlib
 import json
 import random
+import re
+import string
 import logging
+import threading
+import time
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 import httpx
 from openai import OpenAI
 import openai
 
+from src.core.models import Product
+from src.database.response_cache import ResponseCache
+from src.processor.json_stream import JSONStreamError, StreamingJSONChecker
+
+if TYPE_CHECKING:
+    from src.processor.validator import Validator
+
 logger = logging.getLogger(__name__)
 
+
+class PregeneratedArticleMissing(Exception):
+    """事前生成のみモードで、記事がキャッシュに無い"""
+
+
+class MalformedResponseError(Exception):
+    """AI応答が記事のJSONとして読めない（ストリーミング生成の打ち切りを含む）"""
+
+
 class OpenAIClient:
     """OpenAI GPTによる記事生成"""
     _SITE_SECTION_TITLES = {
@@ -26,18 +47,55 @@ class OpenAIClient:
         "sd10-otona": ["洗練度スコア", "大人の余裕", "高級感の余韻"],
     }
     
+    # 生成結果キャッシュのTTL(秒)
+    CACHE_TTL_ARTICLE = 14 * 24 * 60 * 60
+    MAX_COMPLETION_TOKENS = 2000
+    REQUEST_TIMEOUT = httpx.Timeout(90.0, connect=10.0)
+    # stream_options.include_usage で最後のチャンクにトークン数が載る
+    STREAM_KWARGS = {"stream": True, "stream_options": {"include_usage": True}}
+    
     def __init__(
         self,
         api_key: str,
         model: str,
         prompts_dir: Path,
         viewpoints_path: Path,
+        max_in_flight: int | None = None,
+        cache: ResponseCache | None = None,
+        base_url: str | None = None,
+        pregenerated_only: bool = False,
+        stream: bool = False,
+        stream_attempts: int = 2,
     ):
-        self.client = OpenAI(api_key=api_key)
+        # base_url: OpenAI互換エンドポイント（ローカルのスタブサーバ等）。未指定ならSDK既定（OPENAI_BASE_URL）
+        self.client = OpenAI(api_key=api_key, base_url=base_url) if base_url else OpenAI(api_key=api_key)
         self.model = model
+        # 並列ワーカーからの同時生成数を制限する（Noneで無制限）
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        # 生成結果キャッシュ（モデル・プロンプト・画像・サイトのハッシュをキーにする）
+        self.cache = cache
+        # Batch API で事前生成した記事だけを使う（キャッシュに無ければ生成しない）
+        self.pregenerated_only = pregenerated_only
+        # ストリーミング生成: 受信しながらJSON構造を検査し、壊れていれば打ち切ってすぐ再試行する
+        self.stream = stream
+        self.stream_attempts = max(stream_attempts, 1)
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "generated": 0,
+            "cache_hits": 0,
+            "saved_seconds": 0.0,
+            "api_seconds": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "stream_aborts": 0,
+        }
         self.prompts_dir = prompts_dir
         self.system_prompt = self._load_template("system.txt")
         self.user_template = self._load_template("user.txt")
+        # テンプレートは起動時に固定部分と商品ごとの部分へ分けておき、サイト別の指示はサイトごとに1回だけ組み立てる
+        self._user_static, self._user_product_template = self._compile_user_template(self.user_template)
+        self._site_prefixes: dict[tuple, str] = {}
         self.viewpoints = self._load_viewpoints(viewpoints_path)
         logger.info(f"OpenAIクライアント初期化: model={model}, 観点数={len(self.viewpoints)}")
     
@@ -75,28 +133,80 @@ class OpenAIClient:
             "出力はJSONの site_sections 配列（title, body）に入れる。\n"
         )
     
-    def _select_viewpoints(self, count: int = 2) -> list[dict[str, str]]:
-        """ランダムに観点を選択"""
+    def _select_viewpoints(self, count: int = 2, seed: str | None = None) -> list[dict[str, str]]:
+        """
+        観点を選択（seed を指定すると同じ seed では常に同じ観点になる）
+        商品IDを seed にすることで、同じ商品のプロンプトが毎回同じになり生成結果キャッシュが効く
+        """
         if len(self.viewpoints) < count:
             return self.viewpoints
-        return random.sample(self.viewpoints, count)
+        rng = random.Random(seed) if seed is not None else random
+        return rng.sample(self.viewpoints, count)
     
-    def generate_article(self, product: dict[str, Any], sample_image_urls: list[str] | None = None, site_info: Any = None) -> dict[str, str]:
-        """商品データから記事を生成（マルチモーダル対応）"""
-        selected_viewpoints = self._select_viewpoints(2)
-        viewpoint_text = "\n".join([f"- {v['name']}: {v['description']}" for v in selected_viewpoints])
-        
-        site_context = ""
-        if site_info:
-            site_context = (
+    def cache_key(self, messages: list[dict[str, Any]], site_info: Any) -> str:
+        """モデル・システム/ユーザープロンプト・画像URL・サイトから生成結果キャッシュのキーを作る"""
+        payload = json.dumps(
+            {
+                "model": self.model,
+                "messages": messages,
+                "site": getattr(site_info, "subdomain", None),
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    @staticmethod
+    def _compile_user_template(template: str) -> tuple[str, str]:
+        """
+        ユーザープロンプトのテンプレートを「## 」見出し単位で、差し込みの無い固定部分と商品ごとの部分に分ける。
+        固定部分を前に寄せ、システムプロンプト→サイト別指示→固定部分までを毎回同じ先頭にする（プロンプトキャッシュ用）
+        """
+        formatter = string.Formatter()
+        static_sections: list[str] = []
+        product_sections: list[str] = []
+        for section in re.split(r"(?m)^(?=## )", template):
+            section = section.strip()
+            if not section:
+                continue
+            if any(field_name is not None for _, field_name, _, _ in formatter.parse(section)):
+                product_sections.append(section)
+            else:
+                static_sections.append(section)
+        static_text = "\n\n".join(static_sections).format()
+        return (static_text + "\n\n" if static_text else ""), "\n\n".join(product_sections) + "\n"
+    
+    def _site_prefix(self, site_info: Any) -> str:
+        """サイト別の固定指示（サイトコンセプト・専用パート）。サイトごとに1回だけ組み立てて使い回す"""
+        if not site_info:
+            return ""
+        key = (getattr(site_info, "subdomain", None), site_info.title, site_info.tagline)
+        prefix = self._site_prefixes.get(key)
+        if prefix is None:
+            prefix = (
                 f"## サイトコンセプト\nサイト名: {site_info.title}\n"
                 f"説明: {site_info.tagline}\n"
                 "このサイトのテーマに合わせたトーンで執筆してください。\n\n"
             )
-            site_context += self._build_site_sections_prompt(site_info) + "\n"
-
-        logger.info(f"記事生成開始: {product['product_id']}")
-        user_prompt = f"{site_context}" + self.user_template.format(
+            prefix += self._build_site_sections_prompt(site_info) + "\n"
+            self._site_prefixes[key] = prefix
+        return prefix
+    
+    def build_messages(
+        self,
+        product: Product,
+        sample_image_urls: list[str] | None = None,
+        site_info: Any = None,
+    ) -> list[dict[str, Any]]:
+        """
+        記事生成用のメッセージを組み立てる（同期生成とBatch APIで共通）
+        システムプロンプト→サイト別指示→テンプレートの固定部分→商品ごとの部分（→画像）の順に並べ、
+        同じサイトの生成では商品情報より前がすべて同一になるようにする。
+        """
+        selected_viewpoints = self._select_viewpoints(2, seed=str(product["product_id"]))
+        viewpoint_text = "\n".join([f"- {v['name']}: {v['description']}" for v in selected_viewpoints])
+        
+        user_prompt = self._site_prefix(site_info) + self._user_static + self._user_product_template.format(
             product_id=product["product_id"],
             title=product["title"],
             actress=", ".join(product["actress"]) if product["actress"] else "情報なし",
@@ -113,48 +223,285 @@ class OpenAIClient:
             user_content = [{"type": "text", "text": user_prompt + "\n\n## シーン画像\n以下の画像を見て、それぞれの画像に対応したシーン説明を生成してください。"}]
             for img_url in sample_image_urls[:3]:
                 user_content.append({"type": "image_url", "image_url": {"url": img_url, "detail": "low"}})
-            messages = [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": user_content}]
-        else:
-            messages = [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": user_prompt}]
+            return [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": user_content}]
+        return [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": user_prompt}]
+    
+    def _response_format(self) -> dict[str, str] | None:
+        if any(m in self.model for m in ["gpt-4", "gpt-3.5-turbo-0125"]):
+            return {"type": "json_object"}
+        return None
+    
+    def build_request_body(self, messages: list[dict[str, Any]]) -> dict[str, Any]:
+        """chat.completions のリクエスト本文（Batch APIのJSONL 1行分の body）"""
+        body: dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "max_completion_tokens": self.MAX_COMPLETION_TOKENS,
+        }
+        response_format = self._response_format()
+        if response_format is not None:
+            body["response_format"] = response_format
+        return body
+    
+    def article_cache_key(
+        self,
+        product: Product,
+        sample_image_urls: list[str] | None = None,
+        site_info: Any = None,
+    ) -> str:
+        """generate_article と同じ入力に対する生成結果キャッシュのキー"""
+        return self.cache_key(self.build_messages(product, sample_image_urls, site_info), site_info)
+    
+    def has_cached_article(
+        self,
+        product: Product,
+        sample_image_urls: list[str] | None = None,
+        site_info: Any = None,
+    ) -> bool:
+        """生成済み（キャッシュ済み）の記事があるか（統計は更新しない）"""
+        if not self.cache:
+            return False
+        key = self.article_cache_key(product, sample_image_urls, site_info)
+        return self.cache.contains("openai_article", key)
+    
+    def store_article(
+        self,
+        cache_key: str,
+        raw_response: str,
+        elapsed: float = 0.0,
+        validator: "Validator | None" = None,
+    ) -> bool:
+        """
+        生成結果をキャッシュへ保存（JSONとして読めない応答は保存しない）
+        validator を渡すと検品不合格の応答も保存しない（Batch APIの結果取り込み用）
+        """
+        if not self.cache or not self._is_json(raw_response):
+            return False
+        if validator is not None:
+            try:
+                ai_response = self._parse_response(raw_response)
+            except MalformedResponseError:
+                return False
+            result = validator.validate_ai_response(ai_response)
+            if not result.is_valid:
+                logger.warning(f"検品不合格のためキャッシュしません: {'; '.join(result.errors)}")
+                return False
+        self.cache.set(
+            "openai_article",
+            cache_key,
+            {"raw_response": raw_response, "elapsed": round(elapsed, 2)},
+            self.CACHE_TTL_ARTICLE,
+        )
+        return True
+    
+    def generate_article(
+        self,
+        product: Product,
+        sample_image_urls: list[str] | None = None,
+        site_info: Any = None,
+        use_cache: bool = True,
+    ) -> dict[str, str]:
+        """
+        商品データから記事を生成（マルチモーダル対応）
+        同じ入力の生成結果がキャッシュにあればOpenAIを呼ばずに返す。
+        use_cache=False の場合はキャッシュを読まずに生成し、結果で上書きする（検品不合格時の再生成用）
+        pregenerated_only=True のクライアントはキャッシュに無ければ生成せず PregeneratedArticleMissing を送出する。
+        """
+        messages = self.build_messages(product, sample_image_urls, site_info)
+        cache_key = self.cache_key(messages, site_info) if self.cache else ""
+        cached = self._cached_result(cache_key, product["product_id"], use_cache)
+        if cached is not None:
+            return cached
+
+        logger.info(f"記事生成開始: {product['product_id']}")
+        if self.stream:
+            return self._generate_streaming(messages, cache_key, product["product_id"])
         try:
-            timeout = httpx.Timeout(90.0, connect=10.0)
-            response = self.client.chat.completions.with_raw_response.create(
-                model=self.model,
-                messages=messages,
-                max_completion_tokens=2000,
-                timeout=timeout,
-                response_format={ "type": "json_object" } if any(m in self.model for m in ["gpt-4", "gpt-3.5-turbo-0125"]) else None
-            )
-            chat_completion = response.parse()
-            raw_response = chat_completion.choices[0].message.content
-            result = self._parse_response(raw_response)
-            result["raw_response"] = raw_response
-            return result
+            started = time.monotonic()
+            if self._in_flight is not None:
+                self._in_flight.acquire()
+            try:
+                response = self.client.chat.completions.with_raw_response.create(**self._request_kwargs(messages))
+            finally:
+                if self._in_flight is not None:
+                    self._in_flight.release()
+            return self._finish_generation(response, started, cache_key)
+        except MalformedResponseError:
+            raise
         except Exception as e:
             logger.error(f"OpenAI APIエラー: {e}")
             raise
     
-    def generate(self, item: dict, sample_image_urls: list[str] | None = None, site_info: Any = None) -> dict:
+    def _generate_streaming(self, messages: list[dict[str, Any]], cache_key: str, product_id: str) -> dict:
+        """ストリーミングで生成し、構造が壊れた時点で打ち切って stream_attempts 回まで生成し直す"""
+        last_error: JSONStreamError | None = None
+        for attempt in range(1, self.stream_attempts + 1):
+            started = time.monotonic()
+            if self._in_flight is not None:
+                self._in_flight.acquire()
+            try:
+                raw_response, usage, request_id = self._stream_completion(messages)
+            except JSONStreamError as e:
+                self._record_stream_abort(product_id, e, attempt, started)
+                last_error = e
+                continue
+            except Exception as e:
+                logger.error(f"OpenAI APIエラー: {e}")
+                raise
+            finally:
+                if self._in_flight is not None:
+                    self._in_flight.release()
+            return self._complete_generation(raw_response, usage, started, cache_key, request_id)
+        raise MalformedResponseError(f"AI応答のJSONが不正です: {last_error}") from last_error
+    
+    def _stream_completion(self, messages: list[dict[str, Any]]) -> tuple[str, Any, str | None]:
+        """ストリームを受信しながら検査する（壊れていれば JSONStreamError で打ち切る）"""
+        checker = StreamingJSONChecker()
+        parts: list[str] = []
+        usage = None
+        stream = self.client.chat.completions.create(**self._request_kwargs(messages), **self.STREAM_KWARGS)
+        try:
+            for chunk in stream:
+                usage = self._consume_chunk(chunk, checker, parts) or usage
+            checker.finish()
+        finally:
+            stream.close()
+        return "".join(parts), usage, self._stream_request_id(stream)
+    
+    @staticmethod
+    def _consume_chunk(chunk: Any, checker: StreamingJSONChecker, parts: list[str]) -> Any:
+        """ストリームの1チャンクを検査して本文を溜める（usage があれば返す）"""
+        for choice in chunk.choices or []:
+            text = getattr(choice.delta, "content", None)
+            if text:
+                checker.feed(text)
+                parts.append(text)
+        return getattr(chunk, "usage", None)
+    
+    @staticmethod
+    def _stream_request_id(stream: Any) -> str | None:
+        response = getattr(stream, "response", None)
+        return response.headers.get("x-request-id") if response is not None else None
+    
+    def _record_stream_abort(self, product_id: str, error: Exception, attempt: int, started: float) -> None:
+        with self._stats_lock:
+            self.stats["stream_aborts"] += 1
+        logger.warning(
+            f"ストリーミング生成を打ち切り: {product_id}, {error} "
+            f"({time.monotonic() - started:.1f}秒, {attempt}/{self.stream_attempts})"
+        )
+    
+    def _cached_result(self, cache_key: str, product_id: str, use_cache: bool) -> dict | None:
+        """キャッシュ済みの生成結果（無ければNone。事前生成のみモードでは PregeneratedArticleMissing）"""
+        if self.cache and (use_cache or self.pregenerated_only):
+            cached = self.cache.get("openai_article", cache_key)
+            if cached is not None:
+                with self._stats_lock:
+                    self.stats["cache_hits"] += 1
+                    self.stats["saved_seconds"] += cached.get("elapsed", 0.0)
+                logger.info(f"記事生成キャッシュ利用: {product_id}")
+                result = self._parse_response(cached["raw_response"])
+                result["raw_response"] = cached["raw_response"]
+                return result
+        if self.pregenerated_only:
+            raise PregeneratedArticleMissing(f"事前生成された記事がありません: {product_id}")
+        return None
+    
+    def _request_kwargs(self, messages: list[dict[str, Any]]) -> dict[str, Any]:
+        """chat.completions.create の引数（同期/非同期で共通。再試行はSDKの max_retries に任せる）"""
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_completion_tokens": self.MAX_COMPLETION_TOKENS,
+            "timeout": self.REQUEST_TIMEOUT,
+            "response_format": self._response_format(),
+        }
+    
+    def _finish_generation(self, response: Any, started: float, cache_key: str) -> dict:
+        """生のレスポンスから記事を取り出す"""
+        chat_completion = response.parse()
+        return self._complete_generation(
+            chat_completion.choices[0].message.content,
+            getattr(chat_completion, "usage", None),
+            started,
+            cache_key,
+            response.headers.get("x-request-id"),
+        )
+    
+    def _complete_generation(
+        self,
+        raw_response: str,
+        usage: Any,
+        started: float,
+        cache_key: str,
+        request_id: str | None = None,
+    ) -> dict:
+        """記事をパースしてメトリクス（所要時間・トークン数）を付け、キャッシュへ保存する"""
+        elapsed = time.monotonic() - started
+        metrics = {
+            "latency": round(elapsed, 2),
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+            # プロンプトキャッシュに一致した入力トークン数（先頭の固定部分が再利用された分）
+            "cached_tokens": getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0,
+        }
+        with self._stats_lock:
+            self.stats["generated"] += 1
+            self.stats["api_seconds"] += elapsed
+            self.stats["prompt_tokens"] += metrics["prompt_tokens"]
+            self.stats["completion_tokens"] += metrics["completion_tokens"]
+            self.stats["cached_tokens"] += metrics["cached_tokens"]
+        logger.info(
+            f"記事生成完了: {metrics['latency']}秒, tokens={metrics['prompt_tokens']}+{metrics['completion_tokens']} "
+            f"(cached={metrics['cached_tokens']}), "
+            f"request_id={request_id or '-'}"
+        )
+        # パースできない応答はキャッシュせずに例外にする（再生成させる）
+        result = self._parse_response(raw_response)
+        result["raw_response"] = raw_response
+        result["metrics"] = metrics
+        if self.cache:
+            self.store_article(cache_key, raw_response, elapsed)
+        return result
+    
+    def generate(
+        self,
+        item: Product,
+        sample_image_urls: list[str] | None = None,
+        site_info: Any = None,
+        use_cache: bool = True,
+    ) -> dict:
         """商品データからAI応答を生成"""
-        return self.generate_article(item, sample_image_urls, site_info=site_info)
+        return self.generate_article(item, sample_image_urls, site_info=site_info, use_cache=use_cache)
+    
+    @staticmethod
+    def _is_json(response: str) -> bool:
+        try:
+            json.loads(response)
+        except (TypeError, json.JSONDecodeError):
+            return False
+        return True
     
     def _parse_response(self, response: str) -> dict:
-        """OpenAIの応答をパース"""
+        """OpenAIの応答をパース（JSONオブジェクトとして読めなければ MalformedResponseError）"""
         try:
             data = json.loads(response)
-            return {
-                "title": data.get("title", ""),
-                "short_description": data.get("short_description", ""),
-                "highlights": data.get("highlights", []),
-                "meters": data.get("meters", {}),
-                "scenes": data.get("scenes", []),
-                "checklist": data.get("checklist", {}),
-                "ratings": data.get("ratings", {}),
-                "site_sections": data.get("site_sections", []),
-                "summary": data.get("summary", ""),
-                "faq": data.get("faq", []),
-                "cta_text": data.get("cta_text", "今すぐ堪能する"),
-                "excerpt": data.get("excerpt", ""),
-            }
-        except json.JSONDecodeError:
-            return {"title": "レビュー", "summary": response[:200], "scenes": [], "ratings": {}, "short_description": "", "cta_text": "今すぐ堪能する", "excerpt": "", "site_sections": []}
+        except (TypeError, json.JSONDecodeError) as e:
+            raise MalformedResponseError(f"AI応答のJSONが不正です: {e}: {str(response)[:200]}") from e
+        if not isinstance(data, dict):
+            raise MalformedResponseError(f"AI応答がJSONオブジェクトではありません: {type(data).__name__}")
+        return {
+            "title": data.get("title", ""),
+            "short_description": data.get("short_description", ""),
+            "highlights": data.get("highlights", []),
+            "meters": data.get("meters", {}),
+            "scenes": data.get("scenes", []),
+            "checklist": data.get("checklist", {}),
+            "ratings": data.get("ratings", {}),
+            "site_sections": data.get("site_sections", []),
+            "summary": data.get("summary", ""),
+            "faq": data.get("faq", []),
+            "cta_text": data.get("cta_text", "今すぐ堪能する"),
+            "excerpt": data.get("excerpt", ""),
+        }
@@ -0,0 +1,149 @@
+"""
+OpenAI API非同期クライアント（AsyncOpenAIベース）
+
+プロンプト・キャッシュ・応答のパースは OpenAIClient と共通。
+記事生成は1件あたり数十秒かかるため、複数件を asyncio で重ねて同時に待つ。
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable
+
+from openai import AsyncOpenAI
+
+from src.clients.openai import MalformedResponseError, OpenAIClient
+from src.core.models import Product
+from src.database.response_cache import ResponseCache
+from src.processor.json_stream import JSONStreamError, StreamingJSONChecker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GenerationRequest:
+    """非同期一括生成の1件"""
+    product: Product
+    sample_image_urls: list[str]
+    site_info: Any = None
+    use_cache: bool = True
+
+
+class AsyncOpenAIClient(OpenAIClient):
+    """OpenAIClient と同じ記事生成を async で提供（同時生成数は max_in_flight で制限）"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        prompts_dir: Path,
+        viewpoints_path: Path,
+        max_in_flight: int = 4,
+        cache: ResponseCache | None = None,
+        base_url: str | None = None,
+        pregenerated_only: bool = False,
+        stream: bool = False,
+        stream_attempts: int = 2,
+    ):
+        super().__init__(
+            api_key,
+            model,
+            prompts_dir,
+            viewpoints_path,
+            cache=cache,
+            base_url=base_url,
+            pregenerated_only=pregenerated_only,
+            stream=stream,
+            stream_attempts=stream_attempts,
+        )
+        self.aclient = AsyncOpenAI(api_key=api_key, base_url=base_url) if base_url else AsyncOpenAI(api_key=api_key)
+        self.max_in_flight = max(max_in_flight, 1)
+        self._async_in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def __aenter__(self) -> "AsyncOpenAIClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.aclient.close()
+
+    async def agenerate_article(
+        self,
+        product: Product,
+        sample_image_urls: list[str] | None = None,
+        site_info: Any = None,
+        use_cache: bool = True,
+    ) -> dict[str, str]:
+        """generate_article の非同期版（キャッシュ・タイムアウト・SDKの再試行は同期版と同じ）"""
+        messages = self.build_messages(product, sample_image_urls, site_info)
+        cache_key = self.cache_key(messages, site_info) if self.cache else ""
+        cached = self._cached_result(cache_key, product["product_id"], use_cache)
+        if cached is not None:
+            return cached
+
+        if self.stream:
+            return await self._agenerate_streaming(messages, cache_key, product["product_id"])
+        try:
+            async with self._async_in_flight:
+                logger.info(f"記事生成開始: {product['product_id']}")
+                started = time.monotonic()
+                response = await self.aclient.chat.completions.with_raw_response.create(**self._request_kwargs(messages))
+            return self._finish_generation(response, started, cache_key)
+        except MalformedResponseError:
+            raise
+        except Exception as e:
+            logger.error(f"OpenAI APIエラー: {e}")
+            raise
+
+    async def _agenerate_streaming(self, messages: list[dict[str, Any]], cache_key: str, product_id: str) -> dict:
+        """_generate_streaming の非同期版"""
+        last_error: JSONStreamError | None = None
+        for attempt in range(1, self.stream_attempts + 1):
+            async with self._async_in_flight:
+                logger.info(f"記事生成開始: {product_id}")
+                started = time.monotonic()
+                try:
+                    raw_response, usage, request_id = await self._astream_completion(messages)
+                except JSONStreamError as e:
+                    self._record_stream_abort(product_id, e, attempt, started)
+                    last_error = e
+                    continue
+                except Exception as e:
+                    logger.error(f"OpenAI APIエラー: {e}")
+                    raise
+            return self._complete_generation(raw_response, usage, started, cache_key, request_id)
+        raise MalformedResponseError(f"AI応答のJSONが不正です: {last_error}") from last_error
+
+    async def _astream_completion(self, messages: list[dict[str, Any]]) -> tuple[str, Any, str | None]:
+        checker = StreamingJSONChecker()
+        parts: list[str] = []
+        usage = None
+        stream = await self.aclient.chat.completions.create(**self._request_kwargs(messages), **self.STREAM_KWARGS)
+        try:
+            async for chunk in stream:
+                usage = self._consume_chunk(chunk, checker, parts) or usage
+            checker.finish()
+        finally:
+            await stream.close()
+        return "".join(parts), usage, self._stream_request_id(stream)
+
+    async def generate_many(self, requests: Iterable[GenerationRequest]) -> list[dict | BaseException]:
+        """
+        複数件を同時に生成する（同時実行数は max_in_flight まで）
+        結果は requests と同じ順で、失敗した件は例外オブジェクトを返す。
+        """
+        tasks = [
+            self.agenerate_article(r.product, r.sample_image_urls, site_info=r.site_info, use_cache=r.use_cache)
+            for r in requests
+        ]
+        started = time.monotonic()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        failed = sum(1 for r in results if isinstance(r, BaseException))
+        logger.info(
+            f"一括生成完了: {len(results)}件 (失敗 {failed}件), {time.monotonic() - started:.1f}秒, "
+            f"同時実行数={self.max_in_flight}"
+        )
+        return results
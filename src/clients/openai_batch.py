@@ -0,0 +1,178 @@
+"""
+OpenAI Batch APIによる記事の事前生成
+
+1日分の候補（サイト×商品）のプロンプトをまとめてBatch API用のJSONLにし、投入・完了待ち・結果取り込みを行う。
+結果は OpenAIClient の生成結果キャッシュ（同期生成と同じキー）へ保存するため、
+投稿時の run_batch.py はキャッシュから記事を取り出して描画・投稿するだけになる。
+"""
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from src.clients.openai import OpenAIClient
+from src.core.models import Product
+from src.processor.validator import Validator
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# 完了扱いのステータス（expired/cancelled でも途中までの結果は取り込める）
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class BatchEntry:
+    """事前生成する1件（サイト×商品）"""
+    site: str
+    product: Product
+    scene_image_urls: list[str]
+    site_info: Any = None
+
+    @property
+    def custom_id(self) -> str:
+        return f"{self.site}:{self.product.product_id}"
+
+
+class OpenAIBatchRunner:
+    """Batch APIへの投入と結果の取り込み（投入済みバッチの状態は state_dir にJSONで保存）"""
+
+    def __init__(self, llm_client: OpenAIClient, state_dir: Path, validator: Validator | None = None):
+        if llm_client.cache is None:
+            raise ValueError("事前生成には生成結果キャッシュ付きの OpenAIClient が必要です")
+        self.llm_client = llm_client
+        self.client = llm_client.client
+        self.state_dir = state_dir
+        # 取り込み時の検品（不合格の記事はキャッシュせず、次回の投入で生成し直す）
+        self.validator = validator
+
+    def _state_path(self, batch_id: str) -> Path:
+        return self.state_dir / f"{batch_id}.json"
+
+    def _load_state(self, batch_id: str) -> dict[str, Any]:
+        with open(self._state_path(batch_id), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state: dict[str, Any]) -> None:
+        path = self._state_path(state["batch_id"])
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        tmp.replace(path)
+
+    def pending_batches(self) -> list[str]:
+        """投入済みで結果を取り込んでいないバッチID"""
+        if not self.state_dir.exists():
+            return []
+        pending = []
+        for path in sorted(self.state_dir.glob("*.json")):
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if not state.get("collected_at"):
+                pending.append(state["batch_id"])
+        return pending
+
+    def submit(self, entries: list[BatchEntry], completion_window: str = "24h") -> str | None:
+        """JSONLを作成して投入し、バッチIDを返す（対象が無ければNone）"""
+        if not entries:
+            logger.info("事前生成の対象がありません")
+            return None
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        input_path = self.state_dir / f"input-{stamp}.jsonl"
+        requests: dict[str, str] = {}
+        with open(input_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                if entry.custom_id in requests:
+                    continue
+                messages = self.llm_client.build_messages(entry.product, entry.scene_image_urls, entry.site_info)
+                requests[entry.custom_id] = self.llm_client.cache_key(messages, entry.site_info)
+                line = {
+                    "custom_id": entry.custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": self.llm_client.build_request_body(messages),
+                }
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=completion_window,
+        )
+        self._save_state({
+            "batch_id": batch.id,
+            "input_file_id": input_file.id,
+            "input_path": str(input_path),
+            "model": self.llm_client.model,
+            "submitted_at": datetime.now(timezone.utc).isoformat(),
+            "requests": requests,
+            "collected_at": None,
+        })
+        logger.info(f"Batch投入: id={batch.id}, {len(requests)}件 ({input_path.name})")
+        return batch.id
+
+    def wait(self, batch_id: str, poll_interval: float = 30.0, timeout: float | None = None) -> Any:
+        """バッチが完了（または失敗/期限切れ）するまで待つ。timeout を過ぎたら途中の状態を返す"""
+        started = time.monotonic()
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            progress = f"{counts.completed + counts.failed}/{counts.total}" if counts else "-"
+            logger.info(f"Batch状態: id={batch_id}, status={batch.status}, 進捗={progress}")
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            if timeout is not None and time.monotonic() - started >= timeout:
+                return batch
+            time.sleep(max(poll_interval, 0.1))
+
+    def collect(self, batch_id: str) -> dict[str, int] | None:
+        """
+        完了したバッチの結果を生成結果キャッシュへ取り込む（未完了ならNone）
+        結果は {サイト:商品ID} → キャッシュキー の対応で保存し、投稿時の同期生成と同じキーで引ける。
+        """
+        state = self._load_state(batch_id)
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in TERMINAL_STATUSES:
+            logger.info(f"Batch未完了: id={batch_id}, status={batch.status}")
+            return None
+
+        counts = {"stored": 0, "failed": 0, "invalid": 0, "unknown": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        output_file_id = getattr(batch, "output_file_id", None)
+        if output_file_id:
+            text = self.client.files.content(output_file_id).text
+            for line in text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                cache_key = state["requests"].get(record.get("custom_id"))
+                if cache_key is None:
+                    counts["unknown"] += 1
+                    continue
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    counts["failed"] += 1
+                    continue
+                usage = response["body"].get("usage") or {}
+                counts["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                counts["cached_tokens"] += (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+                raw_response = response["body"]["choices"][0]["message"]["content"]
+                if self.llm_client.store_article(cache_key, raw_response, validator=self.validator):
+                    counts["stored"] += 1
+                else:
+                    counts["invalid"] += 1
+        error_file_id = getattr(batch, "error_file_id", None)
+        if error_file_id:
+            counts["failed"] += sum(1 for line in self.client.files.content(error_file_id).text.splitlines() if line.strip())
+
+        state["collected_at"] = datetime.now(timezone.utc).isoformat()
+        state["status"] = batch.status
+        state["result"] = counts
+        self._save_state(state)
+        logger.info(f"Batch結果取り込み: id={batch_id}, status={batch.status}, {counts}")
+        return counts
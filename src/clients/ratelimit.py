@@ -0,0 +1,291 @@
+"""
+外部APIのレート制限 - ホスト単位のトークンバケット + 同時実行数上限 + 429/503からの適応的バックオフ
+
+429を受けてから Retry-After 秒眠る（事後対応）のではなく、
+- トークンバケットで送信ペースを事前に抑え、
+- 429/503 を受けたら同じホストへの送信全体を一時停止してレートを下げ、
+- 成功が続いたら設定レートまで少しずつ戻す（AIMD）
+ことで、並列実行時も上限付近で安定して送信する。
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Iterator
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 適応的バックオフの対象（送信ペースを落とすべき応答）
+THROTTLE_STATUSES = (429, 503)
+# 再試行する応答
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class RateLimit:
+    """ホストごとの上限設定"""
+    rate: float  # 1秒あたりのリクエスト数
+    burst: int = 1  # バケット容量（連続送信できる数）
+    max_in_flight: int | None = None  # 同時実行数（Noneで無制限）
+
+
+# ホスト名（末尾一致）ごとの既定値。未登録ホストは DEFAULT_LIMIT を使う
+DEFAULT_LIMITS: dict[str, RateLimit] = {
+    "api.dmm.com": RateLimit(rate=5.0, burst=5, max_in_flight=4),
+    "dmm.co.jp": RateLimit(rate=10.0, burst=10, max_in_flight=8),
+    "av-kantei.com": RateLimit(rate=8.0, burst=8, max_in_flight=4),
+}
+DEFAULT_LIMIT = RateLimit(rate=5.0, burst=5, max_in_flight=None)
+
+
+class TokenBucket:
+    """スレッドセーフなトークンバケット（レートは実行中に変更できる）"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 0.01)
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """トークンを取得するまで待つ（待った秒数を返す）"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                wait_for = (tokens - self._tokens) / self.rate
+            time.sleep(wait_for)
+            waited += wait_for
+
+    def drain(self) -> None:
+        """手持ちのトークンを捨てる（バックオフ明けに一斉送信しないため）"""
+        with self._lock:
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+
+class HostLimiter:
+    """1ホスト分の制限（トークンバケット・同時実行数・適応的バックオフ）"""
+
+    # 429/503 を受けたときのレート倍率と下限、成功時の回復量
+    DECREASE_FACTOR = 0.5
+    MIN_RATE_FACTOR = 0.1
+    RECOVERY_PER_SUCCESS = 0.05
+    BASE_BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, host: str, limit: RateLimit):
+        self.host = host
+        self.limit = limit
+        self.bucket = TokenBucket(limit.rate, limit.burst)
+        # 同時実行数（上限は reconfigure で実行中に変えられるよう、セマフォではなく件数と条件変数で管理）
+        self._active = 0
+        self._slot_cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._backoff = self.BASE_BACKOFF
+        self.stats = {"requests": 0, "throttled": 0, "waited_seconds": 0.0}
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """送信枠を確保する（バックオフ中は解除まで待ち、同時実行数とレートを守る）"""
+        while True:
+            with self._lock:
+                pause = self._blocked_until - time.monotonic()
+            if pause <= 0:
+                break
+            time.sleep(pause)
+            with self._lock:
+                self.stats["waited_seconds"] += pause
+        with self._slot_cond:
+            while self.limit.max_in_flight and self._active >= self.limit.max_in_flight:
+                self._slot_cond.wait()
+            self._active += 1
+        try:
+            waited = self.bucket.acquire()
+            with self._lock:
+                self.stats["waited_seconds"] += waited
+                self.stats["requests"] += 1
+            yield
+        finally:
+            with self._slot_cond:
+                self._active -= 1
+                self._slot_cond.notify()
+
+    def reconfigure(self, limit: RateLimit) -> None:
+        """上限をその場で変更する（同じホストのリミッタを作り直すと制限が二重になるため）"""
+        with self._lock:
+            old_rate = self.limit.rate
+            self.limit = limit
+            # バックオフで下げている最中なら、その比率を保ったまま新しいレートに合わせる
+            factor = self.bucket.rate / old_rate if old_rate > 0 else 1.0
+            self.bucket.rate = max(limit.rate * min(factor, 1.0), 0.01)
+            self.bucket.capacity = max(limit.burst, 1)
+        with self._slot_cond:
+            self._slot_cond.notify_all()
+
+    def on_throttled(self, retry_after: float | None = None) -> float:
+        """429/503 を受けたとき: ホスト全体を一時停止し、レートを下げる（停止秒数を返す）"""
+        with self._lock:
+            if retry_after is None:
+                pause = self._backoff * (1 + random.random() * 0.25)
+                self._backoff = min(self._backoff * 2, self.MAX_BACKOFF)
+            else:
+                pause = min(retry_after, self.MAX_BACKOFF * 5)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+            floor = self.limit.rate * self.MIN_RATE_FACTOR
+            self.bucket.rate = max(self.bucket.rate * self.DECREASE_FACTOR, floor)
+            self.stats["throttled"] += 1
+        self.bucket.drain()
+        logger.warning(f"レート制限検知: host={self.host}, {pause:.1f}秒停止, rate={self.bucket.rate:.2f}/s")
+        return pause
+
+    def on_success(self) -> None:
+        """成功時: 設定レートまで少しずつ戻す"""
+        with self._lock:
+            self._backoff = self.BASE_BACKOFF
+            if self.bucket.rate < self.limit.rate:
+                step = self.limit.rate * self.RECOVERY_PER_SUCCESS
+                self.bucket.rate = min(self.bucket.rate + step, self.limit.rate)
+
+
+class RateLimiterRegistry:
+    """プロセス内で共有するホスト別リミッタの登録簿"""
+
+    def __init__(self, limits: dict[str, RateLimit] | None = None, default: RateLimit = DEFAULT_LIMIT):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.default = default
+        self._limiters: dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def _limit_for(self, host: str) -> RateLimit:
+        for suffix in sorted(self.limits, key=len, reverse=True):
+            if host == suffix or host.endswith("." + suffix):
+                return self.limits[suffix]
+        return self.default
+
+    def for_host(self, host: str) -> HostLimiter:
+        host = host.lower()
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = HostLimiter(host, self._limit_for(host))
+                self._limiters[host] = limiter
+            return limiter
+
+    def for_url(self, url: str) -> HostLimiter:
+        return self.for_host(urlparse(url).netloc or url)
+
+    def configure(
+        self,
+        host: str,
+        rate: float | None = None,
+        burst: int | None = None,
+        max_in_flight: int | None = None,
+    ) -> HostLimiter:
+        """ホストの上限を上書きする（未指定の項目は現在の設定を引き継ぐ。登録済みのリミッタはその場で更新）"""
+        host = host.lower()
+        with self._lock:
+            base = self._limit_for(host)
+            limit = RateLimit(
+                rate=rate if rate is not None else base.rate,
+                burst=burst if burst is not None else base.burst,
+                max_in_flight=max_in_flight if max_in_flight is not None else base.max_in_flight,
+            )
+            self.limits[host] = limit
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = HostLimiter(host, limit)
+                self._limiters[host] = limiter
+            else:
+                # 既に渡したリミッタを使っているクライアントがあるため、差し替えずに設定だけ更新する
+                limiter.reconfigure(limit)
+            return limiter
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                host: {**limiter.stats, "rate": round(limiter.bucket.rate, 2)}
+                for host, limiter in self._limiters.items()
+            }
+
+
+_registry = RateLimiterRegistry()
+
+
+def get_rate_limiter() -> RateLimiterRegistry:
+    """プロセス共通のリミッタ登録簿を取得"""
+    return _registry
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After ヘッダ（秒数 または HTTP日付）を秒数に変換"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def send_with_limits(
+    session: Any,
+    method: str,
+    url: str,
+    *,
+    limiter: HostLimiter | None = None,
+    max_attempts: int = 4,
+    retry_statuses: tuple[int, ...] | set[int] = RETRY_STATUSES,
+    backoff: float = 1.0,
+    **kwargs,
+) -> requests.Response:
+    """
+    ホスト別リミッタの枠内で送信し、429/503 は適応的バックオフ、その他の5xx/通信エラーは指数バックオフで再試行する。
+    試行回数を使い切った場合は最後のレスポンスを返す（通信エラーのみの場合は例外を送出）。
+    session は requests.Session か requests モジュール（.request を持つもの）。
+    """
+    limiter = limiter or _registry.for_url(url)
+    attempts = max(max_attempts, 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            with limiter.slot():
+                response = session.request(method, url, **kwargs)
+        except requests.RequestException as exc:
+            if attempt == attempts:
+                raise
+            wait_for = backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.25)
+            logger.warning(f"{method} {url} failed (attempt {attempt}/{attempts}): {exc} {wait_for:.1f}秒後に再試行")
+            time.sleep(wait_for)
+            continue
+
+        if response.status_code in THROTTLE_STATUSES:
+            limiter.on_throttled(parse_retry_after(response.headers.get("Retry-After")))
+        elif response.status_code < 500:
+            limiter.on_success()
+
+        if response.status_code not in retry_statuses or attempt == attempts:
+            return response
+        logger.warning(f"{method} {url} -> {response.status_code} (attempt {attempt}/{attempts})")
+        if response.status_code not in THROTTLE_STATUSES:
+            # 429/503 は次の slot() でホスト単位に待つので、ここでは他の5xxだけ待つ
+            time.sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random() * 0.25))
+    return response
@@ -3,20 +3,25 @@ WordPress REST APIクライアント
 """
 import base64
 import logging
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Iterator
 from pathlib import Path
 import re
 import html as _html
-from urllib.parse import unquote as _url_unquote
+from urllib.parse import unquote as _url_unquote, urlparse
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from src.clients.ratelimit import THROTTLE_STATUSES, get_rate_limiter, send_with_limits
+
 logger = logging.getLogger(__name__)
 
-class WPClient:
-    """WordPress REST APIクライアント"""
+class FanzaIdExtractor:
+    """WP投稿データからFANZA商品IDを抽出する共通処理（同期/非同期クライアント共用）"""
 
     # Require at least one letter + one digit; must end with a digit (avoid dates like 2026-01-30)
     _FANZA_ID_RE = re.compile(r"(?i)(?=[0-9a-z_-]*[a-z])(?=[0-9a-z_-]*\d)[0-9a-z_]+(?:-[0-9a-z_]+)*\d$")
@@ -26,47 +31,6 @@ class WPClient:
         re.compile(r"(?i)cid%3d([A-Za-z0-9_\\-]+)"),
         re.compile(r"(?i)content_id=([A-Za-z0-9_\\-]+)"),
     )
-    
-    def __init__(
-        self,
-        base_url: str,
-        username: str,
-        app_password: str,
-    ):
-        self.base_url = base_url.rstrip("/")
-        self.api_url = f"{self.base_url}/wp-json/wp/v2"
-        
-        # Basic認証ヘッダー
-        credentials = f"{username}:{app_password}"
-        masked_password = app_password[:4] + "***" if app_password else "None"
-        logger.info(f"WP Auth Init: user={username}, password_prefix={masked_password}")
-        encoded = base64.b64encode(credentials.encode()).decode()
-        self.auth_header = f"Basic {encoded}"
-        
-        # リトライ設定付きセッション
-        self.session = requests.Session()
-        # User-Agentをブラウザ風に偽装 (Mixhost/WAF対策)
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "application/json"
-        })
-        
-        retry_strategy = Retry(
-            total=2,  # 最大2回リトライ
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["GET", "POST"],
-        )
-        self.timeout = 20  # タイムアウト20秒
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
-        
-        # カテゴリ/タグのキャッシュ
-        self._category_cache: dict[str, int] = {}
-        self._tag_cache: dict[str, int] = {}
-        self._posted_fanza_ids_cache: set[str] | None = None
-        self._posted_fanza_ids_cache_at: float = 0.0
 
     @classmethod
     def _extract_fanza_id_from_slug(cls, slug: str) -> str | None:
@@ -145,6 +109,109 @@ class WPClient:
             fanza_id = self._extract_fanza_id_from_text(rendered_excerpt)
         return str(fanza_id).lower() if fanza_id else None
 
+    def _strip_html(self, value: str) -> str:
+        return re.sub(r"<[^>]+>", "", value or "").strip()
+
+    @staticmethod
+    def _related_weights(priority: list[str] | None) -> list[tuple[str, int]]:
+        """関連記事の優先順位キーと重み（先頭ほど重い）"""
+        order = priority or ["same_actress", "tags", "same_category"]
+        weight_base = len(order) + 1
+        return [(key, weight_base - idx) for idx, key in enumerate(order)]
+
+    def _rank_related_posts(
+        self,
+        batches: list[tuple[list[dict], int]],
+        limit: int = 6,
+        exclude_fanza_id: str | None = None,
+    ) -> list[dict]:
+        """取得済み投稿を重み付きでスコアリングし、title/linkのリストにする"""
+        scored: dict[int, dict] = {}
+        for posts, weight in batches:
+            for post in posts:
+                post_id = post.get("id")
+                if not post_id:
+                    continue
+                if exclude_fanza_id:
+                    fanza_id = self.extract_fanza_id(post)
+                    if fanza_id and fanza_id == exclude_fanza_id:
+                        continue
+                entry = scored.get(post_id)
+                if not entry:
+                    scored[post_id] = {"post": post, "score": weight}
+                else:
+                    entry["score"] += weight
+
+        items = list(scored.values())
+        items.sort(key=lambda x: (x["score"], x["post"].get("date", "")), reverse=True)
+        results: list[dict] = []
+        for item in items:
+            post = item["post"]
+            title = post.get("title", {}).get("rendered", "")
+            title = self._strip_html(_html.unescape(title)) if isinstance(title, str) else ""
+            link = post.get("link", "")
+            if not title or not link:
+                continue
+            results.append({"title": title, "link": link})
+            if len(results) >= limit:
+                break
+        return results
+
+
+class WPClient(FanzaIdExtractor):
+    """WordPress REST APIクライアント"""
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        app_password: str,
+        max_in_flight: int | None = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/wp-json/wp/v2"
+        
+        # Basic認証ヘッダー
+        credentials = f"{username}:{app_password}"
+        masked_password = app_password[:4] + "***" if app_password else "None"
+        logger.info(f"WP Auth Init: user={username}, password_prefix={masked_password}")
+        encoded = base64.b64encode(credentials.encode()).decode()
+        self.auth_header = f"Basic {encoded}"
+        
+        # リトライ設定付きセッション
+        self.session = requests.Session()
+        # User-Agentをブラウザ風に偽装 (Mixhost/WAF対策)
+        self.session.headers.update({
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Accept": "application/json"
+        })
+        
+        retry_strategy = Retry(
+            total=2,  # 最大2回リトライ
+            backoff_factor=1,
+            # 429/503 はレートリミッタ側で送信ペースを落として再試行する
+            status_forcelist=[500, 502, 504],
+            allowed_methods=["GET", "POST"],
+        )
+        self.timeout = 20  # タイムアウト20秒
+        # ホスト単位のトークンバケットと同時リクエスト数の上限（max_in_flight指定時はその値で上書き）
+        self.max_in_flight = max_in_flight
+        host = urlparse(self.base_url).netloc
+        registry = get_rate_limiter()
+        self.limiter = registry.configure(host, max_in_flight=max_in_flight) if max_in_flight else registry.for_host(host)
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=max(10, max_in_flight or 0))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # カテゴリ/タグのキャッシュ
+        self._category_cache: dict[str, int] = {}
+        self._tag_cache: dict[str, int] = {}
+        self._posted_fanza_ids_cache: set[str] | None = None
+        self._posted_fanza_ids_cache_at: float = 0.0
+        # 並列ワーカーが同名のカテゴリ/タグを二重作成しないようにする
+        self._taxonomy_lock = threading.Lock()
+        self._posted_fanza_ids_lock = threading.Lock()
+
     def iter_posts(
         self,
         status: str = "any",
@@ -153,52 +220,165 @@ class WPClient:
         after: str | None = None,
         fields: str | None = None,
         context: str | None = "edit",
+        prefetch: int = 1,
     ) -> Iterator[dict[str, Any]]:
-        """投稿一覧をページング取得（ジェネレータ）"""
-        page = 1
-        total_pages = None
-        while True:
-            if max_pages is not None and page > max_pages:
-                break
-
-            params: dict[str, Any] = {
-                "per_page": per_page,
-                "page": page,
-                "status": status,
-            }
-            if fields:
-                params["_fields"] = fields
-            if after:
-                params["after"] = after
-
-            if context:
-                response = self._request("GET", "posts", params={**params, "context": context})
-                if response.status_code in (401, 403, 404):
-                    response = self._request("GET", "posts", params=params)
-            else:
-                response = self._request("GET", "posts", params=params)
+        """
+        投稿一覧をページング取得（ジェネレータ）
+        prefetch>1 の場合、X-WP-TotalPages 判明後に残りページを最大prefetch件ずつ並行取得する。
+        投稿はページ順に返し、先読みはprefetchページ分までに抑える。
+        """
+        base_params: dict[str, Any] = {
+            "per_page": per_page,
+            "status": status,
+        }
+        if fields:
+            base_params["_fields"] = fields
+        if after:
+            base_params["after"] = after
+
+        if max_pages is not None and max_pages < 1:
+            return
+        posts, total_pages = self._fetch_posts_page(1, base_params, context)
+        if posts is None:
+            return
+        yield from posts
+        if len(posts) < per_page:
+            return
+
+        last_page = total_pages or None
+        if max_pages is not None:
+            last_page = min(last_page, max_pages) if last_page else max_pages
+
+        if prefetch <= 1 or not last_page:
+            page = 2
+            while last_page is None or page <= last_page:
+                posts, _ = self._fetch_posts_page(page, base_params, context)
+                if posts is None:
+                    break
+                yield from posts
+                if len(posts) < per_page:
+                    break
+                page += 1
+            return
+
+        # 並行先読み: ページ順に消費しつつ、ウィンドウ内の後続ページを取得しておく
+        executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="wp-pages")
+        pending: deque[Future] = deque()
+        next_page = 2
+        try:
+            while next_page <= last_page and len(pending) < prefetch:
+                pending.append(executor.submit(self._fetch_posts_page, next_page, base_params, context))
+                next_page += 1
+            while pending:
+                posts, _ = pending.popleft().result()
+                if posts is None:
+                    break
+                if next_page <= last_page:
+                    pending.append(executor.submit(self._fetch_posts_page, next_page, base_params, context))
+                    next_page += 1
+                yield from posts
+                if len(posts) < per_page:
+                    break
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def iter_posted_fanza_ids(
+        self,
+        status: str = "any",
+        per_page: int = 100,
+        max_pages: int | None = None,
+        after: str | None = None,
+        prefetch: int = 1,
+    ) -> Iterator[tuple[str, int | None]]:
+        """
+        既存投稿の (FANZA ID, 投稿ID) を段階的に抽出する（ジェネレータ）
+        1段目: id,slug,meta のみ取得して meta/slug から解決
+        2段目: 未解決の投稿だけ include= でまとめて本文を取得し cid 等から解決
+        本文(~25KB/件)の転送を未解決分に限定するための軽量モード。
+        """
+        unresolved: list[int] = []
+        scanned = 0
+        resolved_light = 0
+        for post in self.iter_posts(
+            status=status,
+            per_page=per_page,
+            max_pages=max_pages,
+            after=after,
+            fields="id,slug,meta",
+            context="edit",
+            prefetch=prefetch,
+        ):
+            scanned += 1
+            fanza_id = self.extract_fanza_id(post)
+            if fanza_id:
+                resolved_light += 1
+                yield fanza_id, post.get("id")
+            elif post.get("id"):
+                unresolved.append(post["id"])
+
+        resolved_content = 0
+        batches = [unresolved[i:i + per_page] for i in range(0, len(unresolved), per_page)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(prefetch, 1), thread_name_prefix="wp-content") as executor:
+                for posts in executor.map(lambda ids: self._fetch_posts_content(ids, status), batches):
+                    for post in posts:
+                        content = post.get("content", {})
+                        rendered = content.get("rendered", "") if isinstance(content, dict) else str(content or "")
+                        fanza_id = self._extract_fanza_id_from_content(rendered)
+                        if fanza_id:
+                            resolved_content += 1
+                            yield fanza_id, post.get("id")
 
-            if response.status_code == 400:
-                break
-            response.raise_for_status()
-            posts = response.json()
-            if not posts or not isinstance(posts, list):
-                break
+        logger.info(
+            f"FANZA ID段階抽出: scanned={scanned}, meta/slug={resolved_light}, "
+            f"content={resolved_content}/{len(unresolved)} (本文取得 {len(batches)}リクエスト)"
+        )
 
-            for post in posts:
-                yield post
+    def _fetch_posts_content(self, post_ids: list[int], status: str = "any") -> list[dict[str, Any]]:
+        """指定IDの投稿本文(rendered)のみをまとめて取得"""
+        params: dict[str, Any] = {
+            "include": ",".join(str(pid) for pid in post_ids),
+            "per_page": len(post_ids),
+            "status": status,
+            "_fields": "id,content.rendered",
+        }
+        response = self._request("GET", "posts", params={**params, "context": "edit"})
+        if response.status_code in (401, 403, 404):
+            response = self._request("GET", "posts", params=params)
+        if response.status_code == 400:
+            return []
+        response.raise_for_status()
+        posts = response.json()
+        return posts if isinstance(posts, list) else []
 
-            if total_pages is None:
-                try:
-                    total_pages = int(response.headers.get("X-WP-TotalPages", "0") or 0)
-                except Exception:
-                    total_pages = 0
+    def _fetch_posts_page(
+        self,
+        page: int,
+        base_params: dict[str, Any],
+        context: str | None,
+    ) -> tuple[list[dict[str, Any]] | None, int]:
+        """投稿一覧の1ページを取得。(投稿リスト or 終端ならNone, X-WP-TotalPages) を返す"""
+        params = {**base_params, "page": page}
+        if context:
+            response = self._request("GET", "posts", params={**params, "context": context})
+            if response.status_code in (401, 403, 404):
+                response = self._request("GET", "posts", params=params)
+        else:
+            response = self._request("GET", "posts", params=params)
 
-            if total_pages and page >= total_pages:
-                break
-            if len(posts) < per_page:
-                break
-            page += 1
+        if response.status_code == 400:
+            return None, 0
+        response.raise_for_status()
+        posts = response.json()
+        if not posts or not isinstance(posts, list):
+            return None, 0
+        try:
+            total_pages = int(response.headers.get("X-WP-TotalPages", "0") or 0)
+        except Exception:
+            total_pages = 0
+        return posts, total_pages
     
     def _request(
         self,
@@ -211,38 +391,32 @@ class WPClient:
         headers = kwargs.pop("headers", {})
         headers["Authorization"] = self.auth_header
         
-        response = self.session.request(
-            method,
-            url,
-            headers=headers,
-            timeout=self.timeout,
-            **kwargs,
-        )
+        response = self._send(method, url, headers=headers, **kwargs)
 
         # Fallback for sites where /wp-json rewrite is broken.
         if response.status_code == 404:
             fallback_url = f"{self.base_url}/?rest_route=/wp/v2/{endpoint.lstrip('/')}"
-            response = self.session.request(
-                method,
-                fallback_url,
-                headers=headers,
-                timeout=self.timeout,
-                **kwargs,
-            )
+            response = self._send(method, fallback_url, headers=headers, **kwargs)
 
         # エラー詳細調査用ログ
         if response.status_code >= 400:
             logger.error(f"API Error: {method} {url} -> {response.status_code}")
             logger.error(f"Response Body: {response.text}")
         
-        # 429エラー時はRetry-Afterを尊重
-        if response.status_code == 429:
-            retry_after = int(response.headers.get("Retry-After", 60))
-            logger.warning(f"WP APIレート制限。{retry_after}秒待機...")
-            time.sleep(retry_after)
-            return self._request(method, endpoint, headers=headers, **kwargs)
-        
         return response
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        """レート制限の枠内でHTTPリクエストを送信（429/503はRetry-Afterと適応的バックオフで再試行）"""
+        return send_with_limits(
+            self.session,
+            method,
+            url,
+            limiter=self.limiter,
+            max_attempts=4,
+            retry_statuses=THROTTLE_STATUSES,
+            timeout=self.timeout,
+            **kwargs,
+        )
     
     def create_post(
         self,
@@ -298,30 +472,42 @@ class WPClient:
         after: str | None = None,
     ) -> set[str]:
         """既存投稿からFANZA商品IDを取得"""
-        if use_cache and after is None and self._posted_fanza_ids_cache is not None:
-            if (time.time() - self._posted_fanza_ids_cache_at) < cache_ttl_seconds:
-                return set(self._posted_fanza_ids_cache)
+        if after is not None:
+            # 差分取得はキャッシュしない
+            return self._scan_posted_fanza_ids(per_page, max_pages, after)
+        cached = self._fresh_posted_fanza_ids(cache_ttl_seconds) if use_cache else None
+        if cached is not None:
+            return cached
+        # 並列ワーカーがキャッシュ切れで同時に全件走査しないよう、走査は1本にまとめる
+        with self._posted_fanza_ids_lock:
+            cached = self._fresh_posted_fanza_ids(cache_ttl_seconds) if use_cache else None
+            if cached is not None:
+                return cached
+            posted_ids = self._scan_posted_fanza_ids(per_page, max_pages, None)
+            self._posted_fanza_ids_cache = set(posted_ids)
+            self._posted_fanza_ids_cache_at = time.time()
+            return posted_ids
 
+    def _fresh_posted_fanza_ids(self, cache_ttl_seconds: int) -> set[str] | None:
+        cache = self._posted_fanza_ids_cache
+        if cache is not None and (time.time() - self._posted_fanza_ids_cache_at) < cache_ttl_seconds:
+            return set(cache)
+        return None
+
+    def _scan_posted_fanza_ids(self, per_page: int, max_pages: int | None, after: str | None) -> set[str]:
         posted_ids: set[str] = set()
         try:
-            for post in self.iter_posts(
+            for fanza_id, _ in self.iter_posted_fanza_ids(
                 status="any",
                 per_page=per_page,
                 max_pages=max_pages,
                 after=after,
-                fields="id,slug,meta,content",
-                context="edit",
             ):
-                fanza_id = self.extract_fanza_id(post)
-                if fanza_id:
-                    posted_ids.add(fanza_id)
+                posted_ids.add(fanza_id)
         except Exception as e:
             logger.warning(f"WP投稿取得エラー: {e}")
 
         logger.info(f"WordPress投稿済みID抽出結果: {len(posted_ids)}件")
-        if after is None:
-            self._posted_fanza_ids_cache = set(posted_ids)
-            self._posted_fanza_ids_cache_at = time.time()
         return posted_ids
 
     def check_post_exists_by_slug(self, product_id: str) -> bool:
@@ -439,9 +625,6 @@ class WPClient:
         response.raise_for_status()
         return response.json()
 
-    def _strip_html(self, value: str) -> str:
-        return re.sub(r"<[^>]+>", "", value or "").strip()
-
     def get_posts_by_tags(self, tag_ids: list[int], limit: int = 20) -> list[dict]:
         if not tag_ids:
             return []
@@ -477,46 +660,13 @@ class WPClient:
         # Score related posts by priority order.
         tag_ids = tag_ids or []
         category_ids = category_ids or []
-        order = priority or ["same_actress", "tags", "same_category"]
-        weight_base = len(order) + 1
-        scored: dict[int, dict] = {}
-
-        def add_posts(posts: list[dict], weight: int) -> None:
-            for post in posts:
-                post_id = post.get("id")
-                if not post_id:
-                    continue
-                if exclude_fanza_id:
-                    fanza_id = self.extract_fanza_id(post)
-                    if fanza_id and fanza_id == exclude_fanza_id:
-                        continue
-                entry = scored.get(post_id)
-                if not entry:
-                    scored[post_id] = {"post": post, "score": weight}
-                else:
-                    entry["score"] += weight
-
-        for idx, key in enumerate(order):
-            weight = weight_base - idx
+        batches: list[tuple[list[dict], int]] = []
+        for key, weight in self._related_weights(priority):
             if "actress" in key or "tag" in key or "tags" in key:
-                add_posts(self.get_posts_by_tags(tag_ids, limit=20), weight)
+                batches.append((self.get_posts_by_tags(tag_ids, limit=20), weight))
             elif "category" in key:
-                add_posts(self.get_posts_by_categories(category_ids, limit=20), weight)
-
-        items = list(scored.values())
-        items.sort(key=lambda x: (x["score"], x["post"].get("date", "")), reverse=True)
-        results: list[dict] = []
-        for item in items:
-            post = item["post"]
-            title = post.get("title", {}).get("rendered", "")
-            title = self._strip_html(_html.unescape(title)) if isinstance(title, str) else ""
-            link = post.get("link", "")
-            if not title or not link:
-                continue
-            results.append({"title": title, "link": link})
-            if len(results) >= limit:
-                break
-        return results
+                batches.append((self.get_posts_by_categories(category_ids, limit=20), weight))
+        return self._rank_related_posts(batches, limit=limit, exclude_fanza_id=exclude_fanza_id)
 
     def update_post(self, post_id: int, data: dict) -> dict:
         """投稿を更新"""
@@ -579,6 +729,12 @@ class WPClient:
     
     def get_or_create_category(self, name: str) -> int:
         """カテゴリを取得または作成"""
+        if name in self._category_cache:
+            return self._category_cache[name]
+        with self._taxonomy_lock:
+            return self._get_or_create_category_locked(name)
+
+    def _get_or_create_category_locked(self, name: str) -> int:
         if name in self._category_cache:
             return self._category_cache[name]
         response = self._request("GET", "categories", params={"search": name})
@@ -597,6 +753,12 @@ class WPClient:
     
     def get_or_create_tag(self, name: str) -> int:
         """タグを取得または作成"""
+        if name in self._tag_cache:
+            return self._tag_cache[name]
+        with self._taxonomy_lock:
+            return self._get_or_create_tag_locked(name)
+
+    def _get_or_create_tag_locked(self, name: str) -> int:
         if name in self._tag_cache:
             return self._tag_cache[name]
         response = self._request("GET", "tags", params={"search": name})
@@ -0,0 +1,346 @@
+"""
+WordPress REST API非同期クライアント（httpx.AsyncClientベース）
+"""
+import asyncio
+import base64
+import logging
+from pathlib import Path
+from typing import Any, AsyncIterator
+from urllib.parse import urlparse
+
+import httpx
+
+from src.clients.wordpress import FanzaIdExtractor
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def create_http_client(max_connections: int = 200, max_keepalive: int = 50, timeout: float = 20.0) -> httpx.AsyncClient:
+    """
+    複数サイトで共有するHTTP/1.1 keep-aliveコネクションプールを作成。
+    ホスト単位の同時実行数は各 AsyncWPClient の max_in_flight で制御する。
+    """
+    return httpx.AsyncClient(
+        http2=False,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        timeout=httpx.Timeout(timeout, connect=10.0),
+        headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            "Accept": "application/json",
+        },
+        transport=httpx.AsyncHTTPTransport(retries=2),
+    )
+
+
+class AsyncWPClient(FanzaIdExtractor):
+    """WordPress REST API非同期クライアント（WPClientと同じ操作をasyncで提供）"""
+
+    def __init__(
+        self,
+        base_url: str,
+        username: str,
+        app_password: str,
+        max_in_flight: int = 8,
+        http_client: httpx.AsyncClient | None = None,
+        max_attempts: int = 3,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/wp-json/wp/v2"
+        self.host = urlparse(self.base_url).netloc
+
+        credentials = f"{username}:{app_password}"
+        masked_password = app_password[:4] + "***" if app_password else "None"
+        logger.info(f"WP Async Auth Init: host={self.host}, user={username}, password_prefix={masked_password}")
+        encoded = base64.b64encode(credentials.encode()).decode()
+        self.auth_header = f"Basic {encoded}"
+
+        # http_client を渡した場合は共有プールとして扱い、close しない
+        self._owns_client = http_client is None
+        self.client = http_client or create_http_client()
+        self.max_in_flight = max(max_in_flight, 1)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.max_attempts = max(max_attempts, 1)
+
+        self._category_cache: dict[str, int] = {}
+        self._tag_cache: dict[str, int] = {}
+        self._taxonomy_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncWPClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """同時実行数の上限内で送信し、429/5xxはRetry-Afterを尊重して再試行"""
+        response: httpx.Response | None = None
+        for attempt in range(1, self.max_attempts + 1):
+            async with self._in_flight:
+                response = await self.client.request(method, url, **kwargs)
+            if response.status_code not in _RETRY_STATUSES or attempt == self.max_attempts:
+                return response
+            try:
+                wait = float(response.headers.get("Retry-After", attempt))
+            except ValueError:
+                wait = float(attempt)
+            logger.warning(f"WP API {response.status_code}: {method} {url} {wait}秒待機して再試行 ({attempt}/{self.max_attempts})")
+            await asyncio.sleep(wait)
+        return response
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        """APIリクエストを実行"""
+        url = f"{self.api_url}/{endpoint}"
+        headers = dict(kwargs.pop("headers", {}) or {})
+        headers["Authorization"] = self.auth_header
+
+        response = await self._send(method, url, headers=headers, **kwargs)
+
+        # Fallback for sites where /wp-json rewrite is broken.
+        if response.status_code == 404:
+            fallback_url = f"{self.base_url}/?rest_route=/wp/v2/{endpoint.lstrip('/')}"
+            response = await self._send(method, fallback_url, headers=headers, **kwargs)
+
+        if response.status_code >= 400:
+            logger.error(f"API Error: {method} {url} -> {response.status_code}")
+            logger.error(f"Response Body: {response.text}")
+        return response
+
+    async def iter_posts(
+        self,
+        status: str = "any",
+        per_page: int = 100,
+        max_pages: int | None = 5,
+        after: str | None = None,
+        fields: str | None = None,
+        context: str | None = "edit",
+    ) -> AsyncIterator[dict[str, Any]]:
+        """投稿一覧をページング取得（非同期ジェネレータ）"""
+        page = 1
+        total_pages = None
+        while True:
+            if max_pages is not None and page > max_pages:
+                break
+
+            params: dict[str, Any] = {
+                "per_page": per_page,
+                "page": page,
+                "status": status,
+            }
+            if fields:
+                params["_fields"] = fields
+            if after:
+                params["after"] = after
+
+            if context:
+                response = await self._request("GET", "posts", params={**params, "context": context})
+                if response.status_code in (401, 403, 404):
+                    response = await self._request("GET", "posts", params=params)
+            else:
+                response = await self._request("GET", "posts", params=params)
+
+            if response.status_code == 400:
+                break
+            response.raise_for_status()
+            posts = response.json()
+            if not posts or not isinstance(posts, list):
+                break
+
+            for post in posts:
+                yield post
+
+            if total_pages is None:
+                try:
+                    total_pages = int(response.headers.get("X-WP-TotalPages", "0") or 0)
+                except Exception:
+                    total_pages = 0
+
+            if total_pages and page >= total_pages:
+                break
+            if len(posts) < per_page:
+                break
+            page += 1
+
+    async def get_post(self, post_id: int) -> dict:
+        """投稿を取得"""
+        response = await self._request("GET", f"posts/{post_id}", params={"context": "edit"})
+        response.raise_for_status()
+        return response.json()
+
+    async def create_post(
+        self,
+        title: str,
+        content: str,
+        excerpt: str = "",
+        slug: str = "",
+        status: str = "draft",
+        categories: list[int] | None = None,
+        tags: list[int] | None = None,
+        featured_media: int | None = None,
+        fanza_product_id: str | None = None,
+    ) -> dict[str, Any]:
+        """投稿を作成"""
+        data: dict[str, Any] = {
+            "title": title,
+            "content": content,
+            "excerpt": excerpt,
+            "status": status,
+        }
+        if slug:
+            data["slug"] = slug
+        if categories:
+            data["categories"] = categories
+        if tags:
+            data["tags"] = tags
+        if featured_media:
+            data["featured_media"] = featured_media
+        if fanza_product_id:
+            data["meta"] = {"fanza_product_id": fanza_product_id}
+
+        logger.info(f"WP投稿作成: {title[:30]}... status={status}")
+        response = await self._request("POST", "posts", json=data)
+        response.raise_for_status()
+        result = response.json()
+        logger.info(f"投稿作成成功: id={result['id']}, link={result.get('link', '')}")
+        return result
+
+    async def update_post(self, post_id: int, data: dict) -> dict:
+        """投稿を更新"""
+        response = await self._request("POST", f"posts/{post_id}", json=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def delete_post(self, post_id: int, force: bool = False) -> dict:
+        """投稿を削除 (force=Trueで永久削除, Falseでゴミ箱)"""
+        params = {"force": "true" if force else "false"}
+        response = await self._request("DELETE", f"posts/{post_id}", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def upload_media(
+        self,
+        file_path: Path | None = None,
+        file_bytes: bytes | None = None,
+        filename: str = "image.jpg",
+        mime_type: str = "image/jpeg",
+    ) -> dict[str, Any]:
+        """メディアをアップロード"""
+        if file_path:
+            file_bytes = await asyncio.to_thread(Path(file_path).read_bytes)
+        if not file_bytes:
+            raise ValueError("file_pathまたはfile_bytesを指定してください")
+        headers = {
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Type": mime_type,
+        }
+        logger.info(f"メディアアップロード: {filename}")
+        response = await self._request("POST", "media", headers=headers, content=file_bytes)
+        response.raise_for_status()
+        result = response.json()
+        logger.info(f"メディアアップロード成功: id={result['id']}")
+        return result
+
+    async def _get_or_create_term(self, taxonomy: str, name: str, cache: dict[str, int]) -> int:
+        if name in cache:
+            return cache[name]
+        async with self._taxonomy_lock:
+            if name in cache:
+                return cache[name]
+            response = await self._request("GET", taxonomy, params={"search": name})
+            response.raise_for_status()
+            for term in response.json():
+                if term["name"].lower() == name.lower():
+                    cache[name] = term["id"]
+                    return term["id"]
+            response = await self._request("POST", taxonomy, json={"name": name})
+            response.raise_for_status()
+            term = response.json()
+            cache[name] = term["id"]
+            logger.info(f"{taxonomy}作成: {name} -> id={term['id']}")
+            return term["id"]
+
+    async def get_or_create_category(self, name: str) -> int:
+        """カテゴリを取得または作成"""
+        return await self._get_or_create_term("categories", name, self._category_cache)
+
+    async def get_or_create_tag(self, name: str) -> int:
+        """タグを取得または作成"""
+        return await self._get_or_create_term("tags", name, self._tag_cache)
+
+    async def prepare_taxonomies(
+        self,
+        genres: list[str],
+        actresses: list[str],
+    ) -> tuple[list[int], list[int]]:
+        """ジャンルと女優名からカテゴリ/タグIDを準備"""
+        category_ids = []
+        tag_ids = []
+        for genre in genres[:5]:
+            try:
+                category_ids.append(await self.get_or_create_category(genre))
+            except Exception as e:
+                logger.warning(f"カテゴリ作成失敗: {genre}, error={e}")
+        for actress in actresses[:10]:
+            try:
+                tag_ids.append(await self.get_or_create_tag(actress))
+            except Exception as e:
+                logger.warning(f"タグ作成失敗: {actress}, error={e}")
+        return category_ids, tag_ids
+
+    async def _fetch_posts(self, params: dict) -> list[dict]:
+        response = await self._request("GET", "posts", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_posts_by_tags(self, tag_ids: list[int], limit: int = 20) -> list[dict]:
+        if not tag_ids:
+            return []
+        return await self._fetch_posts({
+            "per_page": limit,
+            "tags": ",".join(str(t) for t in tag_ids),
+            "status": "publish",
+            "orderby": "date",
+            "order": "desc",
+            "context": "view",
+        })
+
+    async def get_posts_by_categories(self, category_ids: list[int], limit: int = 20) -> list[dict]:
+        if not category_ids:
+            return []
+        return await self._fetch_posts({
+            "per_page": limit,
+            "categories": ",".join(str(c) for c in category_ids),
+            "status": "publish",
+            "orderby": "date",
+            "order": "desc",
+            "context": "view",
+        })
+
+    async def find_related_posts(
+        self,
+        priority: list[str] | None,
+        tag_ids: list[int] | None,
+        category_ids: list[int] | None,
+        limit: int = 6,
+        exclude_fanza_id: str | None = None,
+    ) -> list[dict]:
+        """関連記事を優先順位でスコアリング（タグ/カテゴリ取得は並行実行）"""
+        tag_ids = tag_ids or []
+        category_ids = category_ids or []
+        weights: list[int] = []
+        fetches = []
+        for key, weight in self._related_weights(priority):
+            if "actress" in key or "tag" in key or "tags" in key:
+                fetches.append(self.get_posts_by_tags(tag_ids, limit=20))
+            elif "category" in key:
+                fetches.append(self.get_posts_by_categories(category_ids, limit=20))
+            else:
+                continue
+            weights.append(weight)
+        results = await asyncio.gather(*fetches)
+        return self._rank_related_posts(list(zip(results, weights)), limit=limit, exclude_fanza_id=exclude_fanza_id)
@@ -0,0 +1,54 @@
+"""
+大カテゴリ判定
+
+メインサイトで商品を振り分ける大カテゴリを、ジャンル名とタイトルから決める。
+判定用のキーワードは1本の正規表現に事前コンパイルし、ジャンル文字列を1回走査するだけで決定する。
+"""
+import re
+from typing import Iterable
+
+DEFAULT_BIG_CATEGORY = "動画"
+VR_BIG_CATEGORY = "VR作品"
+
+# 上から順に優先（複数一致した場合は先に書かれたカテゴリ）
+BIG_CATEGORY_RULES: tuple[tuple[str, tuple[str, ...]], ...] = (
+    (VR_BIG_CATEGORY, ("VR", "ハイクオリティVR")),
+    ("アニメ・2D", ("アニメ", "二次元", "CG")),
+    ("素人・ナンパ", ("素人", "ナンパ", "投稿", "地味")),
+    ("熟女・人妻", ("熟女", "人妻", "お姉さん", "四十路", "美魔女", "お母さん")),
+    ("美少女・若手", ("美少女", "若手", "新人", "10代", "女子大生")),
+    ("巨乳・爆乳", ("巨乳", "爆乳", "爆にゅう")),
+    ("単体女優", ("単体作品",)),
+    ("企画・バラエティ", ("企画", "バラエティー", "コスプレ")),
+)
+
+BIG_CATEGORIES: tuple[str, ...] = tuple(name for name, _ in BIG_CATEGORY_RULES) + (DEFAULT_BIG_CATEGORY,)
+
+
+def _build_matcher() -> tuple[re.Pattern, dict[str, int]]:
+    # キーワード -> ルール順位。先読み (?=...) で全位置から照合して重なり合うキーワード（「新人妻」の新人/人妻）も拾う。
+    # 同じ位置では最長のキーワードだけが返るため、長いキーワードに含まれる短いキーワードの順位も長い方に畳み込む
+    ranks: dict[str, int] = {}
+    for rank, (_, keywords) in enumerate(BIG_CATEGORY_RULES):
+        for kw in keywords:
+            ranks.setdefault(kw, rank)
+    keywords = sorted(ranks, key=len, reverse=True)
+    folded = {kw: min(ranks[other] for other in keywords if other in kw) for kw in keywords}
+    return re.compile("(?=(" + "|".join(re.escape(kw) for kw in keywords) + "))"), folded
+
+
+_BIG_CATEGORY_PATTERN, _BIG_CATEGORY_RANKS = _build_matcher()
+_VR_TITLE_PATTERN = re.compile("VR", re.IGNORECASE)
+
+
+def classify_big_category(title: str, genres: Iterable[str]) -> str:
+    """タイトルにVRを含めばVR作品、それ以外はジャンル名に一致した最優先のカテゴリ（無ければ「動画」）"""
+    if title and _VR_TITLE_PATTERN.search(title):
+        return VR_BIG_CATEGORY
+    best = len(BIG_CATEGORY_RULES)
+    # ジャンル名をまたいだ誤一致を避けるため改行で区切る
+    for m in _BIG_CATEGORY_PATTERN.finditer("\n".join(genres or ())):
+        best = min(best, _BIG_CATEGORY_RANKS[m.group(1)])
+        if best == 0:
+            break
+    return BIG_CATEGORY_RULES[best][0] if best < len(BIG_CATEGORY_RULES) else DEFAULT_BIG_CATEGORY
@@ -2,12 +2,17 @@ from __future__ import annotations
 """
 共通データモデル定義
 """
-from dataclasses import dataclass, field
-from typing import Any, List, Optional, Dict
+from dataclasses import dataclass, field, fields
+from typing import Any, Iterator, List, Mapping, Optional, Dict
 
-@dataclass
+@dataclass(slots=True)
 class Product:
-    """FANZA商品データ"""
+    """
+    FANZA商品データ
+    __slots__ で1件あたりのメモリを抑え、APIパースから投稿までこのオブジェクトのまま受け渡す。
+    既存コードとの互換のため item["title"] / item.get("genre") のようなdict形式のアクセスにも対応する。
+    （パイプライン中で画像URLやアイキャッチIDを書き換えるため frozen にはしない）
+    """
     product_id: str
     title: str
     actress: List[str]
@@ -23,21 +28,54 @@ class Product:
     # 内部処理用フラグ
     _featured_media_id: Optional[int] = None
 
+    # --- dict互換アクセス ---
+    def __getitem__(self, key: str) -> Any:
+        if key not in _PRODUCT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in _PRODUCT_FIELDS:
+            raise KeyError(f"Productに存在しない項目です: {key}")
+        setattr(self, key, value)
+
+    def __contains__(self, key: object) -> bool:
+        return key in _PRODUCT_FIELDS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key not in _PRODUCT_FIELDS:
+            return default
+        return getattr(self, key)
+
+    def keys(self) -> Iterator[str]:
+        return iter(_PUBLIC_FIELDS)
+
     def to_dict(self) -> dict[str, Any]:
-        """辞書形式に変換（互換性維持のため残す）"""
-        return {
-            "product_id": self.product_id,
-            "title": self.title,
-            "actress": self.actress,
-            "maker": self.maker,
-            "genre": self.genre,
-            "release_date": self.release_date,
-            "summary": self.summary,
-            "package_image_url": self.package_image_url,
-            "affiliate_url": self.affiliate_url,
-            "sample_image_urls": self.sample_image_urls,
-            "sample_movie_url": self.sample_movie_url,
-        }
+        """辞書形式に変換（JSON保存用。内部処理用フラグは含めない）"""
+        return {name: getattr(self, name) for name in _PUBLIC_FIELDS}
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "Product":
+        """to_dict の出力（候補ファイル等）から復元。欠けている項目は空値で補う"""
+        kwargs = {}
+        for name in _PRODUCT_FIELDS:
+            if name in data:
+                kwargs[name] = data[name]
+            elif name in _LIST_FIELDS:
+                kwargs[name] = []
+            elif name != "_featured_media_id":
+                kwargs[name] = ""
+        return cls(**kwargs)
+
+    @classmethod
+    def coerce(cls, item: "Product | Mapping[str, Any]") -> "Product":
+        """Productはそのまま、dictはProductへ変換"""
+        return item if isinstance(item, cls) else cls.from_dict(item)
+
+
+_PRODUCT_FIELDS = frozenset(f.name for f in fields(Product))
+_PUBLIC_FIELDS = tuple(f.name for f in fields(Product) if not f.name.startswith("_"))
+_LIST_FIELDS = frozenset(("actress", "genre", "sample_image_urls"))
 
 @dataclass
 class AIResponse:
@@ -0,0 +1,444 @@
+"""
+FANZA商品カタログ（ローカルミラー）
+
+FANZA APIの新着ストリームを gte_date で差分取得してSQLiteへ蓄積し、
+ジャンル・出演者・メーカー・キーワード・発売日で索引付きの照会ができるようにする。
+キーワードはタイトル/ジャンル/出演者/メーカー/説明文の文字bigramによる全文索引(FTS5)で照合する。
+run_batch.py はここから候補を選べば、FANZA APIを呼ばずに（オフラインでも）候補を用意できる。
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from src.core.categories import classify_big_category
+from src.core.models import Product
+
+logger = logging.getLogger(__name__)
+
+_PRODUCTS_DDL = """
+    CREATE TABLE IF NOT EXISTS products (
+        product_id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        actress TEXT NOT NULL,
+        maker TEXT NOT NULL,
+        genre TEXT NOT NULL,
+        release_date TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        package_image_url TEXT NOT NULL,
+        affiliate_url TEXT NOT NULL,
+        sample_image_urls TEXT NOT NULL,
+        sample_movie_url TEXT NOT NULL,
+        fetched_at INTEGER NOT NULL
+    )
+"""
+
+# 行から Product を組み立てる列順（JSON配列で保存している列は _LIST_COLUMNS）
+_PRODUCT_COLUMNS = (
+    "product_id", "title", "actress", "maker", "genre", "release_date", "summary",
+    "package_image_url", "affiliate_url", "sample_image_urls", "sample_movie_url",
+)
+_LIST_COLUMNS = frozenset(("actress", "genre", "sample_image_urls"))
+
+# 全文索引の列（キーワード照会の既定はタイトル/ジャンル/出演者/メーカー）
+FTS_COLUMNS = ("title", "genre", "actress", "maker", "summary")
+DEFAULT_KEYWORD_COLUMNS = ("title", "genre", "actress", "maker")
+
+# 記号・空白で区切った語（アンダースコアはunicode61で区切り文字になるため除く）
+_SEGMENT_PATTERN = re.compile(r"[^\W_]+")
+
+
+def bigram_text(text: str) -> str:
+    """
+    全文索引用に文字bigramへ分割する（日本語は単語境界が無いため）
+    各語の末尾の1文字も単独のトークンとして残し、1文字のキーワードも前方一致で引けるようにする。
+    例: "着衣巨乳" -> "着衣 衣巨 巨乳 乳"
+    """
+    tokens: list[str] = []
+    for segment in _SEGMENT_PATTERN.findall(text.lower()):
+        tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+        tokens.append(segment[-1])
+    return " ".join(tokens)
+
+
+def bigram_query(keyword: str) -> str | None:
+    """
+    キーワードをFTS5のMATCH式にする（部分一致と同じ意味になる）
+    2文字以上の語は連続するbigramのフレーズ、1文字の語は前方一致。語が複数ある場合はAND。
+    """
+    parts = []
+    for segment in _SEGMENT_PATTERN.findall(keyword.lower()):
+        if len(segment) == 1:
+            parts.append(f'"{segment}"*')
+        else:
+            parts.append('"' + " ".join(segment[i:i + 2] for i in range(len(segment) - 1)) + '"')
+    return " AND ".join(parts) if parts else None
+
+
+class CatalogStore:
+    """FANZA商品のローカルカタログ"""
+
+    # PRAGMA user_version で管理するスキーマ版
+    #  1: 初期版 (products + ジャンル/出演者の索引テーブル)
+    #  2: 大カテゴリ列と全文索引 (product_fts) を追加
+    SCHEMA_VERSION = 3
+
+    # 差分同期で前回の最新発売日から遡る日数（発売日の後から追加/修正される商品を拾うため）
+    DEFAULT_OVERLAP_DAYS = 2
+    # 初回（前回同期なし）に取得する最大ページ数
+    DEFAULT_BACKFILL_PAGES = 20
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn = conn
+        self._migrate()
+
+    def __enter__(self) -> "CatalogStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _migrate(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+        if version < 1:
+            self._migrate_v1()
+        if version < 2:
+            self._migrate_v2()
+        if version < 3:
+            self._migrate_v3()
+        self._conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def _migrate_v1(self) -> None:
+        with self._conn:
+            self._conn.execute(_PRODUCTS_DDL)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS product_genres ("
+                " genre TEXT NOT NULL, product_id TEXT NOT NULL, PRIMARY KEY (genre, product_id)"
+                ") WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS product_actresses ("
+                " actress TEXT NOT NULL, product_id TEXT NOT NULL, PRIMARY KEY (actress, product_id)"
+                ") WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_products_release ON products (release_date)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_products_maker ON products (maker, release_date)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def _migrate_v2(self) -> None:
+        """大カテゴリ列と全文索引を追加し、既存の商品から作り直す"""
+        with self._conn:
+            self._conn.execute("ALTER TABLE products ADD COLUMN big_category TEXT NOT NULL DEFAULT ''")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_products_big_category ON products (big_category, release_date)"
+            )
+            # 外部コンテンツではなく bigram 済みの文字列を持つ通常のFTS5表（rowid は products.rowid）
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5("
+                f"{', '.join(FTS_COLUMNS)}, tokenize='unicode61 remove_diacritics 0')"
+            )
+            rows = self._conn.execute("SELECT rowid, title, genre, actress, maker, summary FROM products").fetchall()
+            for rowid, title, genre, actress, maker, summary in rows:
+                genres = json.loads(genre)
+                self._conn.execute(
+                    "UPDATE products SET big_category = ? WHERE rowid = ?",
+                    (classify_big_category(title, genres), rowid),
+                )
+            self._conn.executemany(
+                f"INSERT INTO product_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (rowid, *self._fts_values(title, json.loads(genre), json.loads(actress), maker, summary))
+                    for rowid, title, genre, actress, maker, summary in rows
+                ],
+            )
+        if rows:
+            logger.info(f"カタログ全文索引を作成: {len(rows)}件")
+
+    def _migrate_v3(self) -> None:
+        """大カテゴリを判定し直す（重なり合うキーワードを取りこぼしていた判定の修正）"""
+        with self._conn:
+            rows = self._conn.execute("SELECT rowid, title, genre, big_category FROM products").fetchall()
+            updates = [
+                (big_category, rowid)
+                for rowid, title, genre, old in rows
+                if (big_category := classify_big_category(title, json.loads(genre))) != old
+            ]
+            self._conn.executemany("UPDATE products SET big_category = ? WHERE rowid = ?", updates)
+        if updates:
+            logger.info(f"大カテゴリを再判定: {len(updates)}件")
+
+    @staticmethod
+    def _fts_values(title: str, genres: list[str], actresses: list[str], maker: str, summary: str) -> tuple[str, ...]:
+        # ジャンル名・出演者名をまたいだbigramを作らないよう、名前ごとに区切る
+        return (
+            bigram_text(title),
+            bigram_text(" ".join(genres)),
+            bigram_text(" ".join(actresses)),
+            bigram_text(maker),
+            bigram_text(summary),
+        )
+
+    # --- メタデータ ---
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO metadata (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    # --- 書き込み ---
+    def upsert(self, products: Iterable[Product]) -> int:
+        """商品を追加/更新し、新規に追加した件数を返す（同じIDは後のものが勝つ）"""
+        batch = {str(p.product_id).lower(): p for p in products}
+        if not batch:
+            return 0
+        pids = list(batch)
+        now = int(time.time())
+        rows = []
+        genre_rows = []
+        actress_rows = []
+        for pid, p in batch.items():
+            rows.append((
+                pid, p.title, json.dumps(p.actress, ensure_ascii=False), p.maker,
+                json.dumps(p.genre, ensure_ascii=False), p.release_date, p.summary,
+                p.package_image_url, p.affiliate_url,
+                json.dumps(p.sample_image_urls, ensure_ascii=False), p.sample_movie_url, now,
+                classify_big_category(p.title, p.genre),
+            ))
+            genre_rows.extend((g, pid) for g in dict.fromkeys(p.genre) if g)
+            actress_rows.extend((a, pid) for a in dict.fromkeys(p.actress) if a)
+
+        placeholders = ",".join("?" * len(pids))
+        with self._lock, self._conn:
+            existing = {
+                row[0] for row in self._conn.execute(
+                    f"SELECT product_id FROM products WHERE product_id IN ({placeholders})", pids
+                )
+            }
+            self._conn.executemany(
+                f"""
+                INSERT INTO products ({", ".join(_PRODUCT_COLUMNS)}, fetched_at, big_category)
+                VALUES ({",".join("?" * (len(_PRODUCT_COLUMNS) + 2))})
+                ON CONFLICT(product_id) DO UPDATE SET
+                    {", ".join(f"{c} = excluded.{c}" for c in _PRODUCT_COLUMNS[1:])},
+                    fetched_at = excluded.fetched_at,
+                    big_category = excluded.big_category
+                """,
+                rows,
+            )
+            # 全文索引も rowid 単位で入れ替える（UPSERTでは products.rowid は変わらない）
+            rowids = self._conn.execute(
+                f"SELECT product_id, rowid FROM products WHERE product_id IN ({placeholders})", pids
+            ).fetchall()
+            self._conn.executemany("DELETE FROM product_fts WHERE rowid = ?", [(rowid,) for _, rowid in rowids])
+            self._conn.executemany(
+                f"INSERT INTO product_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (rowid, *self._fts_values(p.title, p.genre, p.actress, p.maker, p.summary))
+                    for pid, rowid in rowids
+                    for p in (batch[pid],)
+                ],
+            )
+            # 索引テーブルは商品単位で作り直す（ジャンル/出演者の付け替えに追従するため）
+            self._conn.execute(f"DELETE FROM product_genres WHERE product_id IN ({placeholders})", pids)
+            self._conn.execute(f"DELETE FROM product_actresses WHERE product_id IN ({placeholders})", pids)
+            self._conn.executemany("INSERT OR IGNORE INTO product_genres (genre, product_id) VALUES (?, ?)", genre_rows)
+            self._conn.executemany("INSERT OR IGNORE INTO product_actresses (actress, product_id) VALUES (?, ?)", actress_rows)
+        return len(pids) - len(existing)
+
+    def sync(
+        self,
+        client: Any,
+        since: str | None = None,
+        overlap_days: int = DEFAULT_OVERLAP_DAYS,
+        max_pages: int | None = None,
+        per_page: int = 100,
+    ) -> dict[str, Any]:
+        """
+        FanzaClient の新着ストリームからカタログを差分更新する
+        since 未指定時は前回取り込んだ最新発売日から overlap_days 日遡った日付以降を gte_date で取得する。
+        前回同期が無い場合は新着順に max_pages（既定 DEFAULT_BACKFILL_PAGES）ページまで取り込む。
+        """
+        if since is None:
+            latest = self.get_meta("max_release_date")
+            if latest:
+                since = (datetime.fromisoformat(latest[:10]) - timedelta(days=max(overlap_days, 0))).strftime("%Y-%m-%d")
+            elif max_pages is None:
+                max_pages = self.DEFAULT_BACKFILL_PAGES
+
+        stats: dict[str, Any] = {"since": since, "pages": 0, "fetched": 0, "inserted": 0}
+        latest_release = self.get_meta("max_release_date") or ""
+        started = time.monotonic()
+        for batch in client.iter_pages(sort="date", since=since, per_page=per_page, max_pages=max_pages):
+            stats["pages"] += 1
+            stats["fetched"] += len(batch)
+            stats["inserted"] += self.upsert(batch)
+            latest_release = max([latest_release, *(p.release_date for p in batch)])
+        stats["seconds"] = round(time.monotonic() - started, 2)
+
+        if latest_release:
+            self.set_meta("max_release_date", latest_release)
+        self.set_meta("last_sync_at", datetime.now(timezone.utc).isoformat())
+        logger.info(
+            f"カタログ同期: since={since or '-'}, {stats['pages']}ページ/{stats['fetched']}件取得, "
+            f"新規{stats['inserted']}件 ({stats['seconds']}秒)"
+        )
+        return stats
+
+    # --- 照会 ---
+    @staticmethod
+    def keyword_match(keywords: Iterable[str], columns: Iterable[str] = DEFAULT_KEYWORD_COLUMNS) -> str | None:
+        """キーワード（いずれかに部分一致, OR）を全文索引のMATCH式にする（有効なキーワードが無ければNone）"""
+        terms = [q for q in (bigram_query(kw) for kw in keywords if kw) if q]
+        if not terms:
+            return None
+        cols = [c for c in columns if c in FTS_COLUMNS]
+        if not cols:
+            raise ValueError(f"全文索引の列を指定してください: {FTS_COLUMNS}")
+        return "{" + " ".join(cols) + "} : (" + " OR ".join(f"({t})" for t in terms) + ")"
+
+    def query(
+        self,
+        keywords: list[str] | None = None,
+        genres: list[str] | None = None,
+        actresses: list[str] | None = None,
+        makers: list[str] | None = None,
+        big_categories: list[str] | None = None,
+        since: str | None = None,
+        until: str | None = None,
+        limit: int = 100,
+        offset: int = 0,
+        keyword_columns: Iterable[str] = DEFAULT_KEYWORD_COLUMNS,
+    ) -> list[Product]:
+        """
+        条件に合う商品を発売日の新しい順に返す
+        keywords はいずれかが keyword_columns（既定: タイトル/ジャンル/出演者/メーカー）に部分一致すればよい（OR, 全文索引）。
+        genres/actresses/makers/big_categories は名前の完全一致（それぞれOR、条件どうしはAND）。
+        since/until は発売日（YYYY-MM-DD, until は含まない）。
+        """
+        conds: list[str] = []
+        params: list[Any] = []
+        with self._lock:
+            if keywords:
+                match = self.keyword_match(keywords, keyword_columns)
+                if match is None:
+                    return []
+                conds.append("p.rowid IN (SELECT rowid FROM product_fts WHERE product_fts MATCH ?)")
+                params.append(match)
+            if genres:
+                conds.append(
+                    f"p.product_id IN (SELECT product_id FROM product_genres WHERE genre IN ({','.join('?' * len(genres))}))"
+                )
+                params.extend(genres)
+            if actresses:
+                conds.append(
+                    f"p.product_id IN (SELECT product_id FROM product_actresses WHERE actress IN ({','.join('?' * len(actresses))}))"
+                )
+                params.extend(actresses)
+            if makers:
+                conds.append(f"p.maker IN ({','.join('?' * len(makers))})")
+                params.extend(makers)
+            if big_categories:
+                conds.append(f"p.big_category IN ({','.join('?' * len(big_categories))})")
+                params.extend(big_categories)
+            if since:
+                conds.append("p.release_date >= ?")
+                params.append(since)
+            if until:
+                conds.append("p.release_date < ?")
+                params.append(until)
+            where = f"WHERE {' AND '.join(conds)}" if conds else ""
+            rows = self._conn.execute(
+                f"SELECT {', '.join('p.' + c for c in _PRODUCT_COLUMNS)} FROM products p {where} "
+                "ORDER BY p.release_date DESC, p.product_id LIMIT ? OFFSET ?",
+                (*params, max(limit, 0), max(offset, 0)),
+            ).fetchall()
+        return [self._to_product(row) for row in rows]
+
+    def iter_pages(self, per_page: int = 100, max_pages: int | None = None, **filters: Any) -> Iterator[list[Product]]:
+        """query の結果をページ単位で流す（FanzaClient.iter_pages と同じ形で候補選定に使える）"""
+        page = 0
+        while max_pages is None or page < max_pages:
+            batch = self.query(limit=per_page, offset=page * per_page, **filters)
+            if not batch:
+                break
+            yield batch
+            if len(batch) < per_page:
+                break
+            page += 1
+
+    def get(self, product_id: str) -> Product | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_PRODUCT_COLUMNS)} FROM products WHERE product_id = ?",
+                (product_id.lower(),),
+            ).fetchone()
+        return self._to_product(row) if row else None
+
+    def get_many(self, product_ids: Iterable[str]) -> dict[str, Product]:
+        """複数IDをまとめて引く（{小文字のID: Product}、カタログに無いIDは含まない）"""
+        pids = list(dict.fromkeys(pid.lower() for pid in product_ids))
+        found: dict[str, Product] = {}
+        with self._lock:
+            # SQLiteのバインド変数上限を超えないよう分割する
+            for i in range(0, len(pids), 500):
+                chunk = pids[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT {', '.join(_PRODUCT_COLUMNS)} FROM products "
+                    f"WHERE product_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self._to_product(row)
+        return found
+
+    def get_stats(self) -> dict[str, Any]:
+        with self._lock:
+            total, oldest, newest = self._conn.execute(
+                "SELECT COUNT(*), MIN(release_date), MAX(release_date) FROM products"
+            ).fetchone()
+            genres = self._conn.execute("SELECT COUNT(DISTINCT genre) FROM product_genres").fetchone()[0]
+            actresses = self._conn.execute("SELECT COUNT(DISTINCT actress) FROM product_actresses").fetchone()[0]
+        return {
+            "products": total,
+            "genres": genres,
+            "actresses": actresses,
+            "oldest_release": oldest,
+            "newest_release": newest,
+            "last_sync_at": self.get_meta("last_sync_at"),
+        }
+
+    @staticmethod
+    def _to_product(row: tuple) -> Product:
+        return Product(**{
+            col: json.loads(value) if col in _LIST_COLUMNS else value
+            for col, value in zip(_PRODUCT_COLUMNS, row)
+        })
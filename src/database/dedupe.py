@@ -1,9 +1,17 @@
 """
 SQLite重複防止ストア
+
+全サイトの投稿状態を1つのDBに (site, product_id) 単位で保持する。
+git にはサイト別のJSON Lines（export_jsonl）をコミットし、SQLiteファイルはローカルキャッシュとして扱う。
 """
+import atexit
+import hashlib
+import json
 import sqlite3
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
 from typing import Literal
 from contextlib import contextmanager
@@ -12,79 +20,297 @@ logger = logging.getLogger(__name__)
 
 Status = Literal["drafted", "failed", "dry_run", "processing", "published"]
 
+DEFAULT_SITE = "default"
+
+_POSTED_ITEMS_DDL = """
+    CREATE TABLE IF NOT EXISTS posted_items (
+        site TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        wp_post_id INTEGER,
+        created_at TEXT NOT NULL,
+        error_message TEXT,
+        created_ts INTEGER,
+        updated_at INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (site, product_id)
+    )
+"""
+
+_METADATA_DDL = """
+    CREATE TABLE IF NOT EXISTS metadata (
+        site TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (site, key)
+    )
+"""
+
+
 class DedupeStore:
-    """投稿済み商品の管理"""
-    
-    def __init__(self, db_path: Path):
+    """投稿済み商品の管理（site 単位でスコープし、全サイト横断の照会も可能）"""
+
+    # 接続ごとに適用するPRAGMA（WAL時の推奨設定）
+    _CONNECTION_PRAGMAS = (
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",
+    )
+
+    # PRAGMA user_version で管理するスキーマ版
+    #  0: 初期版 (created_at TEXTのみ)
+    #  1: created_ts/updated_at(エポック秒), attempts 列と (status, created_ts) 索引を追加
+    #  2: site 列を追加し、主キーを (site, product_id) に変更（全サイト統合DB）
+    SCHEMA_VERSION = 2
+
+    def __init__(
+        self,
+        db_path: Path,
+        site: str = DEFAULT_SITE,
+        wal: bool = True,
+        busy_timeout: float = 30.0,
+    ):
         self.db_path = db_path
+        self.site = site or DEFAULT_SITE
+        self.wal = wal
+        self.busy_timeout = busy_timeout
+        # スレッドごとに1本の長寿命接続を保持する（並列ワーカー用の小さなプール）
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._closed = False
         self._ensure_db()
-    
+        atexit.register(self.close)
+
     def _ensure_db(self) -> None:
-        """データベースとテーブルを初期化"""
+        """データベースとテーブルを初期化（旧スキーマは移行する）"""
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         with self._connect() as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS posted_items (
-                    product_id TEXT PRIMARY KEY,
-                    status TEXT NOT NULL,
-                    wp_post_id INTEGER,
-                    created_at TEXT NOT NULL,
-                    error_message TEXT
-                )
-            """)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS metadata (
-                    key TEXT PRIMARY KEY,
-                    value TEXT NOT NULL
-                )
-            """)
+            if self.wal:
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_POSTED_ITEMS_DDL)
+            conn.execute(_METADATA_DDL)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                self._migrate_v1(conn)
+            if version < 2:
+                self._migrate_v2(conn, self.site)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_posted_items_site_status_created "
+                "ON posted_items (site, status, created_ts)"
+            )
+            # 全サイト横断の「どこかに投稿済みか」照会用
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_posted_items_product "
+                "ON posted_items (product_id, status)"
+            )
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
             conn.commit()
-            logger.debug(f"データベース初期化完了: {self.db_path}")
-    
+            logger.debug(f"データベース初期化完了: {self.db_path} (site={self.site})")
+
+    @staticmethod
+    def _iso_to_ts(value: str | None) -> int | None:
+        # created_at は datetime.now() のローカル時刻なので、SQLのstrftime(UTC扱い)ではなくPythonで変換する
+        try:
+            return int(datetime.fromisoformat(str(value)).timestamp())
+        except Exception:
+            return None
+
+    @classmethod
+    def _migrate_v1(cls, conn: sqlite3.Connection) -> None:
+        """v0→v1: エポック秒の時刻列と試行回数列を追加し、既存のISO文字列から埋める"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(posted_items)")}
+        for name, ddl in (
+            ("created_ts", "ALTER TABLE posted_items ADD COLUMN created_ts INTEGER"),
+            ("updated_at", "ALTER TABLE posted_items ADD COLUMN updated_at INTEGER"),
+            ("attempts", "ALTER TABLE posted_items ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"),
+        ):
+            if name not in columns:
+                conn.execute(ddl)
+
+        rows = conn.execute(
+            "SELECT rowid, created_at FROM posted_items WHERE created_ts IS NULL"
+        ).fetchall()
+        updates = []
+        for row in rows:
+            ts = cls._iso_to_ts(row["created_at"])
+            # 壊れた時刻はNULLのまま残し、TTL判定では保守的に「期限内」とみなす
+            if ts is not None:
+                updates.append((ts, ts, row["rowid"]))
+        conn.executemany(
+            "UPDATE posted_items SET created_ts = ?, updated_at = ? WHERE rowid = ?",
+            updates,
+        )
+        if rows:
+            logger.info(f"posted_itemsをスキーマv1へ移行: {len(updates)}/{len(rows)}件の時刻を変換")
+
+    @staticmethod
+    def _migrate_v2(conn: sqlite3.Connection, site: str) -> None:
+        """v1→v2: 旧サイト別DBの行に site 列を付与し、主キーを (site, product_id) に組み替える"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(posted_items)")}
+        if "site" not in columns:
+            conn.execute("DROP INDEX IF EXISTS idx_posted_items_status_created")
+            conn.execute("ALTER TABLE posted_items RENAME TO posted_items_v1")
+            conn.execute(_POSTED_ITEMS_DDL)
+            conn.execute(
+                """
+                INSERT INTO posted_items
+                (site, product_id, status, wp_post_id, created_at, error_message, created_ts, updated_at, attempts)
+                SELECT ?, product_id, status, wp_post_id, created_at, error_message, created_ts, updated_at, attempts
+                FROM posted_items_v1
+                """,
+                (site,),
+            )
+            conn.execute("DROP TABLE posted_items_v1")
+            logger.info(f"posted_itemsをスキーマv2へ移行: site={site}")
+
+        meta_columns = {row["name"] for row in conn.execute("PRAGMA table_info(metadata)")}
+        if "site" not in meta_columns:
+            conn.execute("ALTER TABLE metadata RENAME TO metadata_v1")
+            conn.execute(_METADATA_DDL)
+            conn.execute("INSERT INTO metadata (site, key, value) SELECT ?, key, value FROM metadata_v1", (site,))
+            conn.execute("DROP TABLE metadata_v1")
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """現在のスレッド用の接続を取得（初回のみ接続を作成）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        if self._closed:
+            raise RuntimeError(f"DedupeStoreはクローズ済みです: {self.db_path}")
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        for pragma in self._CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        self._local.conn = conn
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
     @contextmanager
     def _connect(self):
-        """データベース接続のコンテキストマネージャ"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """データベース接続のコンテキストマネージャ（接続は使い回し、閉じない）"""
+        conn = self._get_connection()
         try:
             yield conn
         finally:
-            conn.close()
-    
-    def is_posted(self, product_id: str, processing_ttl_hours: int = 6, failed_retry_hours: int = 24) -> bool:
-        """既に投稿済みかどうかを確認（処理中は一定時間だけ重複扱い）"""
-        with self._connect() as conn:
-            row = conn.execute(
-                "SELECT status, created_at FROM posted_items WHERE product_id = ?",
-                (product_id,),
-            ).fetchone()
-            if row is None:
-                return False
+            # 例外などで開いたままのトランザクションを次の呼び出しに持ち越さない
+            if conn.in_transaction:
+                conn.rollback()
 
-            status = str(row["status"])
-            if status in ("drafted", "published"):
-                logger.debug(f"重複検出 (投稿済み): {product_id}")
-                return True
+    def close(self) -> None:
+        """全スレッドの接続を閉じる（WALはチェックポイントして本体ファイルへ反映）"""
+        with self._connections_lock:
+            if self._closed:
+                return
+            self._closed = True
+            connections, self._connections = self._connections, []
+        for i, conn in enumerate(connections):
+            try:
+                if self.wal and i == len(connections) - 1:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"DB接続クローズ失敗: {e}")
+        self._local = threading.local()
 
-            if status == "processing":
-                try:
-                    started_at = datetime.fromisoformat(str(row["created_at"]))
-                except Exception:
-                    # created_at が壊れている場合は保守的に「処理中」とみなす
-                    return True
-                if datetime.now() - started_at < timedelta(hours=processing_ttl_hours):
-                    return True
+    def __enter__(self) -> "DedupeStore":
+        return self
 
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
-            if status == "failed":
-                try:
-                    failed_at = datetime.fromisoformat(str(row["created_at"]))
-                except Exception:
-                    return True
-                if datetime.now() - failed_at < timedelta(hours=failed_retry_hours):
-                    return True
+    # 新規投稿を妨げる行の条件（TTLはSQL内でエポック秒を比較する）
+    # created_ts がNULL（時刻が壊れている）の処理中/失敗は保守的に期限内とみなす
+    _BLOCKING_WHERE = """
+        (
+            status IN ('drafted', 'published')
+            OR (status = 'processing' AND (created_ts IS NULL OR created_ts > :processing_cutoff))
+            OR (status = 'failed' AND (created_ts IS NULL OR created_ts > :failed_cutoff))
+        )
+    """
 
-            return False
+    @staticmethod
+    def _cutoffs(processing_ttl_hours: int, failed_retry_hours: int) -> dict[str, int]:
+        now = int(time.time())
+        return {
+            "processing_cutoff": now - processing_ttl_hours * 3600,
+            "failed_cutoff": now - failed_retry_hours * 3600,
+        }
+
+    def is_posted(
+        self,
+        product_id: str,
+        processing_ttl_hours: int = 6,
+        failed_retry_hours: int = 24,
+        any_site: bool = False,
+    ) -> bool:
+        """
+        既に投稿済みかどうかを確認（処理中は一定時間だけ重複扱い）
+        any_site=True の場合、他サイトで投稿済み(drafted/published)でも重複扱い
+        """
+        return not self.filter_unposted(
+            [product_id],
+            processing_ttl_hours=processing_ttl_hours,
+            failed_retry_hours=failed_retry_hours,
+            any_site=any_site,
+        )
+
+    # SQLiteのバインド変数上限(古いビルドで999)を超えないよう分割する
+    _IN_CHUNK_SIZE = 500
+
+    def filter_unposted(
+        self,
+        product_ids: list[str],
+        processing_ttl_hours: int = 6,
+        failed_retry_hours: int = 24,
+        any_site: bool = False,
+    ) -> list[str]:
+        """
+        投稿可能なIDだけを入力順のまま返す（is_posted と同じ判定を1クエリでまとめて行う）
+        any_site=True の場合、他サイトで投稿済み(drafted/published)のIDも除外する
+        """
+        if not product_ids:
+            return []
+        blocked: set[str] = set()
+        unique_ids = list(dict.fromkeys(product_ids))
+        cutoffs = self._cutoffs(processing_ttl_hours, failed_retry_hours)
+        with self._connect() as conn:
+            for i in range(0, len(unique_ids), self._IN_CHUNK_SIZE):
+                chunk = unique_ids[i:i + self._IN_CHUNK_SIZE]
+                params = {f"p{n}": pid for n, pid in enumerate(chunk)}
+                placeholders = ",".join(f":p{n}" for n in range(len(chunk)))
+                rows = conn.execute(
+                    f"SELECT product_id FROM posted_items WHERE site = :site "
+                    f"AND product_id IN ({placeholders}) AND {self._BLOCKING_WHERE}",
+                    {"site": self.site, **params, **cutoffs},
+                ).fetchall()
+                blocked.update(str(row["product_id"]) for row in rows)
+                if any_site:
+                    rows = conn.execute(
+                        f"SELECT DISTINCT product_id FROM posted_items WHERE product_id IN ({placeholders}) "
+                        "AND status IN ('drafted', 'published')",
+                        params,
+                    ).fetchall()
+                    blocked.update(str(row["product_id"]) for row in rows)
+        return [pid for pid in product_ids if pid not in blocked]
+
+    def posted_sites(self, product_id: str) -> list[str]:
+        """商品が投稿済み(drafted/published)のサイト一覧（全サイト横断）"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT site FROM posted_items WHERE product_id = ? "
+                "AND status IN ('drafted', 'published') ORDER BY site",
+                (product_id,),
+            ).fetchall()
+            return [str(row["site"]) for row in rows]
+
+    @staticmethod
+    def _now() -> tuple[str, int]:
+        """(ISO文字列, エポック秒) の現在時刻"""
+        now = datetime.now()
+        return now.isoformat(), int(now.timestamp())
 
     def try_start(self, product_id: str, processing_ttl_hours: int = 6) -> bool:
         """
@@ -93,65 +319,92 @@ class DedupeStore:
         - processing: TTL内は開始不可（同時実行/重複防止）
         - failed/dry_run/TTL超過processing: 再試行可
         """
+        now_iso, now_ts = self._now()
         with self._connect() as conn:
-            conn.execute("BEGIN IMMEDIATE")
-            row = conn.execute(
-                "SELECT status, created_at FROM posted_items WHERE product_id = ?",
-                (product_id,),
-            ).fetchone()
-
-            if row is not None:
-                status = str(row["status"])
-                if status in ("drafted", "published"):
-                    conn.rollback()
-                    return False
-                if status == "processing":
-                    try:
-                        started_at = datetime.fromisoformat(str(row["created_at"]))
-                    except Exception:
-                        conn.rollback()
-                        return False
-                    if datetime.now() - started_at < timedelta(hours=processing_ttl_hours):
-                        conn.rollback()
-                        return False
-
-            conn.execute(
+            # UPSERTのWHEREで確保可否を判定するため、1文で原子的に完結する
+            cursor = conn.execute(
                 """
-                INSERT OR REPLACE INTO posted_items
-                (product_id, status, wp_post_id, created_at, error_message)
-                VALUES (?, 'processing', NULL, ?, NULL)
+                INSERT INTO posted_items
+                (site, product_id, status, wp_post_id, created_at, error_message, created_ts, updated_at, attempts)
+                VALUES (:site, :product_id, 'processing', NULL, :now_iso, NULL, :now_ts, :now_ts, 1)
+                ON CONFLICT(site, product_id) DO UPDATE SET
+                    status = 'processing',
+                    wp_post_id = NULL,
+                    created_at = excluded.created_at,
+                    error_message = NULL,
+                    created_ts = excluded.created_ts,
+                    updated_at = excluded.updated_at,
+                    attempts = posted_items.attempts + 1
+                WHERE NOT (
+                    posted_items.status IN ('drafted', 'published')
+                    OR (
+                        posted_items.status = 'processing'
+                        AND (posted_items.created_ts IS NULL OR posted_items.created_ts > :processing_cutoff)
+                    )
+                )
                 """,
-                (product_id, datetime.now().isoformat()),
+                {
+                    "site": self.site,
+                    "product_id": product_id,
+                    "now_iso": now_iso,
+                    "now_ts": now_ts,
+                    "processing_cutoff": now_ts - processing_ttl_hours * 3600,
+                },
             )
             conn.commit()
+            if cursor.rowcount < 1:
+                return False
             logger.info(f"処理開始記録: {product_id}")
             return True
-    
+
+    def _write_status(
+        self,
+        conn: sqlite3.Connection,
+        product_id: str,
+        status: str,
+        wp_post_id: int | None = None,
+        error_message: str | None = None,
+        count_attempt: bool = False,
+    ) -> None:
+        """状態を記録（attempts は保持し、必要な場合のみ加算）"""
+        now_iso, now_ts = self._now()
+        conn.execute(
+            """
+            INSERT INTO posted_items
+            (site, product_id, status, wp_post_id, created_at, error_message, created_ts, updated_at, attempts)
+            VALUES (:site, :product_id, :status, :wp_post_id, :now_iso, :error_message, :now_ts, :now_ts, :attempt)
+            ON CONFLICT(site, product_id) DO UPDATE SET
+                status = excluded.status,
+                wp_post_id = excluded.wp_post_id,
+                created_at = excluded.created_at,
+                error_message = excluded.error_message,
+                created_ts = excluded.created_ts,
+                updated_at = excluded.updated_at,
+                attempts = posted_items.attempts + excluded.attempts
+            """,
+            {
+                "site": self.site,
+                "product_id": product_id,
+                "status": status,
+                "wp_post_id": wp_post_id,
+                "now_iso": now_iso,
+                "now_ts": now_ts,
+                "error_message": error_message,
+                "attempt": 1 if count_attempt else 0,
+            },
+        )
+
     def record_start(self, product_id: str) -> None:
         """処理開始を記録"""
         with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO posted_items
-                (product_id, status, wp_post_id, created_at, error_message)
-                VALUES (?, 'processing', NULL, ?, NULL)
-                """,
-                (product_id, datetime.now().isoformat())
-            )
+            self._write_status(conn, product_id, "processing", count_attempt=True)
             conn.commit()
             logger.info(f"処理開始記録: {product_id}")
-    
+
     def record_success(self, product_id: str, wp_post_id: int | None = None, status: Status = "drafted") -> None:
         """投稿成功を記録"""
         with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO posted_items
-                (product_id, status, wp_post_id, created_at, error_message)
-                VALUES (?, ?, ?, ?, NULL)
-                """,
-                (product_id, status, wp_post_id, datetime.now().isoformat())
-            )
+            self._write_status(conn, product_id, status, wp_post_id=wp_post_id)
             conn.commit()
             logger.info(f"成功記録: {product_id}, status={status}, wp_post_id={wp_post_id}")
 
@@ -159,15 +412,15 @@ class DedupeStore:
         """WP既存投稿を一括で記録（重複は上書きしない）"""
         if not items:
             return 0
-        now = datetime.now().isoformat()
-        rows = [(pid, status, wp_id, now) for pid, wp_id in items]
+        now_iso, now_ts = self._now()
+        rows = [(self.site, pid, status, wp_id, now_iso, now_ts, now_ts) for pid, wp_id in items]
         with self._connect() as conn:
             conn.executemany(
                 """
                 INSERT INTO posted_items
-                (product_id, status, wp_post_id, created_at, error_message)
-                VALUES (?, ?, ?, ?, NULL)
-                ON CONFLICT(product_id) DO UPDATE SET
+                (site, product_id, status, wp_post_id, created_at, error_message, created_ts, updated_at)
+                VALUES (?, ?, ?, ?, ?, NULL, ?, ?)
+                ON CONFLICT(site, product_id) DO UPDATE SET
                     status = CASE
                         WHEN posted_items.status IN ('drafted', 'published') THEN posted_items.status
                         ELSE excluded.status
@@ -180,52 +433,74 @@ class DedupeStore:
                         WHEN posted_items.status IN ('drafted', 'published') THEN posted_items.created_at
                         ELSE excluded.created_at
                     END,
+                    created_ts = CASE
+                        WHEN posted_items.status IN ('drafted', 'published') THEN posted_items.created_ts
+                        ELSE excluded.created_ts
+                    END,
+                    updated_at = excluded.updated_at,
                     error_message = NULL
                 """,
                 rows,
             )
             conn.commit()
         return len(rows)
-    
+
     def record_failure(self, product_id: str, error_message: str) -> None:
         """投稿失敗を記録"""
         with self._connect() as conn:
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO posted_items
-                (product_id, status, wp_post_id, created_at, error_message)
-                VALUES (?, 'failed', NULL, ?, ?)
-                """,
-                (product_id, datetime.now().isoformat(), error_message)
-            )
+            self._write_status(conn, product_id, "failed", error_message=error_message)
             conn.commit()
             logger.warning(f"失敗記録: {product_id}, error={error_message}")
-    
+
+    def release(self, product_id: str) -> bool:
+        """
+        処理中の確保を解除する（処理せずに見送った場合）。
+        1回目の確保なら行ごと消し、それ以前の履歴がある場合は再試行可の dry_run に戻す。
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM posted_items WHERE site = ? AND product_id = ? AND status = 'processing' AND attempts <= 1",
+                (self.site, product_id),
+            )
+            if cursor.rowcount < 1:
+                cursor = conn.execute(
+                    """
+                    UPDATE posted_items SET status = 'dry_run', attempts = MAX(attempts - 1, 0), updated_at = ?
+                    WHERE site = ? AND product_id = ? AND status = 'processing'
+                    """,
+                    (self._now()[1], self.site, product_id),
+                )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    @staticmethod
+    def _empty_stats() -> dict[str, int]:
+        return {"total": 0, "drafted": 0, "published": 0, "processing": 0, "failed": 0, "dry_run": 0}
+
     def get_stats(self) -> dict[str, int]:
-        """統計情報を取得"""
-        with self._connect() as conn:
-            cursor = conn.execute("""
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN status = 'drafted' THEN 1 ELSE 0 END) as drafted,
-                    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed,
-                    SUM(CASE WHEN status = 'dry_run' THEN 1 ELSE 0 END) as dry_run
-                FROM posted_items
-            """)
-            row = cursor.fetchone()
-            return {
-                "total": row["total"] or 0,
-                "drafted": row["drafted"] or 0,
-                "failed": row["failed"] or 0,
-                "dry_run": row["dry_run"] or 0,
-            }
+        """このサイトの統計情報を取得"""
+        return self.get_site_stats().get(self.site, self._empty_stats())
+
+    def get_site_stats(self) -> dict[str, dict[str, int]]:
+        """全サイトのステータス別件数（(site, status, created_ts) 索引のみで集計）"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT site, status, COUNT(*) AS cnt FROM posted_items GROUP BY site, status"
+            ).fetchall()
+        result: dict[str, dict[str, int]] = {}
+        for row in rows:
+            stats = result.setdefault(str(row["site"]), self._empty_stats())
+            stats["total"] += int(row["cnt"])
+            if str(row["status"]) in stats:
+                stats[str(row["status"])] = int(row["cnt"])
+        return result
 
     def get_meta(self, key: str) -> str | None:
         """メタ情報の取得"""
         with self._connect() as conn:
             row = conn.execute(
-                "SELECT value FROM metadata WHERE key = ?",
-                (key,),
+                "SELECT value FROM metadata WHERE site = ? AND key = ?",
+                (self.site, key),
             ).fetchone()
             return str(row["value"]) if row else None
 
@@ -233,16 +508,209 @@ class DedupeStore:
         """メタ情報の保存"""
         with self._connect() as conn:
             conn.execute(
-                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
-                (key, value),
+                "INSERT OR REPLACE INTO metadata (site, key, value) VALUES (?, ?, ?)",
+                (self.site, key, value),
             )
             conn.commit()
-    
+
     def clear_failed(self) -> int:
         """失敗した項目をクリア"""
         with self._connect() as conn:
-            cursor = conn.execute("DELETE FROM posted_items WHERE status = 'failed'")
+            cursor = conn.execute(
+                "DELETE FROM posted_items WHERE site = ? AND status = 'failed'",
+                (self.site,),
+            )
             conn.commit()
             deleted = cursor.rowcount
             logger.info(f"失敗項目をクリア: {deleted}件")
             return deleted
+
+    # 取り込み時は同じ (site, product_id) のうち updated_at が新しい方を残す
+    _MERGE_SQL = """
+        INSERT INTO posted_items
+        (site, product_id, status, wp_post_id, created_at, error_message, created_ts, updated_at, attempts)
+        VALUES (:site, :product_id, :status, :wp_post_id, :created_at, :error_message, :created_ts, :updated_at, :attempts)
+        ON CONFLICT(site, product_id) DO UPDATE SET
+            status = excluded.status,
+            wp_post_id = COALESCE(excluded.wp_post_id, posted_items.wp_post_id),
+            created_at = excluded.created_at,
+            error_message = excluded.error_message,
+            created_ts = excluded.created_ts,
+            updated_at = excluded.updated_at,
+            attempts = MAX(posted_items.attempts, excluded.attempts)
+        WHERE COALESCE(excluded.updated_at, 0) > COALESCE(posted_items.updated_at, 0)
+    """
+
+    def import_legacy_db(self, legacy_path: Path, site: str) -> int:
+        """旧サイト別DB (data/posted_{site}.sqlite3) を site として取り込む（元ファイルは読み取り専用で開く）"""
+        # 前回取り込み時からファイルが変わっていなければスキップ
+        stat = legacy_path.stat()
+        signature = f"{stat.st_size}:{int(stat.st_mtime)}"
+        signature_key = f"legacy_sig:{legacy_path.name}"
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM metadata WHERE site = ? AND key = ?",
+                (site, signature_key),
+            ).fetchone()
+        if row and row["value"] == signature:
+            return 0
+
+        src = sqlite3.connect(f"file:{legacy_path}?mode=ro", uri=True)
+        src.row_factory = sqlite3.Row
+        try:
+            rows = [dict(row) for row in src.execute("SELECT * FROM posted_items")]
+            meta_rows = [dict(row) for row in src.execute("SELECT * FROM metadata")]
+        finally:
+            src.close()
+
+        records = []
+        for data in rows:
+            created_ts = data.get("created_ts") or self._iso_to_ts(data.get("created_at"))
+            records.append({
+                "site": data.get("site") or site,
+                "product_id": data["product_id"],
+                "status": data["status"],
+                "wp_post_id": data.get("wp_post_id"),
+                "created_at": data.get("created_at") or "",
+                "error_message": data.get("error_message"),
+                "created_ts": created_ts,
+                "updated_at": data.get("updated_at") or created_ts,
+                "attempts": data.get("attempts") or 0,
+            })
+        with self._connect() as conn:
+            conn.executemany(self._MERGE_SQL, records)
+            conn.executemany(
+                "INSERT OR IGNORE INTO metadata (site, key, value) VALUES (?, ?, ?)",
+                [(data.get("site") or site, data["key"], data["value"]) for data in meta_rows],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata (site, key, value) VALUES (?, ?, ?)",
+                (site, signature_key, signature),
+            )
+            conn.commit()
+        logger.info(f"旧DBを取り込み: {legacy_path} -> site={site}, {len(records)}件")
+        return len(records)
+
+    def export_jsonl(self, path: Path, site: str | None = None) -> int:
+        """
+        1サイト分をJSON Linesに書き出す（product_id順・1行1件なのでgit差分が追記/変更行だけになる）
+        1行目はメタ情報 {"_meta": {...}}、以降は短縮キー
+        p=product_id, s=status, w=wp_post_id, t=created_ts, u=updated_at, a=attempts, e=error_message
+        """
+        site = site or self.site
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM posted_items WHERE site = ? ORDER BY product_id",
+                (site,),
+            ).fetchall()
+            meta_rows = conn.execute(
+                "SELECT key, value FROM metadata WHERE site = ? "
+                "AND key NOT LIKE 'jsonl_sha1:%' AND key NOT LIKE 'legacy_sig:%' ORDER BY key",
+                (site,),
+            ).fetchall()
+
+        lines = [json.dumps({"_meta": {r["key"]: r["value"] for r in meta_rows}}, ensure_ascii=False, sort_keys=True)]
+        for row in rows:
+            record = {"p": row["product_id"], "s": row["status"], "t": row["created_ts"], "u": row["updated_at"]}
+            if row["wp_post_id"] is not None:
+                record["w"] = row["wp_post_id"]
+            if row["attempts"]:
+                record["a"] = row["attempts"]
+            if row["error_message"]:
+                record["e"] = str(row["error_message"])[:200]
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8", newline="\n") as f:
+            f.write("\n".join(lines) + "\n")
+        tmp_path.replace(path)
+        # 書き出した内容は取り込み済みとみなし、次回起動時の import_jsonl をスキップさせる
+        self._set_meta_for(site, f"jsonl_sha1:{path.name}", hashlib.sha1(path.read_bytes()).hexdigest())
+        return len(rows)
+
+    def import_jsonl(self, path: Path, site: str | None = None) -> int:
+        """export_jsonl の出力を取り込む（前回の取り込み/書き出しから内容が変わっていなければスキップ）"""
+        site = site or path.stem
+        raw = path.read_bytes()
+        digest = hashlib.sha1(raw).hexdigest()
+        digest_key = f"jsonl_sha1:{path.name}"
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM metadata WHERE site = ? AND key = ?",
+                (site, digest_key),
+            ).fetchone()
+        if row and row["value"] == digest:
+            return 0
+
+        records = []
+        meta: dict[str, str] = {}
+        for line in raw.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "_meta" in data:
+                meta = data["_meta"]
+                continue
+            created_ts = data.get("t")
+            records.append({
+                "site": site,
+                "product_id": data["p"],
+                "status": data["s"],
+                "wp_post_id": data.get("w"),
+                "created_at": datetime.fromtimestamp(created_ts).isoformat() if created_ts else "",
+                "error_message": data.get("e"),
+                "created_ts": created_ts,
+                "updated_at": data.get("u"),
+                "attempts": data.get("a", 0),
+            })
+        with self._connect() as conn:
+            conn.executemany(self._MERGE_SQL, records)
+            # 同期時刻などのメタ情報は未設定の場合のみ補う（ローカルの値を優先）
+            conn.executemany(
+                "INSERT OR IGNORE INTO metadata (site, key, value) VALUES (?, ?, ?)",
+                [(site, key, str(value)) for key, value in meta.items()],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata (site, key, value) VALUES (?, ?, ?)",
+                (site, digest_key, digest),
+            )
+            conn.commit()
+        logger.info(f"JSONLを取り込み: {path} -> site={site}, {len(records)}件")
+        return len(records)
+
+    def _set_meta_for(self, site: str, key: str, value: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata (site, key, value) VALUES (?, ?, ?)",
+                (site, key, value),
+            )
+            conn.commit()
+
+    def import_snapshots(self, data_dir: Path, jsonl_dir: Path) -> dict[str, int]:
+        """
+        起動時の取り込み: 旧サイト別DB (posted_*.sqlite3) と サイト別JSONL (jsonl_dir/*.jsonl)
+        戻り値は site ごとの取り込み件数（変更なしでスキップしたものは含まない）
+        """
+        imported: dict[str, int] = {}
+        for legacy_path in sorted(data_dir.glob("posted_*.sqlite3")):
+            site = legacy_site_key(legacy_path)
+            try:
+                count = self.import_legacy_db(legacy_path, site)
+            except sqlite3.Error as e:
+                logger.warning(f"旧DB取り込み失敗: {legacy_path}, error={e}")
+                continue
+            if count:
+                imported[site] = imported.get(site, 0) + count
+        if jsonl_dir.exists():
+            for path in sorted(jsonl_dir.glob("*.jsonl")):
+                count = self.import_jsonl(path)
+                if count:
+                    imported[path.stem] = imported.get(path.stem, 0) + count
+        return imported
+
+
+def legacy_site_key(path: Path) -> str:
+    """旧DBファイル名からサイトキーを得る (posted_sd01-chichi.sqlite3 -> sd01-chichi)"""
+    stem = path.stem
+    return stem[len("posted_"):] if stem.startswith("posted_") else DEFAULT_SITE
@@ -0,0 +1,215 @@
+"""
+SQLiteレスポンスキャッシュ
+
+外部APIのJSONレスポンスを「名前空間 + 正規化したクエリ」単位で保存する。
+- エントリごとにTTLを持ち、期限切れは通常は使わない（API失敗時のみ stale として再利用できる）
+- 合計サイズが上限を超えたら最終アクセスの古い順に削除する
+- 読み出しのたびにディスクへ書かないよう、最終アクセスの更新はまとめて書き、合計サイズは手元で数える
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+CacheMode = Literal["use", "refresh", "bypass"]
+
+CACHE_MODES: tuple[str, ...] = ("use", "refresh", "bypass")
+
+
+class ResponseCache:
+    """
+    TTL付きの永続レスポンスキャッシュ
+    mode:
+      use     - 期限内のエントリを返し、取得結果を保存する（通常運用）
+      refresh - 読み出しはせず、取得結果で上書き保存する（キャッシュの作り直し）
+      bypass  - 読み書きともに行わない（デバッグ用）
+    """
+
+    # 最終アクセスの記録粒度（これより新しければ更新しない）と、まとめて書き込む件数/間隔
+    ACCESS_RESOLUTION = 60
+    ACCESS_FLUSH_SIZE = 64
+    ACCESS_FLUSH_INTERVAL = 30.0
+
+    def __init__(
+        self,
+        db_path: Path,
+        mode: CacheMode = "use",
+        max_bytes: int = 64 * 1024 * 1024,
+        ignore_params: tuple[str, ...] = ("api_id",),
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"無効なキャッシュモード: {mode}")
+        self.db_path = db_path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        # APIキーなど結果に影響しない/保存したくないパラメータはキーに含めない
+        self.ignore_params = set(ignore_params)
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "stores": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        # 未書き込みの最終アクセス {(namespace, key): 時刻} と、保存済みエントリの合計サイズ
+        self._pending_access: dict[tuple[str, str], int] = {}
+        self._pending_since = 0.0
+        self._total_size = 0
+        if mode != "bypass":
+            self._open()
+
+    def _open(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                last_access INTEGER NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        conn.commit()
+        self._conn = conn
+        self._total_size = self._sum_size()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._flush_access()
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def _sum_size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _touch(self, namespace: str, key: str, last_access: int, now: int) -> None:
+        """最終アクセスの更新を溜め、件数か経過時間が閾値を超えたらまとめて書く（ロック内で呼ぶ）"""
+        if now - last_access < self.ACCESS_RESOLUTION:
+            return
+        if not self._pending_access:
+            self._pending_since = time.monotonic()
+        self._pending_access[(namespace, key)] = now
+        if (
+            len(self._pending_access) >= self.ACCESS_FLUSH_SIZE
+            or time.monotonic() - self._pending_since >= self.ACCESS_FLUSH_INTERVAL
+        ):
+            self._flush_access()
+            self._conn.commit()
+
+    def _flush_access(self) -> None:
+        if not self._pending_access:
+            return
+        self._conn.executemany(
+            "UPDATE responses SET last_access = ? WHERE namespace = ? AND key = ?",
+            [(ts, namespace, key) for (namespace, key), ts in self._pending_access.items()],
+        )
+        self._pending_access.clear()
+
+    def make_key(self, params: dict[str, Any]) -> str:
+        """クエリパラメータを正規化してキー化（順序・型の違いを吸収）"""
+        normalized = {
+            str(k): str(v)
+            for k, v in params.items()
+            if v is not None and str(k) not in self.ignore_params
+        }
+        raw = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, namespace: str, key: str, allow_stale: bool = False) -> Any | None:
+        """
+        キャッシュを取得（無い/期限切れはNone）
+        allow_stale=True の場合は期限切れでも返す（API障害時のフォールバック用、refreshモードでも有効）
+        """
+        if self._conn is None or (self.mode != "use" and not allow_stale):
+            return None
+        now = int(time.time())
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, expires_at, last_access FROM responses WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is None or (row[1] <= now and not allow_stale):
+                if not allow_stale:
+                    self.stats["misses"] += 1
+                return None
+            self._touch(namespace, key, row[2], now)
+            self.stats["stale_hits" if row[1] <= now else "hits"] += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def contains(self, namespace: str, key: str) -> bool:
+        """期限内のエントリがあるか（統計・最終アクセスは更新しない。bypassモードでは常にFalse）"""
+        if self._conn is None:
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM responses WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, int(time.time())),
+            ).fetchone()
+        return row is not None
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: int) -> None:
+        """キャッシュを保存（上限超過時は古いものから削除）"""
+        if self._conn is None or ttl_seconds <= 0:
+            return
+        body = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        now = int(time.time())
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM responses WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            self._pending_access.pop((namespace, key), None)
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                (namespace, key, body, size, created_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (namespace, key, body, len(body), now, now + ttl_seconds, now),
+            )
+            self._total_size += len(body) - (previous[0] if previous else 0)
+            self.stats["stores"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: int) -> None:
+        """合計サイズが上限を超えたら、最終アクセスの古い順に上限の9割まで削除"""
+        if self._total_size <= self.max_bytes:
+            return
+        # 他プロセスの書き込みも反映するため、削除の判断前に実際の合計と最終アクセスを揃える
+        self._flush_access()
+        total = self._sum_size()
+        if total <= self.max_bytes:
+            self._total_size = total
+            return
+        # 期限切れから優先的に消す（1日以上前に切れたものはstale再利用の価値も低い）
+        cursor = self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (now - 86400,))
+        evicted = cursor.rowcount
+        total = self._sum_size()
+        target = int(self.max_bytes * 0.9)
+        if total > target:
+            rows = self._conn.execute(
+                "SELECT namespace, key, size FROM responses ORDER BY last_access ASC"
+            ).fetchall()
+            victims = []
+            for namespace, key, size in rows:
+                if total <= target:
+                    break
+                victims.append((namespace, key))
+                total -= size
+            self._conn.executemany("DELETE FROM responses WHERE namespace = ? AND key = ?", victims)
+            evicted += len(victims)
+        self._total_size = total
+        self.stats["evicted"] += evicted
+        logger.info(f"レスポンスキャッシュ削除: {evicted}件 (上限 {self.max_bytes // 1024}KB)")
@@ -6,6 +6,8 @@ import tempfile
 from pathlib import Path
 import requests
 
+from src.clients.ratelimit import send_with_limits
+
 logger = logging.getLogger(__name__)
 
 class ImagePlaceholderError(Exception):
@@ -32,7 +34,7 @@ class ImageTools:
         save_path = self.temp_dir / filename
         logger.info(f"画像ダウンロード: {url}")
         try:
-            response = self.session.get(url, timeout=30, stream=True)
+            response = send_with_limits(self.session, "GET", url, max_attempts=3, timeout=30, stream=True)
             response.raise_for_status()
             with open(save_path, "wb") as f:
                 for chunk in response.iter_content(chunk_size=8192):
@@ -50,7 +52,7 @@ class ImageTools:
             filename = "image.jpg"
         logger.info(f"画像ダウンロード（メモリ）: {url}")
         try:
-            response = self.session.get(url, timeout=30)
+            response = send_with_limits(self.session, "GET", url, max_attempts=3, timeout=30)
             response.raise_for_status()
             mime_type = response.headers.get("Content-Type", "image/jpeg")
             content_size = len(response.content)
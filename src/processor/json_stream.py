@@ -0,0 +1,145 @@
+"""
+ストリーミング生成中のJSON構造チェック
+
+トークンが届くたびに括弧の対応・トップレベルのキーと値の並び・必須キーの型を追い、
+明らかに壊れた応答は生成完了を待たずに打ち切れるようにする。
+値の中身（数値や文字列の書式）までは見ない。最終的な検査は完了後の json.loads で行う。
+"""
+from typing import Mapping
+
+# 必須キーと、その値が始まるべき文字
+REQUIRED_ARTICLE_KEYS: dict[str, str] = {"scenes": "[", "faq": "[", "ratings": "{"}
+
+_CLOSERS = {"}": "{", "]": "["}
+_WHITESPACE = " \t\r\n"
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+class JSONStreamError(ValueError):
+    """ストリーム中の応答がJSONとして成立しない/必須キーを満たさない"""
+
+
+class StreamingJSONChecker:
+    """
+    1つのJSONオブジェクトを少しずつ受け取り、構造の破綻を検出したら JSONStreamError を送出する。
+    - 先頭が '{' でない / 括弧の対応が合わない / オブジェクトの後に余分な文字がある
+    - トップレベルでキーと値の並びが崩れている
+    - 必須キーの値の型が違う（値の先頭1文字で判定）/ オブジェクトが閉じた時点で必須キーが無い
+    """
+
+    def __init__(self, required: Mapping[str, str] | None = None):
+        self.required = dict(REQUIRED_ARTICLE_KEYS if required is None else required)
+        self.seen_keys: set[str] = set()
+        self.length = 0
+        self.closed = False
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        # トップレベルの状態: key → colon → value → (scalar) → comma → key ...
+        self._state = "key"
+        self._key_chars: list[str] | None = None
+        self._key = ""
+
+    def _fail(self, message: str) -> None:
+        raise JSONStreamError(f"{message} (位置 {self.length})")
+
+    def feed(self, text: str) -> None:
+        """受け取った断片を検査する"""
+        for ch in text:
+            self._feed_char(ch)
+            self.length += 1
+
+    def finish(self) -> None:
+        """ストリーム終了時の検査（オブジェクトが閉じていなければ途中で切れている）"""
+        if not self.closed:
+            self._fail("JSONが途中で終わっています")
+
+    def _feed_char(self, ch: str) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+                if self._key_chars is not None:
+                    self._key_chars.append(_ESCAPES.get(ch, ch))
+                return
+            if ch == "\\":
+                # キーにはバックスラッシュを含めず、次の文字を復元して記録する（\uXXXX は近似）
+                self._escape = True
+                return
+            if ch == '"':
+                self._in_string = False
+                if self._key_chars is not None:
+                    self._key = "".join(self._key_chars)
+                    self._key_chars = None
+                    self.seen_keys.add(self._key)
+                    self._state = "colon"
+                elif len(self._stack) == 1:
+                    self._state = "comma"
+                return
+            if self._key_chars is not None:
+                self._key_chars.append(ch)
+            return
+
+        if ch in _WHITESPACE:
+            return
+        depth = len(self._stack)
+        if depth == 0:
+            if self.closed:
+                self._fail("JSONオブジェクトの後に余分な文字があります")
+            if ch != "{":
+                self._fail(f"JSONオブジェクトで始まっていません: {ch!r}")
+            self._stack.append(ch)
+            return
+
+        if ch in _CLOSERS:
+            if self._stack[-1] != _CLOSERS[ch]:
+                self._fail(f"括弧の対応が不正です: {ch!r}")
+            if depth == 1 and self._state not in ("key", "comma", "scalar"):
+                self._fail("値の無いキーがあります")
+            self._stack.pop()
+            if depth == 1:
+                self.closed = True
+                missing = [key for key in self.required if key not in self.seen_keys]
+                if missing:
+                    self._fail(f"必須キーがありません: {', '.join(missing)}")
+            elif depth == 2:
+                self._state = "comma"
+            return
+
+        if depth > 1:
+            # 入れ子の中は括弧と文字列の境界だけを追う
+            if ch in "{[":
+                self._stack.append(ch)
+            elif ch == '"':
+                self._in_string = True
+            return
+
+        # トップレベルのオブジェクト直下
+        if ch == '"':
+            if self._state == "key":
+                self._key_chars = []
+            elif self._state == "value":
+                self._check_value_start(ch)
+            else:
+                self._fail("キーと値の並びが不正です")
+            self._in_string = True
+        elif ch == ":":
+            if self._state != "colon":
+                self._fail("キーと値の並びが不正です")
+            self._state = "value"
+        elif ch == ",":
+            if self._state not in ("comma", "scalar"):
+                self._fail("キーと値の並びが不正です")
+            self._state = "key"
+        elif self._state == "value":
+            self._check_value_start(ch)
+            if ch in "{[":
+                self._stack.append(ch)
+            else:
+                self._state = "scalar"
+        elif self._state != "scalar":
+            self._fail(f"キーと値の並びが不正です: {ch!r}")
+
+    def _check_value_start(self, ch: str) -> None:
+        expected = self.required.get(self._key)
+        if expected is not None and ch != expected:
+            self._fail(f"{self._key} の型が不正です（{expected!r} で始まるべきところが {ch!r}）")
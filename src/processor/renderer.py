@@ -6,6 +6,8 @@ from pathlib import Path
 from typing import Any
 from urllib.parse import parse_qs, quote_plus, urlparse
 
+from src.core.models import Product
+
 logger = logging.getLogger(__name__)
 
 class Renderer:
@@ -561,7 +563,7 @@ class Renderer:
                 return v.strip()
         return fallback
 
-    def _render_post_content_main(self, item: dict, ai_response: dict, related_posts: list[dict] | None = None) -> str:
+    def _render_post_content_main(self, item: Product, ai_response: dict, related_posts: list[dict] | None = None) -> str:
         title = self._escape(item.get("title", ""))
         package_image = self._escape(item.get("package_image_url", ""))
         aff_url = self._escape(item.get("affiliate_url", ""))
@@ -700,7 +702,7 @@ class Renderer:
 
     def render_post_content(
         self,
-        item: dict,
+        item: Product,
         ai_response: dict,
         site_id: str = "default",
         related_posts: list[dict] | None = None,
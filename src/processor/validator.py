@@ -3,11 +3,16 @@
 """
 import re
 import logging
+from collections import deque
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping
 
 logger = logging.getLogger(__name__)
 
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+_SENTENCE_SPLIT_PATTERN = re.compile(r"[。！？\n]")
+
 
 @dataclass
 class ValidationResult:
@@ -15,6 +20,72 @@ class ValidationResult:
     is_valid: bool
     errors: list[str]
     warnings: list[str]
+    # 照合で見つかった語（種類 -> 語のリスト。banned/heading/age_notice/ad_notice）
+    matches: dict[str, list[str]] = field(default_factory=dict)
+
+
+class PatternMatcher:
+    """
+    Aho-Corasick法による複数語の一括照合
+    構築時にトライと失敗遷移を作っておき、本文を1文字ずつ1回走査するだけで全ての語の出現を見つける
+    （照合コストは本文長に比例し、語の数にはほぼ依存しない）。
+    """
+
+    def __init__(self, patterns: Mapping[str, Iterable[str]]):
+        """patterns: {語: その語の種類（複数可）}"""
+        self._goto: list[dict[str, int]] = [{}]
+        self._output: list[tuple[str, ...]] = [()]
+        self.kinds: dict[str, frozenset[str]] = {}
+        for word, kinds in patterns.items():
+            if not word:
+                continue
+            self.kinds[word] = frozenset(kinds)
+            state = 0
+            for ch in word:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._output.append(())
+                state = nxt
+            self._output[state] = (word,)
+
+        # 幅優先で失敗遷移を作り、失敗先の出力を引き継ぐ（接尾辞として含まれる語も報告するため）
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._output[nxt] += self._output[self._fail[nxt]]
+
+    def find_all(self, text: str) -> set[str]:
+        """本文に出現する語の集合を返す（重なった出現も含む）"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found: set[str] = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def scan(self, text: str) -> dict[str, list[str]]:
+        """本文を1回走査し、見つかった語を種類ごとにまとめて返す"""
+        matches: dict[str, list[str]] = {}
+        for word in sorted(self.find_all(text)):
+            for kind in self.kinds[word]:
+                matches.setdefault(kind, []).append(word)
+        return matches
 
 
 class Validator:
@@ -28,27 +99,56 @@ class Validator:
         "刺さらん人",
     ]
     
-    # 連続語尾パターン
+    # 18歳未満閲覧禁止の注意書き / アフィリエイト表記（いずれか1つあればよい）
+    AGE_NOTICE_WORDS = ["18歳未満", "18禁"]
+    AD_NOTICE_WORDS = ["アフィリエイト", "広告", "PR"]
+    
+    # 連続を検出する語尾（REPEATED_ENDING_MIN 回以上続いたら警告）
     REPEATED_ENDINGS = [
-        r"(です。){3,}",
-        r"(ます。){3,}",
-        r"(でしょう。){3,}",
-        r"(ですね。){3,}",
-        r"(ました。){3,}",
+        "です。",
+        "ます。",
+        "でしょう。",
+        "ですね。",
+        "ました。",
     ]
+    REPEATED_ENDING_MIN = 3
+    
+    # AI応答で空であってはならない項目
+    REQUIRED_AI_FIELDS = ["title", "summary"]
     
     def __init__(
         self,
         min_chars: int = 800,
         max_chars: int = 1500,
         banned_words_path: Path | None = None,
+        min_scenes: int = 1,
+        min_response_chars: int = 300,
     ):
         self.min_chars = min_chars
         self.max_chars = max_chars
+        self.min_scenes = min_scenes
+        self.min_response_chars = min_response_chars
         self.banned_words: set[str] = set()
         
         if banned_words_path and banned_words_path.exists():
             self._load_banned_words(banned_words_path)
+        self._build_matchers()
+    
+    def _build_matchers(self) -> None:
+        """禁止ワード・必須見出し・注意書きの照合器と、連続語尾の正規表現を事前に作る"""
+        patterns: dict[str, set[str]] = {}
+        for kind, words in (
+            ("banned", self.banned_words),
+            ("heading", self.REQUIRED_HEADINGS),
+            ("age_notice", self.AGE_NOTICE_WORDS),
+            ("ad_notice", self.AD_NOTICE_WORDS),
+        ):
+            for word in words:
+                patterns.setdefault(word, set()).add(kind)
+        self._matcher = PatternMatcher(patterns)
+        # 各語尾の (語尾){N,} を1本にまとめる（後方参照で同じ語尾の連続だけに一致させる）
+        endings = "|".join(re.escape(e) for e in sorted(self.REPEATED_ENDINGS, key=len, reverse=True))
+        self._repeated_endings = re.compile(f"({endings})\\1{{{self.REPEATED_ENDING_MIN - 1},}}")
     
     def _load_banned_words(self, path: Path) -> None:
         """禁止ワードを読み込む"""
@@ -73,7 +173,7 @@ class Validator:
         warnings = []
         
         # HTMLタグを除去して純粋なテキスト長を計算
-        plain_text = re.sub(r"<[^>]+>", "", content)
+        plain_text = _TAG_PATTERN.sub("", content)
         char_count = len(plain_text)
         
         # 1. 文字数チェック
@@ -82,44 +182,32 @@ class Validator:
         elif char_count > self.max_chars * 1.5:  # 上限は警告のみ
             warnings.append(f"文字数が多すぎ: {char_count}文字（推奨{self.max_chars}文字以下）")
         
+        # 2〜5. 禁止ワード・必須見出し・注意書きを1回の走査でまとめて照合
+        matches = self._matcher.scan(content)
+        
         # 2. 禁止ワードチェック
-        for word in self.banned_words:
-            if word in content:
-                errors.append(f"禁止ワード検出: {word}")
+        for word in matches.get("banned", []):
+            errors.append(f"禁止ワード検出: {word}")
         
         # 3. 連続語尾チェック
-        for pattern in self.REPEATED_ENDINGS:
-            if re.search(pattern, plain_text):
-                warnings.append(f"同じ語尾が連続しています: {pattern}")
+        self._check_repeated_endings(plain_text, warnings)
         
         # 4. 必須見出しチェック
-        missing_headings = []
-        for heading in self.REQUIRED_HEADINGS:
-            if heading not in content:
-                missing_headings.append(heading)
+        found_headings = set(matches.get("heading", []))
+        missing_headings = [h for h in self.REQUIRED_HEADINGS if h not in found_headings]
         
         if missing_headings:
             errors.append(f"必須見出しが不足: {', '.join(missing_headings)}")
         
         # 5. 注意書きチェック
-        if "18歳未満" not in content and "18禁" not in content:
+        if not matches.get("age_notice"):
             errors.append("18歳未満閲覧禁止の注意書きがありません")
         
-        if "アフィリエイト" not in content and "広告" not in content and "PR" not in content:
+        if not matches.get("ad_notice"):
             warnings.append("アフィリエイト表記がありません")
         
         # 6. 同じフレーズの繰り返しチェック（簡易）
-        sentences = re.split(r"[。！？\n]", plain_text)
-        seen_phrases = {}
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if len(sentence) > 20:  # 短い文は無視
-                if sentence in seen_phrases:
-                    seen_phrases[sentence] += 1
-                    if seen_phrases[sentence] >= 2:
-                        warnings.append(f"同じ文が繰り返されています: {sentence[:30]}...")
-                else:
-                    seen_phrases[sentence] = 1
+        self._check_repeated_sentences(plain_text, warnings)
         
         is_valid = len(errors) == 0
         
@@ -132,4 +220,89 @@ class Validator:
             is_valid=is_valid,
             errors=errors,
             warnings=warnings,
+            matches=matches,
         )
+    
+    def validate_ai_response(self, ai_response: dict) -> ValidationResult:
+        """
+        AI応答（構造化JSON）をバリデート
+        画像アップロードや投稿の前に、生成直後の応答だけで判定できる項目を検査する。
+        （必須見出しや注意書きはテンプレート側で入るため、ここでは見ない）
+        
+        Args:
+            ai_response: OpenAIClient.generate の戻り値
+        
+        Returns:
+            ValidationResult
+        """
+        errors = []
+        warnings = []
+        
+        # 1. 必須項目チェック
+        missing = [key for key in self.REQUIRED_AI_FIELDS if not str(ai_response.get(key) or "").strip()]
+        if missing:
+            errors.append(f"AI応答の必須項目が空です: {', '.join(missing)}")
+        
+        scenes = [s for s in ai_response.get("scenes") or [] if isinstance(s, dict) and str(s.get("points") or "").strip()]
+        if len(scenes) < self.min_scenes:
+            errors.append(f"シーン説明が不足: {len(scenes)}件（最低{self.min_scenes}件必要）")
+        
+        # 2. 文字数チェック（生成された文章の合計）
+        texts = list(_iter_texts({k: v for k, v in ai_response.items() if k != "raw_response"}))
+        plain_text = _TAG_PATTERN.sub("", "\n".join(texts))
+        char_count = len(plain_text)
+        if char_count < self.min_response_chars:
+            errors.append(f"AI応答の文字数不足: {char_count}文字（最低{self.min_response_chars}文字必要）")
+        
+        # 3. 禁止ワードチェック（全項目の文章を1回で走査）
+        matches = self._matcher.scan(plain_text)
+        for word in matches.get("banned", []):
+            errors.append(f"禁止ワード検出: {word}")
+        
+        # 4. 連続語尾・同じ文の繰り返し
+        self._check_repeated_endings(plain_text, warnings)
+        self._check_repeated_sentences(plain_text, warnings)
+        
+        if errors:
+            logger.warning(f"AI応答バリデーションエラー: {errors}")
+        if warnings:
+            logger.info(f"AI応答バリデーション警告: {warnings}")
+        
+        return ValidationResult(
+            is_valid=not errors,
+            errors=errors,
+            warnings=warnings,
+            matches={k: v for k, v in matches.items() if k == "banned"},
+        )
+    
+    def _check_repeated_endings(self, plain_text: str, warnings: list[str]) -> None:
+        repeated = dict.fromkeys(m.group(1) for m in self._repeated_endings.finditer(plain_text))
+        for ending in repeated:
+            warnings.append(f"同じ語尾が連続しています: ({ending}){{{self.REPEATED_ENDING_MIN},}}")
+    
+    @staticmethod
+    def _check_repeated_sentences(plain_text: str, warnings: list[str]) -> None:
+        sentences = _SENTENCE_SPLIT_PATTERN.split(plain_text)
+        seen_phrases = {}
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if len(sentence) > 20:  # 短い文は無視
+                if sentence in seen_phrases:
+                    seen_phrases[sentence] += 1
+                    if seen_phrases[sentence] >= 2:
+                        warnings.append(f"同じ文が繰り返されています: {sentence[:30]}...")
+                else:
+                    seen_phrases[sentence] = 1
+
+
+def _iter_texts(value: object) -> Iterable[str]:
+    """AI応答に含まれる文字列を再帰的に取り出す"""
+    if isinstance(value, str):
+        if value:
+            yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _iter_texts(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _iter_texts(v)
@@ -0,0 +1,224 @@
+"""
+ステージ分割パイプライン - 有界キューで各ステージのワーカープールを連結する
+"""
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# ステージ関数: ジョブを受け取り、続行ならNone、早期終了なら結果文字列を返す
+StageFunc = Callable[[Any], str | None]
+
+_SENTINEL = object()
+
+
+@dataclass
+class Stage:
+    """パイプラインの1ステージ"""
+    name: str
+    func: StageFunc
+    workers: int = 1
+
+
+@dataclass
+class StageStats:
+    """ステージ単位の計測値"""
+    name: str
+    workers: int
+    processed: int = 0
+    finished_early: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    queue_depth: int = 0
+    queue_size: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, elapsed: float, outcome: str) -> None:
+        with self._lock:
+            self.processed += 1
+            self.busy_seconds += elapsed
+            if outcome == "early":
+                self.finished_early += 1
+            elif outcome == "failed":
+                self.failed += 1
+
+    def to_dict(self, wall_seconds: float) -> dict[str, Any]:
+        with self._lock:
+            # 稼働率: ワーカー全体の延べ時間に対する処理時間の割合（1.0に近いほどボトルネック）
+            capacity = max(wall_seconds, 1e-9) * max(self.workers, 1)
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "processed": self.processed,
+                "finished_early": self.finished_early,
+                "failed": self.failed,
+                "queue_depth": self.queue_depth,
+                "queue_size": self.queue_size,
+                "throughput_per_min": round(self.processed / max(wall_seconds, 1e-9) * 60, 2),
+                "avg_seconds": round(self.busy_seconds / self.processed, 2) if self.processed else 0.0,
+                "utilization": round(self.busy_seconds / capacity, 2),
+            }
+
+
+class StagedPipeline:
+    """
+    source → stage1 → stage2 → ... を有界キューでつなぐプロデューサ/コンシューマ型パイプライン。
+
+    - source（候補取得）は専用スレッドで反復し、make_job でジョブ化して最初のキューへ投入する
+    - 各ステージは独自のワーカープールを持ち、キューが満杯なら上流が待つ（背圧）
+    - ステージが結果文字列を返した時点、または最終ステージ完了時点で on_finish を呼ぶ
+    - 例外は on_error(job, exc) で結果文字列に変換する
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        make_job: Callable[[int, Any], Any],
+        on_finish: Callable[[Any, str], None] | None = None,
+        on_error: Callable[[Any, Exception], str] | None = None,
+        queue_size: int = 4,
+        report_interval: float = 30.0,
+    ):
+        if not stages:
+            raise ValueError("stagesを1つ以上指定してください")
+        self.stages = stages
+        self.make_job = make_job
+        self.on_finish = on_finish
+        self.on_error = on_error
+        self.queue_size = max(queue_size, 1)
+        self.report_interval = report_interval
+        self._queues: list[queue.Queue] = [queue.Queue(maxsize=self.queue_size) for _ in stages]
+        self._fetch_stats = StageStats(name="fetch", workers=1)
+        self._stats = [StageStats(name=s.name, workers=max(s.workers, 1), queue_size=self.queue_size) for s in stages]
+        self._remaining = [max(s.workers, 1) for s in stages]
+        self._remaining_lock = threading.Lock()
+        self._finish_lock = threading.Lock()
+        self._started_at = 0.0
+        self._done = threading.Event()
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        """各ステージのキュー深さとスループットを返す"""
+        wall = time.monotonic() - self._started_at if self._started_at else 0.0
+        for st, q in zip(self._stats, self._queues):
+            st.queue_depth = q.qsize()
+        return [self._fetch_stats.to_dict(wall)] + [st.to_dict(wall) for st in self._stats]
+
+    def log_snapshot(self, level: int = logging.INFO) -> None:
+        for row in self.snapshot():
+            logger.log(
+                level,
+                "pipeline[%s] workers=%s processed=%s early=%s failed=%s queue=%s/%s "
+                "throughput=%s/min avg=%ss util=%s",
+                row["stage"], row["workers"], row["processed"], row["finished_early"], row["failed"],
+                row["queue_depth"], row["queue_size"], row["throughput_per_min"],
+                row["avg_seconds"], row["utilization"],
+            )
+
+    def run(self, source: Iterable[Any]) -> list[dict[str, Any]]:
+        """sourceを最後まで流し切り、最終スナップショットを返す"""
+        self._started_at = time.monotonic()
+        threads: list[threading.Thread] = [
+            threading.Thread(target=self._feed, args=(source,), name="pipeline-fetch", daemon=True)
+        ]
+        for i, stage in enumerate(self.stages):
+            for n in range(max(stage.workers, 1)):
+                threads.append(
+                    threading.Thread(target=self._work, args=(i,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+                )
+        reporter = threading.Thread(target=self._report, name="pipeline-report", daemon=True)
+
+        for t in threads:
+            t.start()
+        reporter.start()
+        for t in threads:
+            t.join()
+        self._done.set()
+        reporter.join()
+
+        self.log_snapshot()
+        return self.snapshot()
+
+    def _feed(self, source: Iterable[Any]) -> None:
+        idx = 0
+        try:
+            iterator = iter(source)
+            while True:
+                started = time.monotonic()
+                try:
+                    raw = next(iterator)
+                except StopIteration:
+                    break
+                idx += 1
+                self._fetch_stats.record(time.monotonic() - started, "ok")
+                self._queues[0].put(self.make_job(idx, raw))
+        except Exception as e:
+            logger.error(f"パイプライン候補取得エラー: {e}")
+        finally:
+            for _ in range(max(self.stages[0].workers, 1)):
+                self._queues[0].put(_SENTINEL)
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        stats = self._stats[index]
+        in_q = self._queues[index]
+        is_last = index == len(self.stages) - 1
+
+        try:
+            while True:
+                job = in_q.get()
+                if job is _SENTINEL:
+                    break
+                started = time.monotonic()
+                try:
+                    result = stage.func(job)
+                except Exception as e:
+                    stats.record(time.monotonic() - started, "failed")
+                    self._finish(job, self._handle_error(job, e))
+                    continue
+
+                if result is not None:
+                    stats.record(time.monotonic() - started, "early" if not is_last else "ok")
+                    self._finish(job, result)
+                elif is_last:
+                    stats.record(time.monotonic() - started, "ok")
+                    self._finish(job, "success")
+                else:
+                    stats.record(time.monotonic() - started, "ok")
+                    self._queues[index + 1].put(job)
+        finally:
+            # このステージの最後のワーカーが終了したら次ステージへ終了を伝播（ワーカーが異常終了しても止まらないように）
+            with self._remaining_lock:
+                self._remaining[index] -= 1
+                last_worker = self._remaining[index] == 0
+            if last_worker and not is_last:
+                for _ in range(max(self.stages[index + 1].workers, 1)):
+                    self._queues[index + 1].put(_SENTINEL)
+
+    def _handle_error(self, job: Any, error: Exception) -> str:
+        """ステージ内の例外を on_error に渡す（on_error 自体が失敗しても failure として続行）"""
+        if self.on_error is None:
+            return "failure"
+        try:
+            return self.on_error(job, error) or "failure"
+        except Exception as e:
+            logger.error(f"パイプラインエラーコールバック失敗: {e}")
+            return "failure"
+
+    def _finish(self, job: Any, result: str) -> None:
+        if self.on_finish is None:
+            return
+        with self._finish_lock:
+            try:
+                self.on_finish(job, result)
+            except Exception as e:
+                logger.warning(f"パイプライン完了コールバック失敗: {e}")
+
+    def _report(self) -> None:
+        if self.report_interval <= 0:
+            return
+        while not self._done.wait(self.report_interval):
+            self.log_snapshot()
@@ -5,24 +5,68 @@ import logging
 import os
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from urllib.parse import urlparse
 
 from src.core.models import Product, AIResponse
+from src.core.categories import classify_big_category
 from src.core.config import Config
 from src.clients.fanza import FanzaClient
 from src.clients.wordpress import WPClient
-from src.clients.openai import OpenAIClient
+from src.clients.openai import MalformedResponseError, OpenAIClient, PregeneratedArticleMissing
 from src.database.dedupe import DedupeStore
 from src.processor.renderer import Renderer
 from src.processor.images import ImageTools, ImagePlaceholderError
+from src.processor.validator import Validator
+from src.services.pipeline import Stage
 
 
 logger = logging.getLogger(__name__)
 
+# シーン説明に使うサンプル画像の位置（足りなければ先頭から補う）
+SCENE_IMAGE_POSITIONS = (2, 5, 8)
+
+
+def select_scene_images(sample_pool: list[str], count: int = 3) -> list[str]:
+    """サンプル画像からシーン用の画像を選ぶ（事前生成でも同じ画像になるよう決定的に選ぶ）"""
+    scene_image_urls = [sample_pool[t] for t in SCENE_IMAGE_POSITIONS if t < len(sample_pool)]
+    if len(scene_image_urls) < count:
+        for url in sample_pool:
+            if url not in scene_image_urls:
+                scene_image_urls.append(url)
+            if len(scene_image_urls) >= count:
+                break
+    return scene_image_urls
+
+
+@dataclass
+class PostJob:
+    """1商品分の処理状態（ステージ間で受け渡す）"""
+    idx: int
+    total: int
+    item: Product
+    product_id: str
+    dry_run: bool = False
+    site_info: Any = None
+    sample_pool: list[str] = field(default_factory=list)
+    scene_image_urls: list[str] = field(default_factory=list)
+    ai_response: dict | None = None
+    site_id: str = "default"
+    render_site_id: str = "default"
+    selected_big_cat: str = "動画"
+    category_ids: list[int] = field(default_factory=list)
+    tag_ids: list[int] = field(default_factory=list)
+    related_posts: list[dict] = field(default_factory=list)
+    content_html: str = ""
+
+
 class PosterService:
     """記事投稿のワークフローを管理"""
-    
+
+    # パイプラインのステージ順（process_item も同じ順で実行する）
+    STAGE_NAMES = ("claim", "generate", "upload", "taxonomy", "render", "post")
+
     def __init__(
         self,
         config: Config,
@@ -32,6 +76,8 @@ class PosterService:
         renderer: Renderer,
         dedupe_store: DedupeStore,
         image_tools: ImageTools,
+        validator: Validator | None = None,
+        max_regenerations: int = 1,
     ):
         self.config = config
         self.fanza_client = fanza_client
@@ -40,238 +86,301 @@ class PosterService:
         self.renderer = renderer
         self.dedupe_store = dedupe_store
         self.image_tools = image_tools
+        # 生成直後の検品（不合格なら画像処理の前に再生成/中止する）
+        self.validator = validator
+        self.max_regenerations = max(max_regenerations, 0)
+
+    def build_job(self, idx: int, total: int, item: Product | dict, dry_run: bool = False, site_info: Any = None) -> PostJob:
+        """商品（Product または同じキーを持つdict）から処理ジョブを作成"""
+        item = Product.coerce(item)
+        product_id = str(item.product_id).lower()
+        item.product_id = product_id
+        return PostJob(idx=idx, total=total, item=item, product_id=product_id, dry_run=dry_run, site_info=site_info)
+
+    def pipeline_stages(self, workers: dict[str, int] | None = None) -> list[Stage]:
+        """StagedPipeline 用のステージ定義を返す"""
+        workers = workers or {}
+        return [Stage(name, getattr(self, f"stage_{name}"), workers.get(name, 1)) for name in self.STAGE_NAMES]
 
-    def process_item(self, idx: int, total: int, item: dict, dry_run: bool = False, site_info: Any = None) -> str:
+    def handle_failure(self, job: PostJob, error: Exception) -> str:
+        """ステージ内の例外を失敗として記録"""
+        logger.error(f"[{job.idx}/{job.total}] 処理失敗: {error}", exc_info=error)
+        self.dedupe_store.record_failure(job.product_id, str(error))
+        return "failure"
+
+    def process_item(self, idx: int, total: int, item: Product | dict, dry_run: bool = False, site_info: Any = None) -> str:
         """1件の商品を処理して投稿する"""
-        product_id = str(item['product_id']).lower()
-        item['product_id'] = product_id
+        job = self.build_job(idx, total, item, dry_run=dry_run, site_info=site_info)
         try:
-            # 既に投稿済み/処理中なら開始しない（原子的に確保）
-            if not self.dedupe_store.try_start(product_id):
-                logger.info(f"duplicate/processing skip: {product_id}")
+            for name in self.STAGE_NAMES:
+                result = getattr(self, f"stage_{name}")(job)
+                if result is not None:
+                    return result
+            return "success"
+        except Exception as e:
+            return self.handle_failure(job, e)
+
+    def stage_claim(self, job: PostJob) -> str | None:
+        """重複確保・WP側の既存チェック・シーン画像の選定"""
+        product_id = job.product_id
+        item = job.item
+
+        # 既に投稿済み/処理中なら開始しない（原子的に確保）
+        if not self.dedupe_store.try_start(product_id):
+            logger.info(f"duplicate/processing skip: {product_id}")
+            return "skip"
+        sys.stdout.flush()
+
+        # 最終チェック: すでにWP側に記事がないか確認
+        if not job.dry_run:
+            if self.wp_client.check_post_exists_by_fanza_id(product_id):
+                logger.info(f"スキップ: すでに同じFANZA IDの記事が存在します (WP側): {product_id}")
+                # ローカルDB側も成功扱いとして記録（次回以降is_postedで弾けるようにする）
+                self.dedupe_store.record_success(product_id, status="published")
                 return "skip"
-            sys.stdout.flush()
-            
-            # 最終チェック: すでにWP側に記事がないか確認
-            if not dry_run:
-                if self.wp_client.check_post_exists_by_fanza_id(product_id):
-                    logger.info(f"スキップ: すでに同じFANZA IDの記事が存在します (WP側): {product_id}")
-                    # ローカルDB側も成功扱いとして記録（次回以降is_postedで弾けるようにする）
-                    self.dedupe_store.record_success(product_id, status="published")
-                    return "skip"
-                    
-                if self.wp_client.check_post_exists_by_slug(product_id):
-                    logger.info(f"スキップ: すでにWordPress上に記事が存在します (slug match): {product_id}")
-                    self.dedupe_store.record_success(product_id, status="published")
-                    return "skip"
 
-            # シーン用の画像URLを決定
-            sample_pool = item.get("sample_image_urls", [])
-            if not sample_pool:
-                logger.warning(f"サンプル画像が1枚もないためスキップします: {product_id}")
+            if self.wp_client.check_post_exists_by_slug(product_id):
+                logger.info(f"スキップ: すでにWordPress上に記事が存在します (slug match): {product_id}")
+                self.dedupe_store.record_success(product_id, status="published")
                 return "skip"
-            
-            targets = [2, 5, 8]
-            scene_image_urls = []
-            for t in targets:
-                if t < len(sample_pool):
-                    scene_image_urls.append(sample_pool[t])
-            
-            if len(scene_image_urls) < 3:
-                for url in sample_pool:
-                    if url not in scene_image_urls:
-                        scene_image_urls.append(url)
-                    if len(scene_image_urls) >= 3:
-                        break
-            
-            logger.info(f"シーン用画像: {len(scene_image_urls)}枚を選択")
-            
-            # AI生成 (site_info を渡す)
-            ai_response = self.llm_client.generate(item=item, sample_image_urls=scene_image_urls, site_info=site_info)
-            sys.stdout.flush()
-            
-            logger.info(f"AI応答取得完了: title={ai_response.get('title', '')[:30]}...")
-            
-            # 画像アップロード
-            featured_media_id = None
-            package_media_id = None
-            use_cdn_images = os.environ.get("USE_CDN_IMAGES", "").lower() == "true"
-            require_featured_media = os.environ.get("REQUIRE_FEATURED_MEDIA", "false").lower() == "true"
-            
-            if use_cdn_images:
-                logger.info("USE_CDN_IMAGES=true: 画像アップロードをスキップしてCDN URLを直接使用")
-                # パッケージ画像はそのまま (FANZA CDN URL)
-                # シーン画像もそのまま使用
-                item["sample_image_urls"] = scene_image_urls[:3]
-                # アイキャッチ欠損防止のため、最低1枚だけはWPメディアにアップロードしてfeatured_mediaを確保する。
-                if not dry_run and item.get("package_image_url"):
-                    try:
-                        img_bytes, filename, mime_type = self.image_tools.download_to_bytes(item["package_image_url"])
-                        result = self.wp_client.upload_media(file_bytes=img_bytes, filename=filename, mime_type=mime_type)
-                        featured_media_id = result.get("id")
-                        logger.info(f"USE_CDN_IMAGES時のアイキャッチ確保アップロード完了: media_id={featured_media_id}")
-                    except ImagePlaceholderError as e:
-                        logger.warning(f"アイキャッチ用画像が未準備のためスキップ: {e}")
-                        return "skip"
-                    except Exception as e:
-                        logger.error(f"USE_CDN_IMAGES時のアイキャッチ確保アップロード失敗: {e}")
-                item["_featured_media_id"] = featured_media_id
-            elif not dry_run:
-                if item.get("package_image_url"):
-                    try:
-                        img_bytes, filename, mime_type = self.image_tools.download_to_bytes(item["package_image_url"])
-                        result = self.wp_client.upload_media(file_bytes=img_bytes, filename=filename, mime_type=mime_type)
-                        item["package_image_url"] = result.get("source_url", item["package_image_url"])
-                        package_media_id = result.get("id")
-                        logger.info(f"パッケージ画像アップロード完了: {item['package_image_url']}")
-                    except ImagePlaceholderError as e:
-                        logger.warning(f"画像がまだ準備されていません。スキップ: {e}")
-                        return "skip"
-                    except Exception as e:
-                        logger.warning(f"パッケージ画像アップロード失敗。CDN画像で継続します: {e}")
-                
-                # 画像アップロードの並列化
-                new_sample_urls = [None] * len(scene_image_urls[:3])
-                
-                def upload_task(url, index, is_featured=False):
-                    try:
-                        img_bytes, filename, mime_type = self.image_tools.download_to_bytes(url)
-                        result = self.wp_client.upload_media(file_bytes=img_bytes, filename=filename, mime_type=mime_type)
-                        return {"index": index, "url": result.get("source_url", url), "id": result.get("id"), "is_featured": is_featured}
-                    except ImagePlaceholderError as e:
-                        logger.warning(f"画像プレースホルダーにつきスキップ: {url}")
-                        return {"error": "placeholder", "index": index}
-                    except Exception as e:
-                        logger.error(f"画像アップロード失敗: {url} - {e}")
-                        # アップロード失敗時はオリジナルのCDN URLをフォールバックとして使用
-                        return {"index": index, "url": url, "id": None, "is_featured": is_featured, "fallback": True}
-
-                upload_jobs = []
-                # シーン画像
-                for i, sample_url in enumerate(scene_image_urls[:3]):
-                    upload_jobs.append((sample_url, i, False))
-                # アイキャッチ
-                eyecatch_url = None
-                if sample_pool:
-                    indices = [10, 8, 6, 4, 2]
-                    eyecatch_idx = 0
-                    for threshold in indices:
-                        if len(sample_pool) >= threshold:
-                            eyecatch_idx = threshold // 2
-                            break
-                    eyecatch_url = sample_pool[eyecatch_idx]
-                    upload_jobs.append((eyecatch_url, -1, True)) # -1 is eyecatch
-
-                with ThreadPoolExecutor(max_workers=4) as executor:
-                    futures = [executor.submit(upload_task, job[0], job[1], job[2]) for job in upload_jobs]
-                    for future in as_completed(futures):
-                        res = future.result()
-                        if "error" in res:
-                            if res["error"] == "placeholder": return "skip"
-                            continue
-                        
-                        if res["is_featured"]:
-                            featured_media_id = res["id"]
-                            logger.info(f"アイキャッチ画像アップロード完了: media_id={featured_media_id}")
-                        else:
-                            new_sample_urls[res["index"]] = res["url"]
-                            logger.info(f"サンプル画像{res['index']+1}アップロード完了")
-
-                # アイキャッチ専用画像のアップロードに失敗した場合は、
-                # 既にアップロード済みのパッケージ画像をフォールバックで利用する。
-                if not featured_media_id and package_media_id:
-                    featured_media_id = package_media_id
-                    logger.warning(
-                        f"アイキャッチ画像IDが未取得のためパッケージ画像を代替利用: media_id={featured_media_id}"
-                    )
-
-                item["sample_image_urls"] = [u for u in new_sample_urls if u is not None]
-                item["_featured_media_id"] = featured_media_id
-
-            # コンテンツレンダリング
-            site_id = "default"
-            if site_info and hasattr(site_info, "subdomain"):
-                site_id = site_info.subdomain
-            else:
-                # main site run should not fall back to dark default theme.
-                host = urlparse(self.config.wp_base_url).netloc.lower()
-                if host in {"av-kantei.com", "www.av-kantei.com"}:
-                    site_id = "main"
-
-            category_ids: list[int] = []
-            tag_ids: list[int] = []
-            related_posts: list[dict] = []
-
-            # タクソノミー準備 (dry_run時は作成しない)
-            genres_raw = item.get("genre", [])
-            genres_str = "".join(genres_raw)
-            title_str = item.get("title", "")
-
-            mapping_order = [
-                ("VR作品", ["VR", "ハイクオリティVR"]),
-                ("アニメ・2D", ["アニメ", "二次元", "CG"]),
-                ("素人・ナンパ", ["素人", "ナンパ", "投稿", "地味"]),
-                ("熟女・人妻", ["熟女", "人妻", "お姉さん", "四十路", "美魔女", "お母さん"]),
-                ("美少女・若手", ["美少女", "若手", "新人", "10代", "女子大生"]),
-                ("巨乳・爆乳", ["巨乳", "爆乳", "爆にゅう"]),
-                ("単体女優", ["単体作品"]),
-                ("企画・バラエティ", ["企画", "バラエティー", "コスプレ"]),
-            ]
-            selected_big_cat = "動画"
-            if "VR" in title_str.upper():
-                selected_big_cat = "VR作品"
-            else:
-                for big_cat, keywords in mapping_order:
-                    if any(kw in genres_str for kw in keywords):
-                        selected_big_cat = big_cat
-                        break
 
-            render_site_id = site_id
-            # Main-site breast-focused posts should use the pink visual theme.
-            if site_id in {"main", "default"} and selected_big_cat == "巨乳・爆乳":
-                render_site_id = "sd01-chichi"
+        # シーン用の画像URLを決定
+        sample_pool = item.get("sample_image_urls", [])
+        if not sample_pool:
+            logger.warning(f"サンプル画像が1枚もないためスキップします: {product_id}")
+            return "skip"
+
+        scene_image_urls = select_scene_images(sample_pool)
+
+        logger.info(f"シーン用画像: {len(scene_image_urls)}枚を選択")
+        job.sample_pool = list(sample_pool)
+        job.scene_image_urls = scene_image_urls
+        return None
 
-            if not dry_run:
-                category_ids, tag_ids = self.wp_client.prepare_taxonomies(
-                    genres=[selected_big_cat],
-                    actresses=item.get("actress", [])
+    def stage_generate(self, job: PostJob) -> str | None:
+        """
+        AI生成 (site_info を渡す)
+        validator があれば生成直後に検品し、不合格（JSONとして読めない応答を含む）なら max_regenerations 回まで再生成する。
+        それでも不合格なら画像のダウンロード/アップロードに進まずに失敗として記録する。
+        """
+        attempts = 1 + (self.max_regenerations if self.validator else 0)
+        for attempt in range(1, attempts + 1):
+            # 再生成時はキャッシュ済みの（不合格だった）応答を使わない
+            try:
+                ai_response = self.llm_client.generate(
+                    item=job.item,
+                    sample_image_urls=job.scene_image_urls,
+                    site_info=job.site_info,
+                    use_cache=attempt == 1,
                 )
+            except PregeneratedArticleMissing as e:
+                # 事前生成のみモード: 生成せずに見送る（次回の事前生成で対象になるよう確保を解除）
+                logger.info(f"[{job.idx}/{job.total}] {e}")
+                self.dedupe_store.release(job.product_id)
+                return "skip"
+            except MalformedResponseError as e:
+                # JSONとして読めない応答は記事にせず、検品不合格と同じく再生成/失敗にする
+                errors = [str(e)]
             else:
-                # dry_runでは作成せず既存タグのみ参照
-                for actress in item.get("actress", []) or []:
-                    tag_id = self.wp_client.get_tag_id(actress)
-                    if tag_id:
-                        tag_ids.append(tag_id)
+                sys.stdout.flush()
+                logger.info(f"AI応答取得完了: title={ai_response.get('title', '')[:30]}...")
+                if self.validator is None:
+                    break
+                result = self.validator.validate_ai_response(ai_response)
+                if result.is_valid:
+                    break
+                errors = result.errors
+            if attempt < attempts:
+                logger.warning(f"[{job.idx}/{job.total}] AI応答が検品不合格のため再生成します ({attempt}/{attempts - 1}): {job.product_id}")
+                continue
+            message = f"AI応答の検品不合格: {'; '.join(errors)}"
+            logger.warning(f"[{job.idx}/{job.total}] {message} ({job.product_id})")
+            self.dedupe_store.record_failure(job.product_id, message)
+            return "failure"
 
-            # related posts scoring
-            try:
-                site_decor = self.renderer._get_site_decor(render_site_id)
-                priority = site_decor.get("related", {}).get("priority")
-                related_posts = self.wp_client.find_related_posts(
-                    priority=priority,
-                    tag_ids=tag_ids,
-                    category_ids=category_ids,
-                    limit=6,
-                    exclude_fanza_id=product_id,
+        job.ai_response = ai_response
+        return None
+
+    def stage_upload(self, job: PostJob) -> str | None:
+        """画像アップロード"""
+        item = job.item
+        scene_image_urls = job.scene_image_urls
+        sample_pool = job.sample_pool
+        featured_media_id = None
+        package_media_id = None
+        use_cdn_images = os.environ.get("USE_CDN_IMAGES", "").lower() == "true"
+
+        if use_cdn_images:
+            logger.info("USE_CDN_IMAGES=true: 画像アップロードをスキップしてCDN URLを直接使用")
+            # パッケージ画像はそのまま (FANZA CDN URL)
+            # シーン画像もそのまま使用
+            item["sample_image_urls"] = scene_image_urls[:3]
+            # アイキャッチ欠損防止のため、最低1枚だけはWPメディアにアップロードしてfeatured_mediaを確保する。
+            if not job.dry_run and item.get("package_image_url"):
+                try:
+                    img_bytes, filename, mime_type = self.image_tools.download_to_bytes(item["package_image_url"])
+                    result = self.wp_client.upload_media(file_bytes=img_bytes, filename=filename, mime_type=mime_type)
+                    featured_media_id = result.get("id")
+                    logger.info(f"USE_CDN_IMAGES時のアイキャッチ確保アップロード完了: media_id={featured_media_id}")
+                except ImagePlaceholderError as e:
+                    logger.warning(f"アイキャッチ用画像が未準備のためスキップ: {e}")
+                    return "skip"
+                except Exception as e:
+                    logger.error(f"USE_CDN_IMAGES時のアイキャッチ確保アップロード失敗: {e}")
+            item["_featured_media_id"] = featured_media_id
+        elif not job.dry_run:
+            if item.get("package_image_url"):
+                try:
+                    img_bytes, filename, mime_type = self.image_tools.download_to_bytes(item["package_image_url"])
+                    result = self.wp_client.upload_media(file_bytes=img_bytes, filename=filename, mime_type=mime_type)
+                    item["package_image_url"] = result.get("source_url", item["package_image_url"])
+                    package_media_id = result.get("id")
+                    logger.info(f"パッケージ画像アップロード完了: {item['package_image_url']}")
+                except ImagePlaceholderError as e:
+                    logger.warning(f"画像がまだ準備されていません。スキップ: {e}")
+                    return "skip"
+                except Exception as e:
+                    logger.warning(f"パッケージ画像アップロード失敗。CDN画像で継続します: {e}")
+
+            # 画像アップロードの並列化
+            new_sample_urls = [None] * len(scene_image_urls[:3])
+
+            def upload_task(url, index, is_featured=False):
+                try:
+                    img_bytes, filename, mime_type = self.image_tools.download_to_bytes(url)
+                    result = self.wp_client.upload_media(file_bytes=img_bytes, filename=filename, mime_type=mime_type)
+                    return {"index": index, "url": result.get("source_url", url), "id": result.get("id"), "is_featured": is_featured}
+                except ImagePlaceholderError as e:
+                    logger.warning(f"画像プレースホルダーにつきスキップ: {url}")
+                    return {"error": "placeholder", "index": index}
+                except Exception as e:
+                    logger.error(f"画像アップロード失敗: {url} - {e}")
+                    # アップロード失敗時はオリジナルのCDN URLをフォールバックとして使用
+                    return {"index": index, "url": url, "id": None, "is_featured": is_featured, "fallback": True}
+
+            upload_jobs = []
+            # シーン画像
+            for i, sample_url in enumerate(scene_image_urls[:3]):
+                upload_jobs.append((sample_url, i, False))
+            # アイキャッチ
+            eyecatch_url = None
+            if sample_pool:
+                indices = [10, 8, 6, 4, 2]
+                eyecatch_idx = 0
+                for threshold in indices:
+                    if len(sample_pool) >= threshold:
+                        eyecatch_idx = threshold // 2
+                        break
+                eyecatch_url = sample_pool[eyecatch_idx]
+                upload_jobs.append((eyecatch_url, -1, True)) # -1 is eyecatch
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(upload_task, upload_job[0], upload_job[1], upload_job[2]) for upload_job in upload_jobs]
+                for future in as_completed(futures):
+                    res = future.result()
+                    if "error" in res:
+                        if res["error"] == "placeholder": return "skip"
+                        continue
+
+                    if res["is_featured"]:
+                        featured_media_id = res["id"]
+                        logger.info(f"アイキャッチ画像アップロード完了: media_id={featured_media_id}")
+                    else:
+                        new_sample_urls[res["index"]] = res["url"]
+                        logger.info(f"サンプル画像{res['index']+1}アップロード完了")
+
+            # アイキャッチ専用画像のアップロードに失敗した場合は、
+            # 既にアップロード済みのパッケージ画像をフォールバックで利用する。
+            if not featured_media_id and package_media_id:
+                featured_media_id = package_media_id
+                logger.warning(
+                    f"アイキャッチ画像IDが未取得のためパッケージ画像を代替利用: media_id={featured_media_id}"
                 )
-            except Exception as e:
-                logger.warning(f"related posts fetch failed: {e}")
-            
-            content_html = self.renderer.render_post_content(
-                item,
-                ai_response,
-                site_id=render_site_id,
-                related_posts=related_posts,
+
+            item["sample_image_urls"] = [u for u in new_sample_urls if u is not None]
+            item["_featured_media_id"] = featured_media_id
+        return None
+
+    def stage_taxonomy(self, job: PostJob) -> str | None:
+        """カテゴリ/タグの準備と関連記事の取得"""
+        item = job.item
+        site_info = job.site_info
+
+        # コンテンツレンダリング
+        site_id = "default"
+        if site_info and hasattr(site_info, "subdomain"):
+            site_id = site_info.subdomain
+        else:
+            # main site run should not fall back to dark default theme.
+            host = urlparse(self.config.wp_base_url).netloc.lower()
+            if host in {"av-kantei.com", "www.av-kantei.com"}:
+                site_id = "main"
+
+        category_ids: list[int] = []
+        tag_ids: list[int] = []
+        related_posts: list[dict] = []
+
+        # タクソノミー準備 (dry_run時は作成しない)
+        selected_big_cat = classify_big_category(item.get("title", ""), item.get("genre", []))
+
+        render_site_id = site_id
+        # Main-site breast-focused posts should use the pink visual theme.
+        if site_id in {"main", "default"} and selected_big_cat == "巨乳・爆乳":
+            render_site_id = "sd01-chichi"
+
+        if not job.dry_run:
+            category_ids, tag_ids = self.wp_client.prepare_taxonomies(
+                genres=[selected_big_cat],
+                actresses=item.get("actress", [])
             )
+        else:
+            # dry_runでは作成せず既存タグのみ参照
+            for actress in item.get("actress", []) or []:
+                tag_id = self.wp_client.get_tag_id(actress)
+                if tag_id:
+                    tag_ids.append(tag_id)
 
-            if dry_run:
-                logger.info("【ドライラン】WP投稿をスキップ")
-                
-                # プレビュー保存
-                try:
-                    preview_path = self.config.base_dir / f"preview_{site_id}.html"
-                    # プレビュー用にメタタグを追加した完全なHTMLにする
-                    full_html = f"""<!DOCTYPE html>
+        # related posts scoring
+        try:
+            site_decor = self.renderer._get_site_decor(render_site_id)
+            priority = site_decor.get("related", {}).get("priority")
+            related_posts = self.wp_client.find_related_posts(
+                priority=priority,
+                tag_ids=tag_ids,
+                category_ids=category_ids,
+                limit=6,
+                exclude_fanza_id=job.product_id,
+            )
+        except Exception as e:
+            logger.warning(f"related posts fetch failed: {e}")
+
+        job.site_id = site_id
+        job.render_site_id = render_site_id
+        job.selected_big_cat = selected_big_cat
+        job.category_ids = category_ids
+        job.tag_ids = tag_ids
+        job.related_posts = related_posts
+        return None
+
+    def stage_render(self, job: PostJob) -> str | None:
+        """記事HTMLのレンダリング（ドライラン時はプレビュー保存で完了）"""
+        content_html = self.renderer.render_post_content(
+            job.item,
+            job.ai_response,
+            site_id=job.render_site_id,
+            related_posts=job.related_posts,
+        )
+        job.content_html = content_html
+
+        if job.dry_run:
+            site_id = job.site_id
+            logger.info("【ドライラン】WP投稿をスキップ")
+
+            # プレビュー保存
+            try:
+                preview_path = self.config.base_dir / f"preview_{site_id}.html"
+                # プレビュー用にメタタグを追加した完全なHTMLにする
+                full_html = f"""<!DOCTYPE html>
 <html lang="ja">
 <head>
 <meta charset="UTF-8">
@@ -286,40 +395,42 @@ body {{ max-width: 800px; margin: 0 auto; padding: 20px; font-family: sans-serif
 {content_html}
 </body>
 </html>"""
-                    preview_path.write_text(full_html, encoding="utf-8")
-                    logger.info(f"【ドライラン】プレビューHTMLを保存しました: {preview_path}")
-                except Exception as e:
-                    logger.warning(f"プレビュー保存失敗: {e}")
-
-                self.dedupe_store.record_success(product_id, wp_post_id=None, status="dry_run")
-                return "success"
-
-            # アイキャッチ無し投稿は避ける。取得できなかった場合は投稿を中断する。
-            if require_featured_media and not item.get("_featured_media_id"):
-                raise RuntimeError(f"featured_media未設定のため投稿中断: product_id={product_id}")
-            
-            # WordPress投稿
-            actresses = item.get("actress", [])
-            if actresses:
-                custom_slug = f"{actresses[0].replace(' ', '').replace('/', '-')}-{product_id}"
-            else:
-                custom_slug = f"video-{product_id}"
-                
-            post_id = self.wp_client.post_draft(
-                title=item["title"], 
-                content=content_html,
-                excerpt=ai_response.get("short_description", ""),
-                slug=custom_slug,
-                featured_media=item.get("_featured_media_id"),
-                categories=category_ids,
-                tags=tag_ids,
-                fanza_product_id=product_id
-            )
-            
-            self.dedupe_store.record_success(product_id, wp_post_id=post_id, status="published")
+                preview_path.write_text(full_html, encoding="utf-8")
+                logger.info(f"【ドライラン】プレビューHTMLを保存しました: {preview_path}")
+            except Exception as e:
+                logger.warning(f"プレビュー保存失敗: {e}")
+
+            self.dedupe_store.record_success(job.product_id, wp_post_id=None, status="dry_run")
             return "success"
-                
-        except Exception as e:
-            logger.exception(f"[{idx}/{total}] 処理失敗: {e}")
-            self.dedupe_store.record_failure(product_id, str(e))
-            return "failure"
+        return None
+
+    def stage_post(self, job: PostJob) -> str | None:
+        """WordPressへ投稿"""
+        item = job.item
+        product_id = job.product_id
+        require_featured_media = os.environ.get("REQUIRE_FEATURED_MEDIA", "false").lower() == "true"
+
+        # アイキャッチ無し投稿は避ける。取得できなかった場合は投稿を中断する。
+        if require_featured_media and not item.get("_featured_media_id"):
+            raise RuntimeError(f"featured_media未設定のため投稿中断: product_id={product_id}")
+
+        # WordPress投稿
+        actresses = item.get("actress", [])
+        if actresses:
+            custom_slug = f"{actresses[0].replace(' ', '').replace('/', '-')}-{product_id}"
+        else:
+            custom_slug = f"video-{product_id}"
+
+        post_id = self.wp_client.post_draft(
+            title=item["title"],
+            content=job.content_html,
+            excerpt=job.ai_response.get("short_description", ""),
+            slug=custom_slug,
+            featured_media=item.get("_featured_media_id"),
+            categories=job.category_ids,
+            tags=job.tag_ids,
+            fanza_product_id=product_id
+        )
+
+        self.dedupe_store.record_success(product_id, wp_post_id=post_id, status="published")
+        return "success"
@@ -0,0 +1,132 @@
+"""
+サイトルーティング - 共通の候補ストリームを各サイトのキーワード/ジャンルで採点し、サイト別キューへ振り分ける
+
+全サイトのキーワードを1本の正規表現にまとめて事前コンパイルし、商品1件あたり
+ジャンル文字列とタイトルをそれぞれ1回走査するだけで全サイトのスコアを求める。
+"""
+import logging
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SiteProfile:
+    """ルーティング対象サイト"""
+    subdomain: str
+    keywords: list[str]
+    # SiteRouter(legacy) 由来の補助キーワード（スコアは本来のキーワードより低い）
+    genre_hints: list[str] = field(default_factory=list)
+
+
+@dataclass
+class RouteMatch:
+    """1サイトに対する採点結果"""
+    subdomain: str
+    score: float
+    matched: list[str]
+
+
+class ProductRouter:
+    """商品を各サイトのキーワード/ジャンルで採点する（事前コンパイル済みマッチャ）"""
+
+    # 一致した場所と種類ごとの重み（ジャンル一致 > タイトル一致、サイトキーワード > 補助キーワード）
+    GENRE_WEIGHT = 3.0
+    TITLE_WEIGHT = 1.0
+    HINT_FACTOR = 0.5
+
+    def __init__(self, profiles: list[SiteProfile]):
+        if not profiles:
+            raise ValueError("profilesを1つ以上指定してください")
+        self.profiles = profiles
+        self.order = {p.subdomain: i for i, p in enumerate(profiles)}
+
+        # キーワード -> {subdomain: 倍率}
+        weights: dict[str, dict[str, float]] = defaultdict(dict)
+        for profile in profiles:
+            for kw in profile.genre_hints:
+                if kw:
+                    weights[kw.lower()][profile.subdomain] = self.HINT_FACTOR
+            for kw in profile.keywords:
+                if kw:
+                    weights[kw.lower()][profile.subdomain] = 1.0
+
+        # 先読み (?=...) で全位置から照合し、重なり合うキーワードも取りこぼさない。
+        # 同じ位置では最長のキーワードだけが返るため、その先頭に一致する短いキーワードも一緒に数える
+        # （例: 「巨乳首」に一致したら「巨乳」のサイトにも加点）
+        keywords = sorted(weights, key=len, reverse=True)
+        self._keyword_sites: dict[str, list[tuple[str, dict[str, float]]]] = {
+            kw: [(other, weights[other]) for other in keywords if kw.startswith(other)]
+            for kw in keywords
+        }
+        self._pattern = re.compile("(?=(" + "|".join(re.escape(kw) for kw in keywords) + "))", re.IGNORECASE)
+        logger.info(f"ProductRouter初期化: {len(profiles)}サイト, キーワード{len(keywords)}件")
+
+    @classmethod
+    def from_site_configs(cls, sites: Iterable[Any], legacy_sites: Iterable[Any] = ()) -> "ProductRouter":
+        """configure_sites.SITES と legacy SiteRouter の設定から作成（同じsubdomainのみ補助キーワードとして統合）"""
+        hints = {s.subdomain: list(s.keywords) for s in legacy_sites}
+        profiles = [
+            SiteProfile(
+                subdomain=s.subdomain,
+                keywords=list(s.keywords),
+                genre_hints=[kw for kw in hints.get(s.subdomain, []) if kw not in s.keywords],
+            )
+            for s in sites
+        ]
+        return cls(profiles)
+
+    def _scan(self, text: str, weight: float, scores: dict[str, float], matched: dict[str, set[str]]) -> None:
+        seen: set[str] = set()
+        for m in self._pattern.finditer(text):
+            for kw, sites in self._keyword_sites.get(m.group(1).lower(), ()):
+                if kw in seen:
+                    continue
+                seen.add(kw)
+                for site, factor in sites.items():
+                    scores[site] += weight * factor
+                    matched[site].add(kw)
+
+    def score(self, item: dict) -> list[RouteMatch]:
+        """スコアの高い順（同点はサイト定義順）に一致したサイトを返す"""
+        scores: dict[str, float] = defaultdict(float)
+        matched: dict[str, set[str]] = defaultdict(set)
+        # ジャンル名をまたいだ誤一致を避けるため改行で区切る
+        self._scan("\n".join(item.get("genre") or []), self.GENRE_WEIGHT, scores, matched)
+        self._scan(item.get("title") or "", self.TITLE_WEIGHT, scores, matched)
+        results = [RouteMatch(site, score, sorted(matched[site])) for site, score in scores.items() if score > 0]
+        results.sort(key=lambda r: (-r.score, self.order[r.subdomain]))
+        return results
+
+    def distribute(
+        self,
+        items: Iterable[dict],
+        per_site: int,
+        max_sites_per_item: int = 1,
+        exclude: dict[str, set[str]] | None = None,
+    ) -> dict[str, list[dict]]:
+        """
+        候補をサイト別キューへ振り分ける。
+        各商品はスコア上位のサイトから空きのあるところへ最大 max_sites_per_item 件まで割り当てる。
+        exclude: {subdomain: 投稿済み等で除外する商品IDの集合}（items の反復中に追記してよい）
+        """
+        queues: dict[str, list[dict]] = {p.subdomain: [] for p in self.profiles}
+        if exclude is None:
+            exclude = {}
+        for item in items:
+            pid = str(item.get("product_id", "")).lower()
+            assigned = 0
+            for match in self.score(item):
+                if assigned >= max_sites_per_item:
+                    break
+                queue = queues[match.subdomain]
+                if len(queue) >= per_site or pid in exclude.get(match.subdomain, ()):
+                    continue
+                queue.append(item)
+                assigned += 1
+            if all(len(q) >= per_site for q in queues.values()):
+                break
+        return queues
@@ -0,0 +1,30 @@
+from src.core.categories import BIG_CATEGORY_RULES, DEFAULT_BIG_CATEGORY, classify_big_category
+
+
+def _baseline(title, genres):
+    if "VR" in (title or "").upper():
+        return "VR作品"
+    joined = "".join(genres)
+    for name, keywords in BIG_CATEGORY_RULES:
+        if any(kw in joined for kw in keywords):
+            return name
+    return DEFAULT_BIG_CATEGORY
+
+
+def test_overlapping_keywords():
+    # 「新人」が「人妻」の「人」を消費しても、優先度の高い熟女・人妻になる
+    assert classify_big_category("", ["新人妻"]) == "熟女・人妻"
+
+
+def test_matches_substring_rules():
+    cases = [
+        ("", ["巨乳", "人妻"]),
+        ("", ["単体作品", "美少女"]),
+        ("素人ナンパ", ["ドラマ"]),
+        ("作品 vr", []),
+        ("", ["ハイクオリティVR"]),
+        ("", ["爆にゅう"]),
+        ("", []),
+    ]
+    for title, genres in cases:
+        assert classify_big_category(title, genres) == _baseline(title, genres)